@@ -0,0 +1,122 @@
+"""
+Stage breakdown of the compilation of a large generated recording.
+
+Times the tokenizer alone, instruction generation (tokenizer + command builders), every
+post-processing pass and the full Compiler.compile_from_src, to show where compile time goes.
+
+With --baseline-src, instruction generation and compile_from_src are also timed on the same
+script with the compiler of another checkout (its src directory, e.g. from
+`git worktree add ../baseline <commit>`), in a separate process, and the speedups are printed.
+Exits with status 1 if instruction generation is not at least --min-speedup times faster.
+
+Usage:
+    python benchmarks/bench_compiler_frontend.py [--events N] [--repeat N] [--baseline-src DIR] [--min-speedup R]
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+import subprocess
+import time
+from pathlib import Path
+from typing import Callable, Any, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app_logic.compiler.compiler import Compiler     # noqa: E402
+from app_logic.compiler.compiler_config import get_compiler_cfg   # noqa: E402
+from app_logic.compiler.tokenizer import tokenize   # noqa: E402
+
+import script_generators as gen     # noqa: E402
+
+
+def _best_time(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+# run by measure_baseline() with only the other checkout on sys.path, reads the script on stdin.
+# Only uses what every version of the compiler has.
+_BASELINE_PROGRAM = """
+import sys, json, time, logging
+from app_logic.compiler.compiler import Compiler
+from app_logic.compiler.compiler_config import get_compiler_cfg
+
+logging.getLogger("Compiler").setLevel(logging.WARNING)
+src, repeat = sys.stdin.read(), int(sys.argv[1])
+lines = src.splitlines()
+stages = {
+    "generate_instructions": lambda: Compiler(get_compiler_cfg(False)).generate_instructions(lines),
+    "compile_from_src": lambda: Compiler(get_compiler_cfg(False)).compile_from_src(src),
+}
+best = {}
+for stage, fn in stages.items():
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        assert fn() is not None, "the baseline does not compile the script"
+        best[stage] = min(best.get(stage, float("inf")), time.perf_counter() - t0)
+print(json.dumps(best))
+"""
+
+
+def measure_baseline(baseline_src: Path, src: str, repeat: int) -> Dict[str, float]:
+    """Times generate_instructions and compile_from_src of src with the compiler of another
+    checkout, in a separate process: both versions can not be imported in the same one"""
+    out = subprocess.run(
+        [sys.executable, "-c", _BASELINE_PROGRAM, str(repeat)], input=src, cwd=baseline_src,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (str(baseline_src.resolve()), os.environ.get("PYTHONPATH"))))),
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=166_000, help="recorded events, 3 lines each")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline-src", type=Path, help="src directory of the checkout to compare with")
+    parser.add_argument("--min-speedup", type=float, default=1.0, help="of instruction generation over the baseline")
+    args = parser.parse_args()
+
+    logging.getLogger("Compiler").setLevel(logging.WARNING)
+
+    src = gen.linear_recording(args.events)
+    lines = src.splitlines()
+    stages = {
+        "tokenize": _best_time(lambda: sum(1 for _ in tokenize(lines)), args.repeat),
+        "generate_instructions": _best_time(lambda: Compiler(get_compiler_cfg(False)).generate_instructions(lines), args.repeat),
+    }
+
+    compiler = Compiler(get_compiler_cfg(False))
+    instructions = compiler.generate_instructions(lines)
+    assert instructions is not None
+    for post_process_fn in compiler.post_process_fns:
+        t0 = time.perf_counter()
+        instructions = list(post_process_fn(compiler.compilation_ctx, instructions))
+        stages[post_process_fn.__name__] = time.perf_counter() - t0
+
+    stages["compile_from_src"] = _best_time(lambda: Compiler(get_compiler_cfg(False)).compile_from_src(src), args.repeat)
+
+    print(f"{len(lines)} lines, {len(instructions)} instructions")
+    for stage, elapsed in stages.items():
+        print(f"{stage:<24} {elapsed:8.3f} s  {len(lines) / elapsed:>12.0f} lines/s")
+
+    if args.baseline_src:
+        baseline = measure_baseline(args.baseline_src, src, args.repeat)
+        print(f"baseline: {args.baseline_src}")
+        for stage, elapsed in baseline.items():
+            print(f"{stage:<24} {elapsed:8.3f} s  {len(lines) / elapsed:>12.0f} lines/s  {elapsed / stages[stage]:5.1f}x faster now")
+        speedup = baseline["generate_instructions"] / stages["generate_instructions"]
+        if speedup < args.min_speedup:
+            print(f"FAIL: instruction generation is {speedup:.1f}x faster than the baseline, {args.min_speedup}x wanted")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Memory benchmark of the movement history.
+
+Runs a script that performs a large number of `move` instructions (and contains a `goback`,
+so history tracking is enabled) on the null input backend, while a background thread samples
+the process RSS. With the ring buffer history the RSS must stay flat once the buffer is full.
+
+Usage:
+    python benchmarks/bench_history_memory.py [--moves N] [--depth D] [--tolerance-mb MB]
+
+Exits with status 1 if the RSS grew more than the tolerance after the warm-up.
+"""
+
+import sys
+import argparse
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app_logic.compiler.compiler import Compiler     # noqa: E402
+from app_logic.compiler.compiler_config import get_compiler_cfg   # noqa: E402
+from app_logic.instruction_set import Wait     # noqa: E402
+from app_logic.input_backends.backend import NullBackend   # noqa: E402
+from app_logic.virtual_machine.executor import Executor, DispatchMode   # noqa: E402
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        import psutil   # type: ignore
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        import os
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource     # peak RSS, still flat if memory does not grow
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--moves", type=int, default=10_000_000)
+    parser.add_argument("--depth", type=int, default=1000, help="movement history depth")
+    parser.add_argument("--tolerance-mb", type=float, default=2.0)
+    args = parser.parse_args()
+
+    logging.getLogger("Runtime").setLevel(logging.WARNING)
+    logging.getLogger("Compiler").setLevel(logging.WARNING)
+
+    src = f"""
+    label loop
+        move 10 20
+        move 30 40
+        jump loop {args.moves // 2}
+    end
+    goback
+    """
+    program = Compiler(get_compiler_cfg(False, args.depth)).compile_from_src(src)
+    assert program is not None
+    program = [inst for inst in program if not isinstance(inst, Wait)]   # drop the startup wait
+
+    samples: List[int] = []
+    done = threading.Event()
+
+    def sampler():
+        while not done.wait(.25):
+            samples.append(rss_bytes())
+
+    thread = threading.Thread(target=sampler, daemon=True)
+    start_rss = rss_bytes()
+    start = time.perf_counter()
+    thread.start()
+
+    Executor().set_input_backend(NullBackend()).set_dispatch_mode(DispatchMode.THREADED).load_instructions(program).execute()
+
+    done.set()
+    thread.join()
+    elapsed = time.perf_counter() - start
+    samples.append(rss_bytes())
+
+    warm = samples[len(samples) // 10:] or samples     # skip the first 10% (buffers filling up)
+    growth_mb = (max(warm) - warm[0]) / 2**20
+    print(f"moves:            {args.moves}")
+    print(f"elapsed:          {elapsed:.1f} s ({args.moves / elapsed:.0f} moves/s)")
+    print(f"rss at start:     {start_rss / 2**20:.1f} MB")
+    print(f"rss after warmup: {warm[0] / 2**20:.1f} MB")
+    print(f"rss peak:         {max(samples) / 2**20:.1f} MB")
+    print(f"rss at end:       {samples[-1] / 2**20:.1f} MB")
+    print(f"growth:           {growth_mb:.2f} MB (tolerance {args.tolerance_mb} MB)")
+
+    if growth_mb > args.tolerance_mb:
+        print("FAIL: memory grew during the run")
+        sys.exit(1)
+    print("OK: flat memory")
+
+
+if __name__ == "__main__":
+    main()
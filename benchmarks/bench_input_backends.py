@@ -0,0 +1,82 @@
+"""
+Latency benchmark of the input backends (app_logic/input_backends).
+
+Measures the per-call latency of position(), move_to() and move_rel() for every backend
+available on this machine, and optionally click(). The cursor is moved around a small
+square near its starting point, and put back at the end.
+
+Usage:
+    python benchmarks/bench_input_backends.py [--iterations N] [--backend NAME ...] [--clicks]
+
+WARNING: --clicks really clicks where the cursor is, only use it on an empty area of the screen.
+"""
+
+import sys
+import argparse
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app_logic.input_backends.backend import (   # noqa: E402
+    InputBackend, MouseButton, BackendUnavailableError, BACKEND_FACTORIES, get_backend
+)
+
+
+def _measure(fn: Callable[[int], None], iterations: int) -> Dict[str, float]:
+    """Calls fn(i) iterations times, returns latency stats in microseconds"""
+    samples: List[float] = []
+    for i in range(iterations):
+        t0 = time.perf_counter_ns()
+        fn(i)
+        samples.append((time.perf_counter_ns() - t0) / 1000)
+
+    samples.sort()
+    return {
+        "mean_us": statistics.fmean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * .99))],
+        "ops_per_s": 1e6 / statistics.fmean(samples) if samples else 0,
+    }
+
+
+def bench_backend(backend: InputBackend, iterations: int, clicks: bool) -> Dict[str, Dict[str, float]]:
+    x0, y0 = backend.position()
+    square = [(x0, y0), (x0 + 20, y0), (x0 + 20, y0 + 20), (x0, y0 + 20)]
+    rel = [(20, 0), (0, 20), (-20, 0), (0, -20)]
+
+    results = {
+        "position": _measure(lambda i: backend.position(), iterations),
+        "move_to": _measure(lambda i: backend.move_to(*square[i % 4]), iterations),
+        "move_rel": _measure(lambda i: backend.move_rel(*rel[i % 4]), iterations),
+    }
+    if clicks:
+        results["click"] = _measure(lambda i: backend.click(MouseButton.LEFT), iterations)
+
+    backend.move_to(x0, y0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--backend", action="append", choices=list(BACKEND_FACTORIES), help="backend to benchmark (default: all)")
+    parser.add_argument("--clicks", action="store_true", help="also benchmark left clicks")
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'operation':<10} {'mean us':>10} {'p50 us':>10} {'p99 us':>10} {'ops/s':>10}")
+    for name in args.backend or list(BACKEND_FACTORIES):
+        try:
+            backend = get_backend(name)
+        except BackendUnavailableError as e:
+            print(f"{name:<10} skipped: {e}")
+            continue
+
+        for op, stats in bench_backend(backend, args.iterations, args.clicks).items():
+            print(f"{name:<10} {op:<10} {stats['mean_us']:>10.1f} {stats['p50_us']:>10.1f} {stats['p99_us']:>10.1f} {stats['ops_per_s']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
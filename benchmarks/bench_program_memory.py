@@ -0,0 +1,106 @@
+"""
+Memory benchmark of the loaded program: a tuple of instruction objects (what decode() builds)
+against a CompactProgram (decode(data, compact=True)), which keeps the columns of the binary
+format and only builds instructions when they are executed.
+
+The program is a long linear recording (wait, move, click per event, see script_generators.py),
+like the ones that make the runner grow to hundreds of MB. For both representations it reports
+the memory held once the program is loaded in an executor, the peak while running it on the null
+backend and a virtual clock, and the load and run times. Memory is measured with tracemalloc,
+times in a separate run without it.
+
+Usage:
+    python benchmarks/bench_program_memory.py [--events N] [--min-ratio R]
+
+Exits with status 1 if the loaded objects do not take at least R times the memory of the
+compact program.
+"""
+
+import sys
+import argparse
+import gc
+import time
+import logging
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app_logic.compiler.program_format import CompiledProgram, encode, decode   # noqa: E402
+from app_logic.instruction_set import SetupAndStart     # noqa: E402
+from app_logic.input_backends.backend import NullBackend   # noqa: E402
+from app_logic.virtual_machine.executor import Executor, DispatchMode   # noqa: E402
+from app_logic.virtual_machine.scheduler import VirtualScheduler     # noqa: E402
+
+import script_generators as gen     # noqa: E402
+
+MB = 2**20
+
+
+def new_executor() -> Executor:
+    return Executor().set_input_backend(NullBackend()).set_scheduler(VirtualScheduler()).set_dispatch_mode(DispatchMode.THREADED)
+
+
+def measure_memory(data: bytes, compact: bool) -> Tuple[int, int]:
+    """Bytes held by the loaded program, and peak bytes allocated while running it"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        executor = new_executor().load_instructions(decode(data, compact).instructions)
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        executor.execute()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return held, peak
+
+
+def measure_time(data: bytes, compact: bool) -> Tuple[float, float, int]:
+    """Seconds to load the program, seconds to run it and the number of executed instructions"""
+    gc.collect()
+    t0 = time.perf_counter()
+    executor = new_executor().load_instructions(decode(data, compact).instructions)
+    t1 = time.perf_counter()
+    executor.execute()
+    return t1 - t0, time.perf_counter() - t1, executor.executed_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000, help="recorded events, 3 instructions each")
+    parser.add_argument("--min-ratio", type=float, default=5.0)
+    args = parser.parse_args()
+
+    logging.getLogger("Runtime").setLevel(logging.WARNING)
+
+    instructions = [SetupAndStart(track_history=False)] + gen.recorded_instructions(args.events)
+    data = encode(CompiledProgram(instructions, list(range(len(instructions))), {}))
+    del instructions
+
+    results: Dict[str, Tuple[int, int, float, float, int]] = {}
+    for name, compact in (("objects", False), ("compact", True)):
+        held, peak = measure_memory(data, compact)
+        load_s, run_s, executed = measure_time(data, compact)
+        results[name] = (held, peak, load_s, run_s, executed)
+
+    count = results["objects"][4]
+    print(f"instructions:     {count} ({len(data) / MB:.1f} MB encoded)")
+    print(f"{'':18}{'held':>10}{'per inst':>10}{'run peak':>10}{'load':>9}{'run':>16}")
+    for name, (held, peak, load_s, run_s, executed) in results.items():
+        assert executed == count, f"{name} executed {executed} instructions instead of {count}"
+        print(f"{name + ':':18}{held / MB:>7.1f} MB{held / count:>8.0f} B{peak / MB:>7.1f} MB"
+              f"{load_s * 1e3:>6.0f} ms{count / run_s:>10.0f} inst/s")
+
+    ratio = results["objects"][0] / results["compact"][0]
+    print(f"ratio:            {ratio:.1f}x less memory held (minimum {args.min_ratio}x)")
+    if ratio < args.min_ratio:
+        print("FAIL: the compact program does not save enough memory")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
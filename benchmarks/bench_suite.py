@@ -0,0 +1,246 @@
+"""
+Throughput benchmark suite of the compiler, executor, decompiler and editor highlighter.
+
+Scripts are generated synthetically (see script_generators.py):
+    - linear:     long linear recordings (move / click / wait)
+    - loops:      deep nested `jump N` loops
+    - vars:       var-heavy arithmetic in a loop
+    - exprs:      multi-operation var expressions in a loop
+    - recursion:  call / return recursion close to MAX_STACK_SIZE
+
+Measured metrics:
+    - compile.<script>              Compiler.compile_from_src, source lines / s
+    - recompile.<script>            IncrementalCompiler.compile_from_src after inserting a line at the
+                                    top of an already compiled script, source lines / s
+    - load.<script>                 program_format.decode of the compiled script (what a cached
+                                    run does instead of compiling), source lines / s
+    - execute.<script>.<loop>       Executor.execute on the null backend and a virtual clock
+                                    (waits cost nothing), instructions / s, for every dispatch loop
+                                    (the compiled one includes the translation of the program)
+    - decompile.linear              Decompiler.decompile_to_src, instructions / s
+    - highlight.block               ScriptHighlighter.highlightBlock, us per block (needs PyQt6)
+
+Every metric is the best of --repeat runs. Results are printed and written to --output as JSON.
+With --baseline, results are compared to a previous output file, and the script exits with
+status 1 if any metric regressed more than its threshold in thresholds.json.
+
+Usage:
+    python benchmarks/bench_suite.py [--quick] [--repeat N] [--output FILE] [--baseline FILE] [--only PREFIX ...]
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+import platform
+import time
+import datetime
+import tomllib
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app_logic.compiler.compiler import Compiler, IncrementalCompiler     # noqa: E402
+from app_logic.compiler.compiler_config import get_compiler_cfg   # noqa: E402
+from app_logic.compiler.program_format import encode, decode     # noqa: E402
+from app_logic.decompiler.decompiler import Decompiler   # noqa: E402
+from app_logic.instruction_set import MAX_STACK_SIZE     # noqa: E402
+from app_logic.input_backends.backend import NullBackend   # noqa: E402
+from app_logic.virtual_machine.executor import Executor, DispatchMode   # noqa: E402
+from app_logic.virtual_machine.scheduler import VirtualScheduler     # noqa: E402
+
+import script_generators as gen     # noqa: E402
+
+THRESHOLDS_FILE = Path(__file__).resolve().parent / "thresholds.json"
+PYPROJECT_FILE = Path(__file__).resolve().parent.parent / "pyproject.toml"
+
+# name -> (full size script, quick size script)
+SCRIPTS: Dict[str, Tuple[Callable[[], str], Callable[[], str]]] = {
+    "linear": (lambda: gen.linear_recording(20_000), lambda: gen.linear_recording(2_000)),
+    "loops": (lambda: gen.nested_loops(4, 20), lambda: gen.nested_loops(3, 20)),
+    "vars": (lambda: gen.var_arithmetic(20_000), lambda: gen.var_arithmetic(2_000)),
+    "exprs": (lambda: gen.var_expressions(20_000), lambda: gen.var_expressions(2_000)),
+    "recursion": (lambda: gen.recursion(MAX_STACK_SIZE - 16, 20), lambda: gen.recursion(MAX_STACK_SIZE - 16, 2)),
+}
+
+
+class Metric:
+    def __init__(self, value: float, unit: str, higher_is_better: bool = True) -> None:
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"value": self.value, "unit": self.unit, "higher_is_better": self.higher_is_better}
+
+
+def _best_time(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    """Runs fn repeat times, returns the best time in seconds and the last result"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _compile(src: str):
+    program = Compiler(get_compiler_cfg(False)).compile_from_src(src)
+    assert program is not None, "generated script does not compile"
+    return program
+
+
+def bench_compile(src: str, repeat: int) -> Metric:
+    lines = len(src.splitlines())
+    elapsed, _ = _best_time(lambda: _compile(src), repeat)
+    return Metric(lines / elapsed, "lines/s")
+
+
+def bench_recompile(src: str, repeat: int) -> Metric:
+    compiler = IncrementalCompiler(get_compiler_cfg(False))
+    assert compiler.compile_from_src(src) is not None, "generated script does not compile"
+    best = float("inf")
+    for i in range(repeat):
+        edited = f"wait {i / 1000}\n{src}"     # a new line every time, moves all the others
+        t0 = time.perf_counter()
+        compiler.compile_from_src(edited)
+        best = min(best, time.perf_counter() - t0)
+    return Metric(len(src.splitlines()) / best, "lines/s")
+
+
+def bench_load(src: str, repeat: int) -> Metric:
+    program = Compiler(get_compiler_cfg(False)).compile_program(src)
+    assert program is not None, "generated script does not compile"
+    data = encode(program)
+    elapsed, _ = _best_time(lambda: decode(data), repeat)
+    return Metric(len(src.splitlines()) / elapsed, "lines/s")
+
+
+def bench_execute(src: str, mode: DispatchMode, repeat: int) -> Metric:
+    best = 0.0
+    for _ in range(repeat):
+        executor = Executor().set_input_backend(NullBackend()).set_scheduler(VirtualScheduler()).set_dispatch_mode(mode)
+        executor.load_instructions(_compile(src))  # fresh program, loop counters are instruction state
+        t0 = time.perf_counter()
+        executor.execute()
+        best = max(best, executor.executed_count / (time.perf_counter() - t0))
+    return Metric(best, "instructions/s")
+
+
+def bench_decompile(events: int, repeat: int) -> Metric:
+    instructions = gen.recorded_instructions(events)
+    elapsed, _ = _best_time(lambda: Decompiler().decompile_to_src(instructions), repeat)
+    return Metric(len(instructions) / elapsed, "instructions/s")
+
+
+def bench_highlight(src: str, repeat: int) -> Metric | None:
+    """Time per block of a full rehighlight of src. Returns None if PyQt6 is not available."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt6.QtWidgets import QApplication
+        from PyQt6.QtGui import QTextDocument
+        from view.gui_utils import ScriptHighlighter
+    except ImportError as e:
+        print(f"highlight benchmark skipped: {e}")
+        return None
+
+    app = QApplication.instance() or QApplication(sys.argv)     # noqa: F841 (must stay alive)
+    document = QTextDocument()
+    document.setPlainText(src)
+    highlighter = ScriptHighlighter(document)
+    elapsed, _ = _best_time(highlighter.rehighlight, repeat)
+    return Metric(elapsed / document.blockCount() * 1e6, "us/block", higher_is_better=False)
+
+
+def run_suite(quick: bool, repeat: int, only: List[str] | None) -> Dict[str, Metric]:
+    def wanted(metric: str) -> bool:
+        return not only or any(metric.startswith(prefix) for prefix in only)
+
+    scripts = {name: sizes[1 if quick else 0]() for name, sizes in SCRIPTS.items()}
+    results: Dict[str, Metric] = {}
+
+    for name, src in scripts.items():
+        if wanted(f"compile.{name}"):
+            results[f"compile.{name}"] = bench_compile(src, repeat)
+        if wanted(f"recompile.{name}"):
+            results[f"recompile.{name}"] = bench_recompile(src, repeat)
+        if wanted(f"load.{name}"):
+            results[f"load.{name}"] = bench_load(src, repeat)
+        for mode in DispatchMode:
+            if wanted(f"execute.{name}.{mode.value}"):
+                results[f"execute.{name}.{mode.value}"] = bench_execute(src, mode, repeat)
+
+    if wanted("decompile.linear"):
+        results["decompile.linear"] = bench_decompile(2_000 if quick else 20_000, repeat)
+    if wanted("highlight.block"):
+        metric = bench_highlight(scripts["linear"], repeat)
+        if metric is not None:
+            results["highlight.block"] = metric
+
+    return results
+
+
+def compare(results: Dict[str, Metric], baseline: Dict[str, Any]) -> List[str]:
+    """Returns a description of every metric that regressed past its threshold"""
+    thresholds = json.loads(THRESHOLDS_FILE.read_text()) if THRESHOLDS_FILE.exists() else {}
+    default = thresholds.get("default_max_regression", 0.2)
+    per_metric: Dict[str, float] = thresholds.get("metrics", {})
+
+    failures = []
+    for name, metric in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None or not base["value"]:
+            continue
+        change = (metric.value - base["value"]) / base["value"]
+        regression = -change if metric.higher_is_better else change
+        limit = per_metric.get(name, default)
+        if regression > limit:
+            failures.append(f"{name}: {base['value']:.1f} -> {metric.value:.1f} {metric.unit} "
+                            f"({regression:+.0%} worse, threshold {limit:.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller scripts, for a fast sanity check")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--baseline", type=Path, help="previous results to check for regressions")
+    parser.add_argument("--only", action="append", help="only run metrics starting with this prefix")
+    args = parser.parse_args()
+
+    for name in ("Compiler", "Runtime", "Decompiler"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    results = run_suite(args.quick, args.repeat, args.only)
+
+    print(f"{'metric':<32} {'value':>14} unit")
+    for name, metric in results.items():
+        print(f"{name:<32} {metric.value:>14.1f} {metric.unit}")
+
+    output = {
+        "meta": {
+            "version": tomllib.loads(PYPROJECT_FILE.read_text())["project"]["version"],
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "quick": args.quick,
+        },
+        "results": {name: metric.to_dict() for name, metric in results.items()},
+    }
+    args.output.write_text(json.dumps(output, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        failures = compare(results, json.loads(args.baseline.read_text()))
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Synthetic script generators used by the benchmarks.
+
+Every generator returns the source text of a valid script, sized by its arguments,
+so that benchmarks can scale the workload without shipping large files.
+"""
+
+import random
+import sys
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app_logic.instruction_set import (   # noqa: E402
+    Instruction, ValueRef, MouseMove, MouseLeftClick, MouseRightClick, MouseDoubleClick, Wait
+)
+
+SCREEN = (1920, 1080)
+
+
+def linear_recording(events: int, seed: int = 0) -> str:
+    """A long recording like the ones produced by the recorder: a move and a click per event,
+    with a wait in between, no control flow."""
+    rng = random.Random(seed)
+    lines = ["; Decompiled source code", ""]
+    for _ in range(events):
+        lines.append(f"wait {round(rng.uniform(0.1, 2.0), 2)}")
+        lines.append(f"move {rng.randrange(SCREEN[0])} {rng.randrange(SCREEN[1])}")
+        lines.append(rng.choice(("click left", "click left", "click right", "doubleclick")))
+    return "\n".join(lines)
+
+
+def recorded_instructions(events: int, seed: int = 0) -> List[Instruction]:
+    """The instruction list the recorder would build for linear_recording(events, seed),
+    input of the decompiler benchmark"""
+    rng = random.Random(seed)
+    instructions: List[Instruction] = []
+    for _ in range(events):
+        instructions.append(Wait(ValueRef(round(rng.uniform(0.1, 2.0), 2))))
+        instructions.append(MouseMove(ValueRef(rng.randrange(SCREEN[0])), ValueRef(rng.randrange(SCREEN[1]))))
+        instructions.append(rng.choice((MouseLeftClick, MouseLeftClick, MouseRightClick, MouseDoubleClick))())
+    return instructions
+
+
+def nested_loops(depth: int, count: int, body: int = 2) -> str:
+    """`depth` nested `jump N` loops of `count` iterations each, around `body` relative moves.
+    The innermost body runs count ** depth times."""
+    lines = [f"label loop{d}" for d in range(depth)]
+    lines += ["moverel 1 0", "moverel -1 0"] * (body // 2)
+    lines += [f"jump loop{d} {count}" for d in reversed(range(depth))]
+    return "\n".join(lines)
+
+
+def var_arithmetic(iterations: int, statements: int = 8) -> str:
+    """A loop doing `statements` var operations per iteration, reading and writing several variables"""
+    lines = ["var a = 1", "var b = 2", "var c = 0", "var acc = 0", "label loop"]
+    ops = [
+        "var c = a + b", "var acc = acc + c", "var a = b * 2", "var b = c - a",
+        "var c = acc / 3", "var a = $MOUSE_X + 1", "var b = $MOUSE_Y - 1", "var acc = acc - c",
+    ]
+    lines += [ops[i % len(ops)] for i in range(statements)]
+    lines += [f"jump loop {iterations}", "printvar acc"]
+    return "\n".join(lines)
+
+
+def var_expressions(iterations: int, statements: int = 4) -> str:
+    """A loop evaluating `statements` multi-operation expressions per iteration (integration
+    steps of a falling point), each one a single instruction"""
+    lines = ["var x = 0", "var y = 0", "var vx = 3", "var vy = -30", "var dt = 0.01", "label loop"]
+    exprs = [
+        "var vy = vy + 9.81 * dt - vy * 0.001", "var x = x + vx * dt + $MOUSE_X * 0",
+        "var y = y + vy * dt + (dt * dt) / 2", "var vx = max(-50, min(50, vx * 0.999 + abs(vy) * 0.0001))",
+    ]
+    lines += [exprs[i % len(exprs)] for i in range(statements)]
+    lines += [f"jump loop {iterations}", "printvar y"]
+    return "\n".join(lines)
+
+
+def recursion(depth: int, repeats: int = 1) -> str:
+    """Call/return recursion `depth` frames deep, repeated `repeats` times.
+    The language has no conditionals, so the recursion is bounded with a `jump N`:
+    it jumps into the recursive call depth - 1 times, then falls through to return."""
+    return "\n".join([
+        "label again",
+        "call rec",
+        f"jump again {repeats}",
+        "end",
+        "label rec",
+        f"jump recurse {depth}",
+        "return",
+        "label recurse",
+        "call rec",
+        "return",
+    ])
@@ -1,11 +1,14 @@
 from __future__ import annotations
-from typing import List, TypedDict, Dict, Callable, get_type_hints, Any, Iterable, TypeVar, TypeAlias 
-import re
+from typing import List, Tuple, TypedDict, Dict, Callable, get_type_hints, Any, Iterable, TypeVar, TypeAlias 
+from types import CodeType
 import logging
 import inspect
+import copy
 
 from app_logic.virtual_machine.executor import Instruction
 from app_logic.instruction_set import SetupAndStart
+from .program_format import CompiledProgram
+from .tokenizer import Token, TokenKind, tokenize_line, classify, join_tokens, KIND, TEXT, VALUE
 
 logger = logging.getLogger("Compiler")
 
@@ -26,36 +29,77 @@ class CompilationError(Exception):
 
 class CompCtxDict(TypedDict):
     instruction_list: List[Instruction]
+    line_table: List[int]   # source line index of every instruction (-1 for initial instructions)
 
 T = TypeVar("T", bound=CompCtxDict)
 PostProcessFunc: TypeAlias  = Callable[[T, Iterable[Instruction]], Iterable[Instruction]]
 
+
+class SubclassCache(Dict[type, bool]):
+    """Maps instruction types to whether they subclass any of `bases`, computed once per type.
+    Instructions derive from an ABC, which makes isinstance() checks slow: post-processing passes
+    run over every instruction of the program, so they look up type(inst) here instead."""
+
+    def __init__(self, *bases: type) -> None:
+        super().__init__()
+        self.bases = bases
+
+    def __missing__(self, cls: type) -> bool:
+        result = self[cls] = issubclass(cls, self.bases)
+        return result
+
+
+_BUILDER_SIGNATURES: Dict[CodeType, Tuple[List[str], Dict[str, Any]]] = {}
+
+def _builder_signature(func: Callable) -> Tuple[List[str], Dict[str, Any]]:
+    """Parameter names (compilation context excluded) and type hints of a command builder.
+    Builders are defined again every time a compiler is configured, but their code is always
+    the same, so the slow signature and annotation introspection runs once per builder."""
+    code = func.__code__
+    cached = _BUILDER_SIGNATURES.get(code)
+    if cached is None:
+        names = list(inspect.signature(func).parameters)[1:]  # skip compiler_ctx
+        cached = _BUILDER_SIGNATURES[code] = (names, get_type_hints(func))
+    return cached
+
+_NOT_CACHED = object()
+
+
 class Compiler:
     """
     A lightweight, extensible assembler-like compiler that converts lines of text into
     Instruction objects using registered command builder functions.
     Key concepts
-    - Lines are preprocessed (comments removed, whitespace normalized) and split into
-        a command and argument string.
+    - Lines are split by the tokenizer (see tokenizer.py) in a single pass into typed tokens
+        (numbers, identifiers, symbols), comments and whitespace are dropped. The first token is
+        the command, the others its arguments.
     - Registered command builders (via the `command` decorator) are responsible for
         producing Instruction instances or performing compile-time actions (e.g. registering labels).
     - A shared compilation context dictionary is provided to builders for a shared state
         state (e.g. resolved labels, variables).
     - A set of Initial instructions can be set during configuration and will be prepended to every compilation.
-    - An optional post-processing pass can transform or validate the final instruction list.
+    - Optional post-processing passes can transform or validate the final instruction list;
+        they run in the order they were registered.
 
     Main behavior
     - __init__(configure_function=None): constructs the compiler; a configure function may
         register commands and post-processors.
     - generate_instructions(lines): produce a list of Instructions from source lines;
-        logs and returns None on CompilationError.
+        logs and returns None on CompilationError. A line table mapping every instruction
+        back to its source line is kept alongside (see get_line_table()).
     - compile_from_src(src_text) / compile_from_file(filepath): helpers that run the full
-        compilation pipeline.
+        compilation pipeline. compile_program(src_text) also returns the line table and labels,
+        in a form that can be serialized (see program_format.py and program_cache.py).
     - command(command_name: str, arg_sep=...): decorator that registers a builder function.
-        The decorator auto-parses and casts string arguments to annotated types and binds
+        The decorator converts argument tokens to annotated types and binds
         defaults, passing the shared compilation context as the first parameter.
+        Types can define a `from_token(token)` classmethod to be built straight from a token
+        (like ValueRef), numbers are never parsed twice.
         arg_sep is the space character by default, but can be overwritten.
     - postprocess(func): register a post-processing function (can also be used as a decorator).
+        Every registered function is run, in registration order.
+    - IncrementalCompiler is a variant that reuses the instructions of unchanged lines
+        across compilations, to recompile long scripts after small edits.
 
     Error handling
     - generate_instructions and compile helpers return None on failure.
@@ -68,6 +112,8 @@ class Compiler:
         and return an Instruction or perform compile-time state changes.
     - The automatic argument casting uses type annotations from the builder function
         signature and will raise ValueError if casting fails.
+    - The last parameter takes the rest of the line when more arguments than parameters are given
+        (e.g. a message with spaces).
 
     Example of a command builder:
     ```
@@ -82,37 +128,35 @@ class Compiler:
     """
 
 
-    COMMENT = r";"
     command_table: Dict[str, Callable[..., Instruction]] # build methods
 
     compilation_ctx: CompCtxDict   # context dict shared across all command builders over the whole compilation (e.g. to store variables)
     instructions: List[Instruction]
+    line_table: List[int]   # parallel to instructions, source line index of each one
     initial_instructions: List[Instruction] # configurable, placed at the beginning of every program
+    is_shareable: Callable[[Instruction], bool] # configurable, see set_shareable_check()
 
-    post_process_fn: PostProcessFunc | None = None 
+    post_process_fns: List[PostProcessFunc]
 
     def __init__(self, configure_function: Callable[[Compiler], None] | None = None) -> None:
         self.found_labels = {}
         self.instructions = []
+        self.line_table = []
         self.initial_instructions = []
-        self.compilation_ctx = {"instruction_list" : self.instructions}
+        self.is_shareable = lambda inst: False
+        self.compilation_ctx = {"instruction_list" : self.instructions, "line_table" : self.line_table}
         self.command_table = {}
+        self.post_process_fns = []
 
         if configure_function:
             configure_function(self)
 
-    def _preprocess_line(self, org_line: str) -> str:
-        """ Strips tabs, indent, collapses spaces and removes comments """
-        return re.sub(r'\s+', ' ', org_line.split(self.COMMENT, 1)[0].strip()).strip()
-
-    def _build_instruction(self, line: str, line_i: int) -> Instruction | None:
-        """Takes a sanitized text line and calls respective command builder if command is registered. 
+    def _build_instruction(self, tokens: List[Token], line_i: int) -> Instruction | None:
+        """Takes the tokens of a line and calls respective command builder if command is registered. 
         Can return an instruction object, or just execute interal compile time logic (i.e. label command).
         """
 
-        words: List[str] = line.split(" ", 1)
-        command: str = words[0]     # should always be present because of sanitazing step
-        args_string: str = words[1] if len(words) > 1 else ""
+        command: str = tokens[0][TEXT]     # always present, blank lines produce no tokens
 
         # fetches command build function
         build_function = self.command_table.get(command, None)   
@@ -120,7 +164,7 @@ class Compiler:
             raise CompilationError(line_i, f'Unkwown command: "{command}"')
         
         try:
-            return build_function(args_string)    # builds the instruction object
+            return build_function(tokens[1:])    # builds the instruction object
         except CompilationError as e:
             raise CompilationError(line_i, *e.args) 
         except Exception as e:
@@ -129,38 +173,80 @@ class Compiler:
     def set_initial_instructions(self, instructions: Iterable[Instruction]):
         """These instructions will be copied and placed at the beginning of every program"""
         self.initial_instructions = list(instructions)
+
+    def set_shareable_check(self, is_shareable: Callable[[Instruction], bool]):
+        """Tells which built instructions are never modified, neither by post-processing nor while
+        running, so that a single object can be used by several programs (see IncrementalCompiler)"""
+        self.is_shareable = is_shareable
+
+    def _new_program(self) -> None:
+        """Resets the instruction list, line table and compilation context for a new compilation"""
+        # post-processing sets fields of initial instructions (e.g. register names), programs must not share them
+        self.instructions = [copy.copy(inst) for inst in self.initial_instructions]
+        self.line_table = [-1] * len(self.instructions)         # initial instructions have no source line
+        self.compilation_ctx = {"instruction_list" : self.instructions, "line_table" : self.line_table}
     
     def generate_instructions(self, lines: List[str]) -> List[Instruction] | None:
         """Given a list of raw text lines, generate a list of instructions if possible. Returns None 
         if compilation raises any errors, and logs to logger.
         """
-        
-        self.instructions = self.initial_instructions.copy()   # copies initial instructions
-        self.compilation_ctx = {"instruction_list" : self.instructions}
-
-        for line_i, raw_line in enumerate(lines):
-            line = self._preprocess_line(raw_line)
-            if line == "": continue # skips this line if it's empty
-
-            inst: None | Instruction = None
-
-            try:
-                inst = self._build_instruction(line, line_i)
-            except CompilationError as e:
-                logger.critical("(line %s) %s", e.line_i + 1, e.args[0])
-                return
-            
-            # if an instruction was actually built
-            if inst:
-                self.instructions.append(inst)
+        self._new_program()
+        built: Dict[str, Instruction | None] = {}
+        if self._build_lines(lines, built, built, {}) is None:
+            return
 
         logger.info("Compilation successfull, created %s instructions.", len(self.instructions))
         return self.instructions
 
+    def _build_lines(
+        self, lines: List[str], line_cache: Dict[str, Instruction | None], used_lines: Dict[str, Instruction | None],
+        known_words: Dict[str, Token]
+    ) -> int | None:
+        """Builds the instructions of lines into the current program. Lines found in line_cache
+        reuse its instruction, the others are tokenized and built, and the shareable ones are added
+        to line_cache (see set_shareable_check): recordings repeat the same clicks and waits over
+        and over, every distinct line goes through the command builders once.
+        Every line of the program and its instruction (None for blank lines) is added to used_lines.
+        Returns the number of lines taken from line_cache, None if a line fails to build (logged)."""
+        build_instruction, is_shareable = self._build_instruction, self.is_shareable
+        append_instruction, append_line = self.instructions.append, self.line_table.append
+        cached_line = line_cache.get
+        reused = 0
+
+        for line_i, line in enumerate(lines):
+            inst = cached_line(line, _NOT_CACHED)
+            if inst is not _NOT_CACHED:
+                reused += 1
+                used_lines[line] = inst
+            else:
+                tokens = tokenize_line(line, known_words)
+                if not tokens:
+                    used_lines[line] = line_cache[line] = None     # blank line or comment
+                    continue
+                try:
+                    inst = build_instruction(tokens, line_i)
+                except CompilationError as e:
+                    logger.critical("(line %s) %s", e.line_i + 1, e.args[0])
+                    return None     # lines built so far stay in line_cache
+                if inst is not None and is_shareable(inst):
+                    used_lines[line] = line_cache[line] = inst  # also reused by repeated lines of this script
+
+            if inst is not None:
+                append_instruction(inst)
+                append_line(line_i)
+
+        return reused
+
     def get_instructions(self) -> List[Instruction]:
         """Gets latest compiled instructions"""
         return self.instructions
 
+    def get_line_table(self) -> List[int]:
+        """Gets the source line index of every instruction of the latest compilation
+        (-1 for initial instructions). Post-processing passes that add or remove instructions
+        must keep it in sync through the compilation context."""
+        return self.compilation_ctx["line_table"]
+
     def compile_from_src(self, src_text: str) -> List[Instruction] | None:
         """Compile from source code text string. Returns a list of instruction,
         or None if compilation fails
@@ -169,17 +255,29 @@ class Compiler:
         if inst_list is None:
             return
         
-        # if a post_process_step is registered, call it
-        if self.post_process_fn:
+        # if post_process_steps are registered, call them in order
+        if self.post_process_fns:
             logger.info("Performing post-processing pass.")
+            processed: Iterable[Instruction] = inst_list.copy()
             try:
-                return list(self.post_process_fn(self.compilation_ctx, inst_list.copy()))
+                for post_process_fn in self.post_process_fns:
+                    processed = post_process_fn(self.compilation_ctx, processed)
             except CompilationError as e:
                 logger.critical("(line %s) %s", e.line_i + 1, e.args[0])
                 return
+            return list(processed)
 
         return inst_list
 
+    def compile_program(self, src_text: str) -> CompiledProgram | None:
+        """Compiles from source code text, like compile_from_src(), but also returns the line table
+        and the labels: the program can be stored in the binary format (see program_format.py).
+        Returns None if compilation fails"""
+        instructions = self.compile_from_src(src_text)
+        if instructions is None:
+            return None
+        return CompiledProgram(instructions, list(self.get_line_table()), dict(self.compilation_ctx.get("found_labels", {})))
+
     def compile_from_file(self, filepath: str) -> List[Instruction] | None:
         """Compile from source text file. Returns a list of instruction,
         or None if compilation fails
@@ -190,8 +288,8 @@ class Compiler:
         return self.compile_from_src(src_text)
 
     def postprocess(self, func: PostProcessFunc) -> PostProcessFunc:
-        """Decorator to bind a post_process_function. Can also be called directly"""
-        self.post_process_fn = func
+        """Decorator to append a post_process_function to the post-processing chain. Can also be called directly"""
+        self.post_process_fns.append(func)
         return func
 
     def command(self, command_name: str, arg_sep: str = SEP_SPACE) -> Callable:
@@ -200,10 +298,11 @@ class Compiler:
         """
 
         def decorator(func: Callable) -> Callable:
-            sig = inspect.signature(func)
-            hints = get_type_hints(func)
-            params = list(sig.parameters.values())[1:]  # skip compiler_ctx
+            params, hints = _builder_signature(func)
             params_amount = len(params)
+            default_values = func.__defaults__ or ()
+            required = params_amount - len(default_values)
+            defaults = dict(zip(params[required:], default_values))
 
             def cast(value: Any, typ: type) -> Any:
                 """Try to cast string values to annotated types."""
@@ -216,32 +315,98 @@ class Compiler:
                     
                 return value
 
-            def wrapper(arg_string: str) -> Instruction:
-                """Wrapper that splits arg_string and casts args before calling the actual command builder.
+            def converter(typ: type) -> Callable[[Token], Any]:
+                """Returns the function turning an argument token into typ, resolved once per command"""
+                from_token = getattr(typ, "from_token", None)
+                if from_token is not None:
+                    return from_token
+                if typ is str:
+                    return lambda token: token[TEXT]
+                if typ is float:
+                    return lambda token: token[VALUE] if token[KIND] is TokenKind.NUMBER else cast(token[TEXT], float)
+                return lambda token: cast(token[TEXT], typ)
+
+            converters = [converter(hints.get(param, str)) for param in params]
+
+            # defaults of params[i:], for every i, cast once at registration
+            tail_defaults: List[List[Any]] = [
+                [cast(defaults[p], hints.get(p, type(defaults[p]))) for p in params[i:] if p in defaults]
+                for i in range(params_amount + 1)
+            ]
+
+            resplit = arg_sep != SEP_SPACE
+
+            def wrapper(args: List[Token]) -> Instruction:
+                """Wrapper that converts the argument tokens before calling the actual command builder.
                 """
-                # only perform params_amount - 1 split
-                args: list[str] = arg_string.split(arg_sep, params_amount - 1) if arg_string else []
+                if resplit:
+                    # re-split the argument text on the custom separator
+                    text = " ".join(token[TEXT] for token in args)
+                    args = [classify(a.strip()) for a in text.split(arg_sep, params_amount - 1)] if text else []
+
+                given = len(args)
+                if given > params_amount:
+                    if params_amount == 0:
+                        return func(self.compilation_ctx)   # extra args are ignored
+                    # the last param takes the rest of the line
+                    args = args[:params_amount - 1] + [join_tokens(args[params_amount - 1:])]
+                    given = params_amount
+                elif given < required:
+                    raise CompilationError(-1, f'Missing argument "{params[given]}" of command "{command_name}"')
+
+                # remaining params take their defaults
+                return func(self.compilation_ctx, *[convert(token) for convert, token in zip(converters, args)], *tail_defaults[given])
 
-                bound_args: list[Any] = []
+            self.command_table[command_name] = wrapper  # register command
+            return wrapper
 
-                # cast and bind positional args
-                for arg, param in zip(args, params):
-                    typ = hints.get(param.name, type(arg))
-                    bound_args.append(cast(arg, typ))
+        return decorator
 
-                # fill in remaining params with defaults
-                for param in params[len(args):]:
-                    if param.default is not inspect._empty:
-                        val = cast(param.default, hints.get(param.name, type(param.default)))
-                        bound_args.append(val)
 
-                return func(self.compilation_ctx, *bound_args)
 
-            self.command_table[command_name] = wrapper  # register command
-            return wrapper
+class IncrementalCompiler(Compiler):
+    """
+    Compiler that remembers the instruction built from every source line, to recompile
+    edited scripts quickly. Lines are keyed by their content: after an edit, only the new or
+    changed lines are tokenized and go through the command builders, the others reuse the
+    instruction built the first time, wherever they moved.
+
+    Only instructions accepted by the shareable check (see Compiler.set_shareable_check) are
+    reused, the same object ends up in several programs. Lines building anything else (jumps,
+    variables) and compile-time commands like labels, whose effect depends on their position,
+    are built again on every compilation. Post-processing always runs on the whole program,
+    so labels, jump targets, variable slots and the line table are resolved from scratch.
+
+    The cache only keeps the lines of the latest compilation, its size follows the script.
+    """
 
-        return decorator
+    line_cache: Dict[str, Instruction | None]   # line text -> shareable instruction, None for blank lines
+    known_words: Dict[str, Token]               # tokens of all the words seen so far
+    reused_lines: int                           # lines of the latest compilation taken from the cache
+
+    def __init__(self, configure_function: Callable[[Compiler], None] | None = None) -> None:
+        super().__init__(configure_function)
+        self.line_cache = {}
+        self.known_words = {}
+        self.reused_lines = 0
+
+    def clear_cache(self) -> None:
+        """Forgets all the built lines, the next compilation starts from scratch"""
+        self.line_cache = {}
+        self.known_words = {}
 
+    def generate_instructions(self, lines: List[str]) -> List[Instruction] | None:
+        self._new_program()
+        used_lines: Dict[str, Instruction | None] = {}
+        reused = self._build_lines(lines, self.line_cache, used_lines, self.known_words)
+        if reused is None:
+            return
+
+        self.line_cache = used_lines
+        self.reused_lines = reused
+        logger.info("Compilation successfull, created %s instructions (%s of %s lines unchanged).",
+                    len(self.instructions), reused, len(lines))
+        return self.instructions
 
 
 if __name__ == "__main__":
@@ -1,8 +1,13 @@
-from typing import Dict, Iterable, Callable
+from typing import Dict, Iterable, Iterator, Callable
 from enum import Enum
-
-from .compiler import Compiler, SEP_SPACE, CompilationError, CompCtxDict
-from app_logic.instruction_set import ValueRef, VarMathOperations, _is_valid_var_name
+import dataclasses
+
+from .compiler import Compiler, SEP_SPACE, CompilationError, CompCtxDict, SubclassCache
+from .optimizer import optimize as optimize_program
+from .dataflow import optimize_variables
+from .expressions import Expression
+from . import expressions
+from app_logic.instruction_set import ValueRef, VarMathOperations, SPECIAL_VARIABLES, DEFAULT_HISTORY_DEPTH, _is_valid_var_name
 from app_logic.instruction_set import (
     Wait,
     MouseLeftClick,
@@ -24,6 +29,7 @@ from app_logic.instruction_set import (
     SetSafeMode,
     VarMath,
     SetVar,
+    SetVarExpr,
     PrintVar,
     EndProgram
 )
@@ -37,13 +43,74 @@ class MathOperators(Enum):
     DIV = "/"
     NO_OP = "noop"
 
+# operators of a single operation, built as VarMath
+_VARMATH_OPERATIONS: Dict[str, VarMathOperations] = {
+    MathOperators.PLUS.value: VarMathOperations.SUM,
+    MathOperators.MINUS.value: VarMathOperations.DIFFERENCE,
+    MathOperators.TIMES.value: VarMathOperations.MULTIPLICATION,
+    MathOperators.DIV.value: VarMathOperations.DIVISION,
+}
+
 # annotated context dict (shared across command builders)
 class CompilerContextDict(CompCtxDict):
     # inherits instruction_list
     found_labels: dict[str, int]
+    var_slots: dict[str, int]
 
 # utility functions
 
+class _FieldNames(Dict[type, tuple]):
+    """Dataclass field names of every instruction type, resolved once per type"""
+
+    def __missing__(self, cls: type) -> tuple:
+        names = self[cls] = tuple(f.name for f in dataclasses.fields(cls))
+        return names
+
+_FIELD_NAMES = _FieldNames()
+
+def iter_value_refs(inst: Instruction) -> Iterator[ValueRef]:
+    """Yields all ValueRef operands of an instruction (also the ones stored inside list fields)"""
+    for name in _FIELD_NAMES[type(inst)]:
+        val = getattr(inst, name)
+        if isinstance(val, ValueRef):
+            yield val
+        elif isinstance(val, list):
+            yield from (v for v in val if isinstance(v, ValueRef))
+
+# instructions holding state set by post-processing (jump targets, variable slots, register
+# names) or changed while running (loop counters): every program needs its own object
+_STATEFUL = SubclassCache(JumpNTimes, SetVar, SetVarExpr, VarMath, PrintVar, SetupAndStart)
+
+def is_shareable(inst: Instruction) -> bool:
+    """True if the instruction is never modified after being built, so it can be reused
+    by several programs: stateless, with literal operands only (variable references are bound
+    to their register slot at post-processing)"""
+    cls = type(inst)
+    if _STATEFUL[cls]:
+        return False
+    for name in _FIELD_NAMES[cls]:    # iter_value_refs() inlined, runs for every line of a new script
+        val = getattr(inst, name)
+        if isinstance(val, ValueRef):
+            if val.literal is None:
+                return False
+        elif isinstance(val, list) and any(isinstance(v, ValueRef) and v.literal is None for v in val):
+            return False
+    return True
+
+def _is_operand(node: expressions.Node) -> bool:
+    return node[0] == expressions.NUM or node[0] == expressions.VAR
+
+def _operand_ref(node: expressions.Node) -> ValueRef:
+    return ValueRef(node[1]) if node[0] == expressions.NUM else ValueRef.variable(node[1])
+
+def get_var_slot(compiler_ctx: CompilerContextDict, name: str) -> int:
+    """Returns the register slot of a variable, assigning the next free one on first use"""
+    var_slots = compiler_ctx.setdefault('var_slots', {})
+    slot = var_slots.get(name)
+    if slot is None:
+        slot = var_slots[name] = len(var_slots)
+    return slot
+
 def get_label_jmp_idx(compiler_ctx: CompilerContextDict, name: str) -> int:
     found_labels: Dict[str, int] = compiler_ctx.get('found_labels', {})
     jmp_idx: int | None = found_labels.get(name)
@@ -52,8 +119,9 @@ def get_label_jmp_idx(compiler_ctx: CompilerContextDict, name: str) -> int:
 
     return jmp_idx
 
-def get_compiler_cfg(safemode: bool) -> Callable[[Compiler], None]:
-    """Returns a parametrized configuration function for the compiler"""
+def get_compiler_cfg(safemode: bool, history_depth: int = DEFAULT_HISTORY_DEPTH, optimize: bool = True) -> Callable[[Compiler], None]:
+    """Returns a parametrized configuration function for the compiler. optimize=False keeps
+    one instruction per source line, to debug scripts (see optimizer.py)"""
 
     def configure_compiler(compiler: Compiler) -> None:
         """Configure the compiler by registering command build functions.
@@ -142,41 +210,36 @@ def get_compiler_cfg(safemode: bool) -> Callable[[Compiler], None]:
         
         @compiler.command(PRINTVAR)
         def printvar_command(compiler_ctx: CompilerContextDict, name: str) -> PrintVar:
-            return PrintVar(name)
+            return PrintVar(name, ValueRef(name))
 
         @compiler.command(VAR)
         def var_command(
             compiler_ctx: CompilerContextDict, 
             target_name: str, 
             action: str, 
-            left_val: ValueRef, 
-            operation: MathOperators = MathOperators.NO_OP,
-            right_val: ValueRef  = ValueRef("-1")
-        ) -> VarMath | SetVar:
+            expression: Expression
+        ) -> VarMath | SetVar | SetVarExpr:
             
-            comm = (target_name, action, left_val, operation, right_val)
             if not _is_valid_var_name(target_name):
                 raise CompilationError(-1, f"Invalid variable name: '{target_name}'")
+            if action != "=":
+                raise CompilationError(-1, "Wrong usage of 'var' command")
 
-            match comm:
-                case (str() as target, "=", left, MathOperators.NO_OP, _):
-                    return SetVar(target, left)
+            # a value or a single operation keep their own instructions, longer expressions are compiled
+            match expression.node:
+                case (expressions.NUM, value):
+                    return SetVar(target_name, ValueRef(value))
                 
-                case (str() as target, "=", left, MathOperators.PLUS, right):
-                    
-                    return VarMath(target, left, right, VarMathOperations.SUM)
+                case (expressions.VAR, name):
+                    return SetVar(target_name, ValueRef.variable(name))
                 
-                case (str() as target, "=", left, MathOperators.MINUS, right):
-                    return VarMath(target, left, right, VarMathOperations.DIFFERENCE)
-                
-                case (str() as target, "=", left, MathOperators.DIV, right):
-                    return VarMath(target, left, right, VarMathOperations.DIVISION)
-                
-                case (str() as target, "=", left, MathOperators.TIMES, right):
-                    return VarMath(target, left, right, VarMathOperations.MULTIPLICATION)
+                case (op, left, right) if op in _VARMATH_OPERATIONS and _is_operand(left) and _is_operand(right):
+                    return VarMath(target_name, _operand_ref(left), _operand_ref(right), _VARMATH_OPERATIONS[op])
                 
                 case _:
-                    raise CompilationError(-1, "Wrong usage of 'var' command")
+                    expressions.compile_expression(expression.text)    # once per distinct expression
+                    operands = [ValueRef.variable(name) for name in expressions.variables(expression.node)]
+                    return SetVarExpr(target_name, expression.text, operands)
 
             
     
@@ -186,18 +249,100 @@ def get_compiler_cfg(safemode: bool) -> Callable[[Compiler], None]:
         def post_process_jumps(compiler_ctx: CompilerContextDict, instructions: Iterable[Instruction]) -> Iterable[Instruction]:
             """Additional step to link all jumps to labels idxs"""
 
+            is_jump = SubclassCache(JumpNTimes)     # Call is a JumpNTimes
             for inst in instructions:
-                if isinstance(inst, (JumpNTimes, Call)):
+                if is_jump[type(inst)]:
                     jmp_idx = get_label_jmp_idx(compiler_ctx, inst.jmp_name)
                     inst.jump_idx = jmp_idx
 
             return instructions
 
-        init_insts: list[Instruction] = [SetupAndStart(), Wait(ValueRef(.5))]    # waits a bit to let the dialog startup properly
+        if optimize:
+            @compiler.postprocess
+            def post_process_dataflow(compiler_ctx: CompilerContextDict, instructions: Iterable[Instruction]) -> Iterable[Instruction]:
+                """Constant propagation and dead variable elimination, keeps the line table and the labels in sync"""
+
+                optimized, line_table, labels = optimize_variables(
+                    list(instructions), compiler_ctx['line_table'], compiler_ctx.get('found_labels', {})
+                )
+                compiler_ctx['line_table'] = line_table
+                compiler_ctx['found_labels'] = labels
+                return optimized
+
+            @compiler.postprocess
+            def post_process_optimize(compiler_ctx: CompilerContextDict, instructions: Iterable[Instruction]) -> Iterable[Instruction]:
+                """Peephole optimizations, keeps the line table and the labels in sync"""
+
+                optimized, line_table, labels = optimize_program(
+                    list(instructions), compiler_ctx['line_table'], compiler_ctx.get('found_labels', {})
+                )
+                compiler_ctx['line_table'] = line_table
+                compiler_ctx['found_labels'] = labels
+                return optimized
+
+        @compiler.postprocess
+        def post_process_variables(compiler_ctx: CompilerContextDict, instructions: Iterable[Instruction]) -> Iterable[Instruction]:
+            """Assigns every variable name a fixed slot of the register file, and binds all the
+            variable references and assignments to it"""
+
+            instructions = list(instructions)
+            compiler_ctx['var_slots'] = {}  # slots are reassigned from scratch on every compilation
+            is_setvar, is_varmath = SubclassCache(SetVar, SetVarExpr), SubclassCache(VarMath)
+
+            def bind_variable(ref: ValueRef):
+                # special variables are bound to their reader and take no slot
+                ref.bind_slot(-1 if ref.var_name in SPECIAL_VARIABLES else get_var_slot(compiler_ctx, ref.var_name))
+
+            for inst in instructions:
+                cls = type(inst)
+                if is_setvar[cls]:
+                    inst.slot = get_var_slot(compiler_ctx, inst.var_name)
+                elif is_varmath[cls]:
+                    inst.out_slot = get_var_slot(compiler_ctx, inst.out_var_name)
+
+                for name in _FIELD_NAMES[cls]:    # iter_value_refs() inlined, this loop runs for every operand
+                    val = getattr(inst, name)
+                    if isinstance(val, ValueRef):
+                        if val.literal is None:
+                            bind_variable(val)
+                    elif isinstance(val, list):
+                        for ref in val:
+                            if isinstance(ref, ValueRef) and ref.literal is None:
+                                bind_variable(ref)
+
+            register_names = list(compiler_ctx['var_slots'])
+            is_setup = SubclassCache(SetupAndStart)
+            for inst in instructions:
+                if is_setup[type(inst)]:
+                    inst.register_names = register_names
+
+            return instructions
+
+        @compiler.postprocess
+        def post_process_history(compiler_ctx: CompilerContextDict, instructions: Iterable[Instruction]) -> Iterable[Instruction]:
+            """Disables movement history tracking when nothing can ever read it"""
+
+            instructions = list(instructions)
+            is_goback, is_setup = SubclassCache(MouseGoBack), SubclassCache(SetupAndStart)
+            types = list(map(type, instructions))
+            uses_history = any(map(is_goback.__getitem__, types))
+            for inst, cls in zip(instructions, types):
+                if is_setup[cls]:
+                    inst.track_history = uses_history
+
+            return instructions
+
+        init_insts: list[Instruction] = [SetupAndStart(history_depth=history_depth)]  # the runner starts execution once its dialog is shown
         if safemode:
             init_insts.append(SetSafeMode(True))
         
         # bind initial instructions
         compiler.set_initial_instructions(init_insts)
+        compiler.set_shareable_check(is_shareable)
     
-    return configure_compiler
\ No newline at end of file
+    return configure_compiler
+
+
+def config_key(safemode: bool, history_depth: int = DEFAULT_HISTORY_DEPTH, optimize: bool = True) -> str:
+    """Describes the configuration of get_compiler_cfg in the compiled program cache"""
+    return f"safemode={safemode};history_depth={history_depth};optimize={optimize}"
@@ -0,0 +1,428 @@
+"""
+Dataflow pass over compiled programs: constant propagation and dead variable elimination.
+Runs at post-processing once jumps are linked, before the peephole optimizer (see optimizer.py),
+and is turned off with it.
+
+The program is split into basic blocks linked by a control-flow graph (see ControlFlowGraph):
+jumps and calls lead to their target, counted jumps also fall through, returns lead back after
+every call and `end` leads nowhere. Two analyses run on it:
+    - constant propagation, forward: the value of every variable before every instruction,
+      a constant when all the paths reaching the instruction assign the same one. Reads of
+      variables with a known value become literals, and VarMath and expressions (SetVarExpr)
+      on constants are folded into a SetVar: loops over constant bounds do no register traffic
+      at runtime.
+    - liveness, backward: assignments whose variable is never read afterwards are deleted.
+
+Scripts fail exactly like before: a read of a variable that may be undefined is never
+replaced, and only assignments that can not fail are deleted (no read of a possibly undefined
+variable, no division by a possible zero). Folding never produces infinities or NaN, those
+are left to the runtime.
+
+Instructions are never modified: operands are replaced in new instructions, with new literal
+ValueRefs (literal refs are shared, e.g. the defaults of command builders). Like in the
+optimizer, only jumps are retargeted in place when assignments are deleted.
+"""
+
+from __future__ import annotations
+from typing import List, Dict, Set, Tuple, Callable, Any, get_type_hints, get_origin, get_args
+from dataclasses import dataclass, field
+import dataclasses
+import logging
+import math
+import operator
+
+from .compiler import SubclassCache
+from .expressions import evaluate_constant
+from app_logic.virtual_machine.executor import Instruction, HaltExecution
+from app_logic.instruction_set import (
+    ValueRef,
+    VarMathOperations,
+    SPECIAL_VARIABLES,
+    SetVar,
+    SetVarExpr,
+    VarMath,
+    JumpNTimes,
+    Call,
+    Return,
+)
+
+logger = logging.getLogger("Compiler")
+
+_is_jump = SubclassCache(JumpNTimes)    # Call is a JumpNTimes
+_is_call = SubclassCache(Call)
+_is_return = SubclassCache(Return)
+_is_halt = SubclassCache(HaltExecution)
+_is_setvar = SubclassCache(SetVar)
+_is_setexpr = SubclassCache(SetVarExpr)
+_is_varmath = SubclassCache(VarMath)
+
+_OPERATIONS: Dict[VarMathOperations, Callable[[Any, Any], float]] = {
+    VarMathOperations.SUM: operator.add,
+    VarMathOperations.DIFFERENCE: operator.sub,
+    VarMathOperations.MULTIPLICATION: operator.mul,
+    VarMathOperations.DIVISION: operator.truediv,
+}
+
+# value of a variable that is surely defined, but not known at compile time. Variables that may
+# be undefined have no entry in the state, the others map to their constant or to _UNKNOWN
+_UNKNOWN: Any = object()
+
+State = Dict[str, Any]
+
+
+class _RefFields(Dict[type, Tuple[str, ...]]):
+    """Names of the ValueRef operands of every instruction type (or of its lists of ValueRef
+    operands, with lists=True), resolved once per type"""
+
+    def __init__(self, lists: bool = False) -> None:
+        super().__init__()
+        self.lists = lists
+
+    def __missing__(self, cls: type) -> Tuple[str, ...]:
+        names: Tuple[str, ...] = ()
+        if dataclasses.is_dataclass(cls):
+            hints = get_type_hints(cls)
+            names = tuple(f.name for f in dataclasses.fields(cls) if self._holds_refs(hints[f.name]))
+        self[cls] = names
+        return names
+
+    def _holds_refs(self, hint: Any) -> bool:
+        if self.lists:
+            return get_origin(hint) is list and get_args(hint) == (ValueRef,)
+        return hint is ValueRef
+
+_REF_FIELDS = _RefFields()
+_REF_LIST_FIELDS = _RefFields(lists=True)
+
+
+def _always_jumps(inst: Instruction) -> bool:
+    # a literal count <= 0 jumps every time (see JumpNTimes)
+    return inst.num.literal is not None and inst.num.literal <= 0   # type: ignore
+
+
+@dataclass
+class BasicBlock:
+    start: int      # index of the first instruction
+    end: int        # index after the last instruction
+    successors: List[int] = field(default_factory=list)     # block indexes
+    predecessors: List[int] = field(default_factory=list)
+
+
+class ControlFlowGraph:
+    """
+    Basic blocks of a linked program and the edges between them. Block 0 is the entry, edges
+    leaving the program (`end`, falling off the end, jumping past it) are not stored.
+
+    A call leads to its target, and every return leads back after every call: the graph does
+    not tell calls apart, which is conservative for any analysis. A return also falls through,
+    which is what it does with an empty stack.
+    """
+
+    blocks: List[BasicBlock]
+    block_at: Dict[int, int]    # instruction index -> block starting there
+
+    def __init__(self, instructions: List[Instruction]) -> None:
+        n = len(instructions)
+        types = list(map(type, instructions))
+        return_sites = [i + 1 for i, cls in enumerate(types) if _is_call[cls]]
+
+        leaders = {0}
+        for i, (inst, cls) in enumerate(zip(instructions, types)):
+            if _is_jump[cls]:
+                leaders.add(inst.jump_idx)  # type: ignore
+                leaders.add(i + 1)
+            elif _is_return[cls] or _is_halt[cls]:
+                leaders.add(i + 1)
+        leaders.update(return_sites)
+        starts = sorted(i for i in leaders if i < n)
+
+        self.blocks = [BasicBlock(start, end) for start, end in zip(starts, starts[1:] + [n])]
+        self.block_at = {block.start: k for k, block in enumerate(self.blocks)}
+
+        for k, block in enumerate(self.blocks):
+            last = block.end - 1
+            inst, cls = instructions[last], types[last]
+            if _is_halt[cls]:
+                targets = []
+            elif _is_jump[cls]:
+                targets = [inst.jump_idx] if _always_jumps(inst) else [inst.jump_idx, block.end]  # type: ignore
+            elif _is_return[cls]:
+                targets = return_sites + [block.end]
+            else:
+                targets = [block.end]
+
+            for target in dict.fromkeys(targets):   # without duplicates, in order
+                if target < n:
+                    succ = self.block_at[target]
+                    block.successors.append(succ)
+                    self.blocks[succ].predecessors.append(k)
+
+
+# ------------------------------------------------------------------
+# constant propagation
+
+def _value(ref: ValueRef, state: State) -> Any:
+    """Value of a reference in state: a number, _UNKNOWN, or None if it may be undefined"""
+    if ref.literal is not None:
+        return ref.literal
+    if ref.var_name in SPECIAL_VARIABLES:
+        return _UNKNOWN
+    return state.get(ref.var_name)
+
+def _fold(opcode: VarMathOperations, left: Any, right: Any) -> float | None:
+    """Result of an operation on constants, None if it fails or is not finite"""
+    try:
+        result = _OPERATIONS[opcode](left, right)
+    except (ArithmeticError, KeyError):
+        return None
+    return result if math.isfinite(result) else None
+
+def _fold_expression(inst: SetVarExpr, state: State) -> Any:
+    """Value of an expression in state: a number, _UNKNOWN, or None if it reads a variable that
+    may be undefined"""
+    values = [_value(ref, state) for ref in inst.operands]
+    if any(value is None for value in values):
+        return None
+    if any(value is _UNKNOWN for value in values):
+        return _UNKNOWN
+    value = evaluate_constant(inst.expression, values)
+    return _UNKNOWN if value is None else value
+
+def _transfer(inst: Instruction, cls: type, state: State) -> None:
+    """Applies the assignment done by inst, if any, to state"""
+    if _is_setvar[cls]:
+        target, value = inst.var_name, _value(inst.val, state)     # type: ignore
+    elif _is_varmath[cls]:
+        target = inst.out_var_name  # type: ignore
+        left, right = _value(inst.l_val, state), _value(inst.r_val, state)  # type: ignore
+        if left is None or right is None:
+            value = None
+        elif left is _UNKNOWN or right is _UNKNOWN:
+            value = _UNKNOWN
+        else:
+            value = _fold(inst.opcode, left, right)     # type: ignore
+            if value is None:
+                value = _UNKNOWN    # fails at runtime, or a value that is not folded
+    elif _is_setexpr[cls]:
+        target = inst.var_name  # type: ignore
+        value = _fold_expression(inst, state)
+    else:
+        return
+
+    if value is None:
+        state.pop(target, None)
+    else:
+        state[target] = value
+
+def _same(a: Any, b: Any) -> bool:
+    if a is b:
+        return True
+    if a is _UNKNOWN or b is _UNKNOWN:
+        return False
+    return a == b and (a != 0 or math.copysign(1.0, a) == math.copysign(1.0, b))  # 0.0 and -0.0 print differently
+
+def _meet(a: State, b: State) -> State:
+    """State of a point reached from two paths"""
+    return {name: (value if _same(value, b[name]) else _UNKNOWN) for name, value in a.items() if name in b}
+
+def _same_state(a: State, b: State) -> bool:
+    return a.keys() == b.keys() and all(_same(value, b[name]) for name, value in a.items())
+
+def _block_states(instructions: List[Instruction], cfg: ControlFlowGraph) -> List[State | None]:
+    """State at the start of every block, None for unreachable blocks"""
+    blocks = cfg.blocks
+    states: List[State | None] = [None] * len(blocks)
+    if not blocks:
+        return states
+    states[0] = {}  # nothing is defined at the start
+    pending, queued = [0], {0}
+
+    while pending:
+        k = pending.pop()
+        queued.discard(k)
+        state = dict(states[k])     # type: ignore
+        for i in range(blocks[k].start, blocks[k].end):
+            _transfer(instructions[i], type(instructions[i]), state)
+
+        for succ in blocks[k].successors:
+            old = states[succ]
+            new = dict(state) if old is None else _meet(old, state)
+            if old is None or not _same_state(old, new):
+                states[succ] = new
+                if succ not in queued:
+                    queued.add(succ)
+                    pending.append(succ)
+    return states
+
+def _substitute(inst: Instruction, state: State) -> Instruction:
+    """Returns inst with the reads of constant variables replaced by literals, a new
+    instruction if anything was replaced"""
+    changes: Dict[str, Any] = {}
+    for name in _REF_FIELDS[type(inst)]:
+        ref = getattr(inst, name)
+        if ref.literal is None:
+            value = _value(ref, state)
+            if value is not None and value is not _UNKNOWN:
+                changes[name] = ValueRef(value)
+    return dataclasses.replace(inst, **changes) if changes else inst     # type: ignore
+
+
+# ------------------------------------------------------------------
+# liveness
+
+def _reads(inst: Instruction) -> Set[str]:
+    """Variables read by an instruction (registers only, special variables are not stored)"""
+    names = set()
+    cls = type(inst)
+    for name in _REF_FIELDS[cls]:
+        ref = getattr(inst, name)
+        if ref.literal is None and ref.var_name not in SPECIAL_VARIABLES:
+            names.add(ref.var_name)
+    for name in _REF_LIST_FIELDS[cls]:
+        names.update(ref.var_name for ref in getattr(inst, name) if ref.literal is None and ref.var_name not in SPECIAL_VARIABLES)
+    return names
+
+def _written(inst: Instruction) -> str | None:
+    cls = type(inst)
+    if _is_setvar[cls] or _is_setexpr[cls]:
+        return inst.var_name   # type: ignore
+    if _is_varmath[cls]:
+        return inst.out_var_name   # type: ignore
+    return None
+
+def _live_out(reads: List[Set[str]], writes: List[str | None], keep: bytearray, cfg: ControlFlowGraph) -> List[Set[str]]:
+    """Variables read after the end of every block, before being assigned again. reads and
+    writes are the variables read and written by every instruction."""
+    blocks = cfg.blocks
+    uses: List[Set[str]] = []
+    defs: List[Set[str]] = []
+    for block in blocks:
+        used, defined = set(), set()
+        for i in range(block.end - 1, block.start - 1, -1):
+            if not keep[i]:
+                continue
+            written = writes[i]
+            if written is not None:
+                used.discard(written)
+                defined.add(written)
+            used |= reads[i]
+        uses.append(used)
+        defs.append(defined)
+
+    live_in: List[Set[str]] = [set(used) for used in uses]
+    live_out: List[Set[str]] = [set() for _ in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for k in range(len(blocks) - 1, -1, -1):
+            out: Set[str] = set()
+            for succ in blocks[k].successors:
+                out |= live_in[succ]
+            if out != live_out[k]:
+                live_out[k] = out
+                live_in[k] = uses[k] | (out - defs[k])
+                changed = True
+    return live_out
+
+
+def optimize_variables(
+    instructions: List[Instruction], line_table: List[int], labels: Dict[str, int]
+) -> Tuple[List[Instruction], List[int], Dict[str, int]]:
+    """Propagates constants and deletes dead assignments in a linked program. Returns the new
+    instructions, their line table and the remapped labels."""
+    types = list(map(type, instructions))
+    if not any(_is_setvar[cls] or _is_varmath[cls] for cls in types):
+        return instructions, line_table, labels     # recordings and other scripts without variables
+
+    n = len(instructions)
+    cfg = ControlFlowGraph(instructions)
+    states = _block_states(instructions, cfg)
+
+    # rewrite reachable blocks with their constants, and find the assignments that can not fail
+    rewritten = list(instructions)
+    removable = bytearray(n)
+    replaced = folded = 0
+    for block, start_state in zip(cfg.blocks, states):
+        if start_state is None:
+            continue    # unreachable, left to the peephole optimizer
+        state = dict(start_state)
+        for i in range(block.start, block.end):
+            inst = _substitute(instructions[i], state)
+            replaced += inst is not instructions[i]
+            cls = type(inst)
+
+            if _is_varmath[cls]:
+                left, right = _value(inst.l_val, state), _value(inst.r_val, state)  # type: ignore
+                result = None
+                if left is not None and right is not None and left is not _UNKNOWN and right is not _UNKNOWN:
+                    result = _fold(inst.opcode, left, right)   # type: ignore
+                if result is not None:
+                    inst = SetVar(inst.out_var_name, ValueRef(result))  # type: ignore
+                    cls = SetVar
+                    folded += 1
+                else:
+                    opcode = inst.opcode    # type: ignore
+                    removable[i] = opcode in _OPERATIONS and left is not None and right is not None and (
+                        opcode is not VarMathOperations.DIVISION or (right is not _UNKNOWN and right != 0)
+                    )
+            elif _is_setexpr[cls]:
+                value = _fold_expression(inst, state)    # type: ignore
+                if value is not None and value is not _UNKNOWN:
+                    inst = SetVar(inst.var_name, ValueRef(value))   # type: ignore
+                    cls = SetVar
+                    folded += 1
+                # otherwise kept: it may fail at runtime (division by zero, square root of a negative)
+            if _is_setvar[cls]:
+                removable[i] = _value(inst.val, state) is not None    # type: ignore
+
+            rewritten[i] = inst
+            _transfer(inst, cls, state)
+
+    # delete dead assignments, until deleting one makes no other one dead
+    keep = bytearray(b"\x01") * n
+    reads = list(map(_reads, rewritten))
+    writes = list(map(_written, rewritten))
+    removed = 0
+    while True:
+        live_out = _live_out(reads, writes, keep, cfg)
+        removed_now = 0
+        for block, start_state, live_after in zip(cfg.blocks, states, live_out):
+            if start_state is None:
+                continue
+            live = set(live_after)
+            for i in range(block.end - 1, block.start - 1, -1):
+                if not keep[i]:
+                    continue
+                written = writes[i]
+                if written is not None:
+                    if removable[i] and written not in live:
+                        keep[i] = 0
+                        removed_now += 1
+                        continue
+                    live.discard(written)
+                live |= reads[i]
+        if not removed_now:
+            break
+        removed += removed_now
+
+    logger.info(
+        "Dataflow: %s instructions with constant operands, %s operations folded, %s dead assignments removed.",
+        replaced, folded, removed
+    )
+    if not removed:
+        return rewritten, line_table, labels
+
+    out: List[Instruction] = []
+    out_lines: List[int] = []
+    new_index: List[int] = []   # old index -> new index, plus n for jumps and labels past the end
+    for inst, line, kept in zip(rewritten, line_table, keep):
+        new_index.append(len(out))     # a deleted assignment lands on what follows
+        if kept:
+            out.append(inst)
+            out_lines.append(line)
+    new_index.append(len(out))
+
+    for inst in out:
+        if _is_jump[type(inst)]:
+            inst.jump_idx = new_index[inst.jump_idx]  # type: ignore
+    return out, out_lines, {name: new_index[idx] for name, idx in labels.items()}
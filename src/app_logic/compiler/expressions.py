@@ -0,0 +1,322 @@
+"""
+Arithmetic expressions of the var command:
+
+    var y = y + v * t - g
+    var d = sqrt((x2 - x1) * (x2 - x1) + (y2 - y1) * (y2 - y1))
+
+Numbers, variables (special ones too, like $MOUSE_X), + - * / with the usual precedence,
+unary minus, parentheses and the functions in FUNCTIONS. Spaces are optional inside an
+expression, only the ones around `=` are needed.
+
+Expressions are parsed once at compile time into a tree of plain tuples (see parse()), with
+constant subexpressions already folded. The compiler keeps the usual SetVar and VarMath for
+a value or a single operation, anything longer becomes one SetVarExpr: its expression is
+translated to Python source and compiled to a code object once (see compile_expression()),
+then bound to the register slots of its variables. Running it is a single call reading the
+register file directly, instead of an instruction per operation and a register per
+intermediate result.
+"""
+
+from __future__ import annotations
+from typing import List, Dict, Tuple, Callable, NamedTuple, Any
+import math
+import operator
+import re
+
+from .compiler import CompilationError
+from .tokenizer import Token, KIND, TEXT, VALUE, NUMBER
+from app_logic.instruction_set import ValueRef, SPECIAL_VARIABLES, SharedRuntimeDict
+
+# tree nodes, plain tuples:
+#   (NUM, value)            (VAR, name)             (NEG, operand)
+#   (CALL, function, args)  (op, left, right) for op in BINARY_OPERATORS
+Node = Tuple[Any, ...]
+NUM = "num"
+VAR = "var"
+NEG = "neg"
+CALL = "call"
+
+BINARY_OPERATORS: Dict[str, Callable[[float, float], float]] = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+def _round(x: float) -> float:
+    # halves away from zero, like people round (Python rounds them to even)
+    return math.copysign(math.floor(abs(x) + 0.5), x)
+
+class Function(NamedTuple):
+    impl: Callable[..., float]
+    min_args: int
+    max_args: int | None    # None: any number
+
+FUNCTIONS: Dict[str, Function] = {
+    "min": Function(min, 2, None),
+    "max": Function(max, 2, None),
+    "abs": Function(abs, 1, 1),
+    "round": Function(_round, 1, 1),
+    "sqrt": Function(math.sqrt, 1, 1),
+}
+
+_TOKEN = re.compile(r"""\s*(?:
+      (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<name>\$?[A-Za-z_]\w*)
+    | (?P<sym>[-+*/(),])
+)""", re.VERBOSE)
+
+
+def _lex(text: str) -> List[Tuple[str, Any]]:
+    """(kind, value) tokens of an expression: kind is "num", "name" or the symbol itself"""
+    tokens: List[Tuple[str, Any]] = []
+    pos, end = 0, len(text.rstrip())
+    while pos < end:
+        match = _TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise CompilationError(-1, f"Unexpected character '{text[pos:].lstrip()[:1]}' in expression '{text}'")
+        if match["num"]:
+            tokens.append(("num", float(match["num"])))
+        elif match["name"]:
+            tokens.append(("name", match["name"]))
+        else:
+            tokens.append((match["sym"], None))
+        pos = match.end()
+    return tokens
+
+
+def _fold(fn: Callable[..., float], args: List[float]) -> float | None:
+    """Result of fn on constant arguments, None if it fails or is not finite: left to the runtime"""
+    try:
+        result = float(fn(*args))
+    except (ArithmeticError, ValueError):
+        return None
+    return result if math.isfinite(result) else None
+
+
+class _Parser:
+    """Recursive descent, one method per precedence level"""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens = _lex(text)
+        self.pos = 0
+
+    def error(self, message: str) -> CompilationError:
+        return CompilationError(-1, f"{message} in expression '{self.text}'")
+
+    def peek(self) -> str | None:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def found(self) -> str:
+        """The current token, as written, for error messages"""
+        if self.pos >= len(self.tokens):
+            return "end of line"
+        kind, value = self.tokens[self.pos]
+        return f"'{value:g}'" if kind == "num" else f"'{value}'" if kind == "name" else f"'{kind}'"
+
+    def expect(self, symbol: str) -> None:
+        if self.peek() != symbol:
+            raise self.error(f"Expected '{symbol}', found {self.found()}")
+        self.pos += 1
+
+    def parse(self) -> Node:
+        node = self.sum()
+        if self.pos < len(self.tokens):
+            raise self.error(f"Unexpected {self.found()}")
+        return node
+
+    def sum(self) -> Node:
+        node = self.product()
+        while (op := self.peek()) in ("+", "-"):
+            self.pos += 1
+            node = _binary(op, node, self.product())
+        return node
+
+    def product(self) -> Node:
+        node = self.unary()
+        while (op := self.peek()) in ("*", "/"):
+            self.pos += 1
+            node = _binary(op, node, self.unary())
+        return node
+
+    def unary(self) -> Node:
+        kind = self.peek()
+        if kind == "-":
+            self.pos += 1
+            operand = self.unary()
+            return (NUM, -operand[1]) if operand[0] == NUM else (NEG, operand)
+        if kind == "+":
+            self.pos += 1
+            return self.unary()
+        return self.atom()
+
+    def atom(self) -> Node:
+        kind = self.peek()
+        if kind == "num" or kind == "name":
+            value = self.tokens[self.pos][1]
+            self.pos += 1
+            if kind == "num":
+                return (NUM, value)
+            return self.call(value) if self.peek() == "(" else self.variable(value)
+        if kind == "(":
+            self.pos += 1
+            node = self.sum()
+            self.expect(")")
+            return node
+        raise self.error("Missing value" if kind is None else f"Unexpected {self.found()}")
+
+    def variable(self, name: str) -> Node:
+        if name.startswith("$") and name not in SPECIAL_VARIABLES:
+            raise self.error(f"Unknown special variable '{name}'")
+        return (VAR, name)
+
+    def call(self, name: str) -> Node:
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise self.error(f"Unknown function '{name}'")
+        self.expect("(")
+        args = [self.sum()]
+        while self.peek() == ",":
+            self.pos += 1
+            args.append(self.sum())
+        self.expect(")")
+
+        if len(args) < function.min_args or (function.max_args is not None and len(args) > function.max_args):
+            expected = function.min_args if function.max_args == function.min_args else f"at least {function.min_args}"
+            raise self.error(f"'{name}' takes {expected} arguments, {len(args)} given")
+        if all(arg[0] == NUM for arg in args):
+            value = _fold(function.impl, [arg[1] for arg in args])
+            if value is not None:
+                return (NUM, value)
+        return (CALL, name, tuple(args))
+
+
+def _binary(op: str, left: Node, right: Node) -> Node:
+    if left[0] == NUM and right[0] == NUM:
+        value = _fold(BINARY_OPERATORS[op], [left[1], right[1]])
+        if value is not None:
+            return (NUM, value)
+    return (op, left, right)
+
+
+_PARSED: Dict[str, Node] = {}   # expression text -> tree, trees are never modified
+
+def parse(text: str) -> Node:
+    """Parses an expression into a tree, raises CompilationError if it is not valid"""
+    node = _PARSED.get(text)
+    if node is None:
+        node = _PARSED[text] = _Parser(text).parse()
+    return node
+
+
+def variables(node: Node) -> List[str]:
+    """Names of the variables read by an expression, without duplicates, in order of appearance"""
+    names: Dict[str, None] = {}
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        kind = node[0]
+        if kind == VAR:
+            names[node[1]] = None
+        elif kind == NEG:
+            pending.append(node[1])
+        elif kind == CALL:
+            pending.extend(reversed(node[2]))
+        elif kind != NUM:
+            pending.extend((node[2], node[1]))
+    return list(names)
+
+
+class Expression(NamedTuple):
+    """Right-hand side of a var command, as a compiler argument (see Compiler.command)"""
+    text: str
+    node: Node
+
+    @classmethod
+    def from_token(cls, token: Token) -> Expression:
+        """Single numbers are already parsed by the tokenizer, other words and the joined rest
+        of the line (see join_tokens) are parsed as expressions"""
+        if token[KIND] is NUMBER:
+            return cls(token[TEXT], (NUM, token[VALUE]))
+        return cls(token[TEXT], parse(token[TEXT]))
+
+
+# ------------------------------------------------------------------
+# code generation
+
+Evaluator = Callable[[List[float | None], SharedRuntimeDict], float]
+
+class CompiledExpression(NamedTuple):
+    variables: List[str]    # the factory arguments, in order
+    factory: Callable[..., Evaluator]   # register slot (or reader of special variables) of every variable -> evaluator
+
+
+def _number(value: float) -> str:
+    if math.isfinite(value):
+        return f"({value!r})"
+    return "(1e999)" if value > 0 else "(-1e999)"   # infinite literals of the source, repr() is not valid Python
+
+def python_source(node: Node, read: Dict[str, str]) -> str:
+    """Python source of an expression tree, read maps every variable to the source reading it.
+    The functions of the expression are called by their name (see FUNCTIONS)."""
+    kind = node[0]
+    if kind == NUM:
+        return _number(node[1])
+    if kind == VAR:
+        return read[node[1]]
+    if kind == NEG:
+        return f"(-{python_source(node[1], read)})"
+    if kind == CALL:
+        return f"{node[1]}({', '.join(python_source(arg, read) for arg in node[2])})"
+    return f"({python_source(node[1], read)} {kind} {python_source(node[2], read)})"
+
+
+_COMPILED: Dict[str, CompiledExpression] = {}   # one entry per distinct expression text
+
+def compile_expression(text: str) -> CompiledExpression:
+    """Translates an expression to the source of a closure factory, compiled once per distinct
+    expression. Variables are arguments of the factory: register reads become regs[slot] with
+    the slot held by the closure, special variables a call of their reader."""
+    compiled = _COMPILED.get(text)
+    if compiled is None:
+        node = parse(text)
+        names = variables(node)
+        args = [f"_{i}" for i in range(len(names))]
+        read = {name: f"{arg}(shared)" if name in SPECIAL_VARIABLES else f"regs[{arg}]" for name, arg in zip(names, args)}
+        source = (
+            f"def factory({', '.join(args)}):\n"
+            f"    def evaluate(regs, shared):\n"
+            f"        return {python_source(node, read)}\n"
+            f"    return evaluate\n"
+        )
+        namespace: Dict[str, Any] = {"__builtins__": {}}
+        namespace.update((name, function.impl) for name, function in FUNCTIONS.items())
+        exec(compile(source, f"<var expression '{text}'>", "exec"), namespace)
+        compiled = _COMPILED[text] = CompiledExpression(names, namespace["factory"])
+    return compiled
+
+
+def link(text: str, operands: List[ValueRef]) -> Evaluator:
+    """Returns the evaluator of an expression, bound to the slots of its variables. operands
+    are the variables of the expression (see variables()), bound by the compiler."""
+    args: List[Any] = []
+    for ref in operands:
+        if ref.special is not None:
+            args.append(ref.special)
+        elif ref.slot < 0:
+            raise RuntimeError(f"Variable '{ref.var_name}' was not assigned a register slot")
+        else:
+            args.append(ref.slot)
+    return compile_expression(text).factory(*args)
+
+
+def evaluate_constant(text: str, values: List[float]) -> float | None:
+    """Value of an expression whose variables have the constant values, in the order of
+    variables(). None if it fails or is not finite (e.g. a division by zero)"""
+    evaluate = compile_expression(text).factory(*range(len(values)))
+    try:
+        result = float(evaluate(values, None))     # type: ignore
+    except (ArithmeticError, ValueError):
+        return None
+    return result if math.isfinite(result) else None
@@ -0,0 +1,216 @@
+"""
+Peephole optimizer of compiled programs, run as a post-processing pass once jumps are linked
+(see compiler_config.py, it can be turned off to debug a script line by line).
+
+Recorded scripts are long runs of moves, clicks and waits: every instruction removed saves a
+dispatch, and for moves a round trip to the input backend. Passes, in order:
+    - jump threading:       jumps landing on an unconditional jump go straight to its target
+    - unreachable code:     instructions after `end` or an unconditional jump are dropped,
+                            up to the next instruction some jump lands on
+    - wait merging:         consecutive waits with literal times become one wait
+    - moverel merging:      consecutive instant moverel with literal offsets become one move,
+                            unless the program uses goback (every move is a history entry).
+                            Every move stops at the screen edge: only moves going the same way
+                            on each axis are merged, their sum then stops at the same point
+    - superinstructions:    a move followed by a click becomes a single MouseMoveClick
+
+Instructions are only merged when no jump lands inside the group, and a group takes the
+source line of its first instruction: the line table and the labels are remapped along.
+Built instructions may be shared by several programs (see IncrementalCompiler) and are never
+modified, merged instructions are new objects. Only jumps, which every program builds again,
+are retargeted in place.
+"""
+
+from __future__ import annotations
+from typing import List, Dict, Set, Tuple
+from bisect import bisect_right
+from itertools import accumulate, compress, count, islice
+from math import isfinite
+import logging
+
+from .compiler import SubclassCache
+from app_logic.virtual_machine.executor import Instruction
+from app_logic.input_backends.backend import MouseButton
+from app_logic.instruction_set import (
+    ValueRef,
+    Wait,
+    MouseMove,
+    MouseMoveRel,
+    MouseMoveClick,
+    MouseLeftClick,
+    MouseRightClick,
+    MouseDoubleClick,
+    MouseGoBack,
+    JumpNTimes,
+    Call,
+    EndProgram,
+)
+
+logger = logging.getLogger("Compiler")
+
+_is_jump = SubclassCache(JumpNTimes)    # Call is a JumpNTimes
+_is_call = SubclassCache(Call)
+_is_end = SubclassCache(EndProgram)
+_is_goback = SubclassCache(MouseGoBack)
+
+# click instruction -> button and click count of the superinstruction it is fused into.
+# Merged instructions are matched on their exact type: a subclass may execute differently
+_CLICKS: Dict[type, Tuple[MouseButton, int]] = {
+    MouseLeftClick: (MouseButton.LEFT, 1),
+    MouseRightClick: (MouseButton.RIGHT, 1),
+    MouseDoubleClick: (MouseButton.LEFT, 2),
+}
+# consecutive instruction types that may form a group, moverel pairs are added unless the program uses goback
+_MERGED_PAIRS: Set[Tuple[type, type]] = {(Wait, Wait)} | {(MouseMove, click) for click in _CLICKS}
+
+
+def is_unconditional_jump(inst: Instruction) -> bool:
+    """True for jumps that are always taken: a literal count <= 0 (see JumpNTimes).
+    Calls are excluded, they also push the pc."""
+    cls = type(inst)
+    return _is_jump[cls] and not _is_call[cls] and inst.num.literal is not None and inst.num.literal <= 0  # type: ignore
+
+def _literal_wait(inst: Instruction) -> bool:
+    # a negative wait does not wait, adding it to another one would shorten that one
+    return type(inst) is Wait and inst.time_s.literal is not None and inst.time_s.literal >= 0    # type: ignore
+
+def _instant_literal_moverel(inst: Instruction) -> bool:
+    # infinite offsets can not be summed as ints, the move fails when executed
+    return (type(inst) is MouseMoveRel and inst.time <= 0 and inst.x.literal is not None and inst.y.literal is not None   # type: ignore
+            and isfinite(inst.x.literal) and isfinite(inst.y.literal))  # type: ignore
+
+def _same_way(total: int, step: int) -> bool:
+    """True if a step along an axis does not go back on the moves before it (offsets of opposite
+    signs). Positions are clamped to the screen after every move: clamp(clamp(p + a) + b) is
+    clamp(p + a + b) when a and b have the same sign, but not otherwise."""
+    return total * step >= 0
+
+
+def thread_jumps(instructions: List[Instruction], jump_at: List[int]) -> int:
+    """Points every jump (at the indexes jump_at) landing on an unconditional jump to the final
+    target of the chain. Returns the number of retargeted jumps."""
+    n = len(instructions)
+    threaded = 0
+    for i in jump_at:
+        inst = instructions[i]
+        target: int = inst.jump_idx  # type: ignore
+        seen: Set[int] = set()  # jumps looping on each other are left as they are
+        while target < n and target not in seen and is_unconditional_jump(instructions[target]):
+            seen.add(target)
+            target = instructions[target].jump_idx  # type: ignore
+        if target != inst.jump_idx:  # type: ignore
+            inst.jump_idx = target  # type: ignore
+            threaded += 1
+    return threaded
+
+def live_instructions(instructions: List[Instruction], types: List[type], jump_at: List[int]) -> bytearray:
+    """Whether every instruction can run: the ones following `end` or an unconditional jump are
+    dead up to the next jump target. types are the instruction types, jump_at the jump indexes."""
+    n = len(instructions)
+    live = bytearray(b"\x01") * n
+    targets = sorted({instructions[i].jump_idx for i in jump_at})   # type: ignore
+    stops = sorted(
+        list(compress(count(), map(_is_end.__getitem__, types)))
+        + [i for i in jump_at if is_unconditional_jump(instructions[i])]
+    )
+    for stop in stops:
+        if live[stop]:  # a dead stop does not end anything
+            k = bisect_right(targets, stop)
+            resume = targets[k] if k < len(targets) else n
+            live[stop + 1:resume] = bytes(resume - stop - 1)
+    return live
+
+
+def optimize(
+    instructions: List[Instruction], line_table: List[int], labels: Dict[str, int]
+) -> Tuple[List[Instruction], List[int], Dict[str, int]]:
+    """Runs all the passes on a linked program. Returns the optimized instructions, their line
+    table and the remapped labels."""
+    n = len(instructions)
+    types = list(map(type, instructions))
+    jump_at = list(compress(count(), map(_is_jump.__getitem__, types)))
+    threaded = thread_jumps(instructions, jump_at)
+    live = live_instructions(instructions, types, jump_at)
+    dead = live.count(0)
+    # dead jumps are dropped, what only they land on can be merged
+    targets = {instructions[i].jump_idx for i in jump_at if live[i]}    # type: ignore
+    pairs = _MERGED_PAIRS if any(map(_is_goback.__getitem__, types)) else _MERGED_PAIRS | {(MouseMoveRel, MouseMoveRel)}
+    # groups can only start where two instructions of a merged pair follow each other
+    starts = list(compress(count(), map(pairs.__contains__, zip(types, islice(types, 1, None)))))
+
+    def joinable(k: int) -> bool:
+        """True if the instruction at k can be merged into the group before it"""
+        return k < n and live[k] and k not in targets
+
+    keep = bytearray(live)  # instructions making it to the output, the first of every group included
+    grouped = list(instructions)    # the instruction of every group replaces its first one
+    groups = 0
+    pos = 0     # instructions before pos are done
+    for i in starts:
+        if i < pos or not live[i]:
+            continue    # inside the previous group, or dead
+
+        inst, cls, end = instructions[i], types[i], i + 1   # group is [i, end)
+        if cls is MouseMove:    # checked first, recordings are mostly moves followed by clicks
+            if end in targets or not live[end]:    # joinable(), a start is never the last instruction
+                continue
+            button, clicks = _CLICKS[types[end]]
+            inst = MouseMoveClick(inst.x, inst.y, inst.time, button, clicks)     # type: ignore
+            end += 1
+
+        elif cls is Wait and _literal_wait(inst):
+            total: float = inst.time_s.literal   # type: ignore
+            while joinable(end) and _literal_wait(instructions[end]):
+                total += instructions[end].time_s.literal    # type: ignore
+                end += 1
+            if end == i + 1:
+                continue
+            inst = Wait(ValueRef(total))
+
+        elif cls is MouseMoveRel and _instant_literal_moverel(inst):
+            # each move truncates its own offsets (see MouseMoveRel), the sum must too
+            dx, dy = int(inst.x.literal), int(inst.y.literal)  # type: ignore
+            while joinable(end) and _instant_literal_moverel(instructions[end]):
+                step_x, step_y = int(instructions[end].x.literal), int(instructions[end].y.literal)  # type: ignore
+                if not (_same_way(dx, step_x) and _same_way(dy, step_y)):
+                    break
+                dx, dy = dx + step_x, dy + step_y
+                end += 1
+            if end == i + 1:
+                continue
+            inst = MouseMoveRel(ValueRef(float(dx)), ValueRef(float(dy)))
+
+        else:
+            continue
+
+        grouped[i] = inst
+        keep[i + 1:end] = bytes(end - i - 1)
+        groups += 1
+        pos = end
+
+    if not groups and not dead:
+        # nothing moves, threaded jumps were retargeted in place
+        logger.info("Optimized program: nothing to merge in %s instructions (%s jumps threaded).", n, threaded)
+        return instructions, line_table, labels
+
+    out = list(compress(grouped, keep))
+    out_lines = list(compress(line_table, keep))
+    kept_before = list(accumulate(keep, initial=0))
+
+    def new_index(idx: int) -> int:
+        """Index in the output of the instruction at idx: dead instructions land on what follows
+        them, merged ones on the first instruction of their group. n maps past the end"""
+        if idx < n and live[idx] and not keep[idx]:
+            return kept_before[idx] - 1
+        return kept_before[idx]
+
+    for i in jump_at:
+        if live[i]:
+            instructions[i].jump_idx = new_index(instructions[i].jump_idx)  # type: ignore
+
+    merged = n - len(out) - dead
+    logger.info(
+        "Optimized program: %s -> %s instructions (%s merged, %s unreachable, %s jumps threaded).",
+        n, len(out), merged, dead, threaded
+    )
+    return out, out_lines, {name: new_index(idx) for name, idx in labels.items()}
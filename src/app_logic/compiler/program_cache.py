@@ -0,0 +1,172 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import List
+import hashlib
+import logging
+import os
+import sys
+
+from utils.version import __version__
+from utils.resource_resolver import user_cache_dir
+from .compiler import Compiler
+from .program_format import CompiledProgram, ProgramFormatError, FORMAT_VERSION, encode, decode
+
+logger = logging.getLogger("Compiler")
+
+DEFAULT_CACHE_DIR = user_cache_dir() / "program_cache"
+MAX_CACHED_PROGRAMS = 64    # least recently used programs are removed past this
+CACHE_SUFFIX = ".clkp"
+
+# modules whose code decides what a source compiles to
+_COMPILER_MODULES = (
+    "app_logic.compiler.compiler",
+    "app_logic.compiler.compiler_config",
+    "app_logic.compiler.optimizer",
+    "app_logic.compiler.dataflow",
+    "app_logic.compiler.expressions",
+    "app_logic.compiler.tokenizer",
+    "app_logic.compiler.program_format",
+    "app_logic.instruction_set",
+    "app_logic.instruction_names",
+)
+
+_fingerprint: str | None = None
+
+def compiler_fingerprint() -> str:
+    """Identifies the compiler that produces the cached programs: the app and format versions,
+    plus the source code of the compiler modules when it is available, so that programs cached
+    by a development checkout are dropped as soon as the compiler changes."""
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256(f"{__version__}:{FORMAT_VERSION}".encode())
+        for name in _COMPILER_MODULES:
+            module = sys.modules.get(name)
+            try:
+                digest.update(Path(module.__file__).read_bytes())   # type: ignore
+            except (AttributeError, TypeError, OSError):
+                pass    # frozen builds ship no sources, their version is enough
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+class ProgramCache:
+    """
+    Content-addressed directory of compiled programs, in the binary program format.
+
+    Programs are stored under the hash of their source text, of the compiler configuration
+    (e.g. safe mode) and of the compiler itself (see compiler_fingerprint()): running an
+    unchanged script again loads it without parsing, and a program compiled by another
+    compiler version is never used. Unreadable or stale entries are removed and ignored,
+    the cache never makes a compilation fail.
+    """
+
+    def __init__(self, directory: str | Path = DEFAULT_CACHE_DIR, max_entries: int = MAX_CACHED_PROGRAMS) -> None:
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+
+    def key(self, src_text: str, config: str = "") -> str:
+        """Cache key of a source compiled with a configuration, described by the config string"""
+        digest = hashlib.sha256(compiler_fingerprint().encode())
+        digest.update(b"\0" + config.encode("utf-8") + b"\0")
+        digest.update(src_text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / (key + CACHE_SUFFIX)
+
+    def load(self, key: str) -> CompiledProgram | None:
+        """Returns the cached program, None if it is not cached"""
+        data = self.load_data(key)
+        if data is None:
+            return None
+
+        try:
+            return decode(data)
+        except ProgramFormatError as e:
+            self.discard(key, str(e))
+            return None
+
+    def load_data(self, key: str) -> bytes | None:
+        """Returns the cached program still encoded, None if it is not cached"""
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+
+        try:
+            os.utime(path)  # marks it as recently used
+        except OSError:
+            pass
+        return data
+
+    def discard(self, key: str, reason: str = "") -> None:
+        """Removes an entry, e.g. one that turned out to be unreadable"""
+        path = self.path(key)
+        logger.warning("Discarding cached program %s: %s", path.name, reason)
+        path.unlink(missing_ok=True)
+
+    def store(self, key: str, program: CompiledProgram) -> bool:
+        """Stores a program, returns False if it could not be stored"""
+        try:
+            data = encode(program)
+        except ProgramFormatError as e:
+            logger.debug("Program not cached: %s", e)
+            return False
+        return self.store_data(key, data)
+
+    def store_data(self, key: str, data: bytes) -> bool:
+        """Stores an already encoded program, returns False if it could not be stored"""
+        path = self.path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)  # atomic, concurrent readers never see a partial file
+        except OSError as e:
+            logger.warning("Could not cache compiled program: %s", e)
+            tmp_path.unlink(missing_ok=True)
+            return False
+
+        self._prune()
+        return True
+
+    def clear(self) -> None:
+        for path in self._entries():
+            path.unlink(missing_ok=True)
+
+    def _entries(self) -> List[Path]:
+        try:
+            return list(self.directory.glob("*" + CACHE_SUFFIX))
+        except OSError:
+            return []
+
+    def _prune(self) -> None:
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+        try:
+            entries.sort(key=lambda p: p.stat().st_mtime)
+        except OSError:
+            return
+        for path in entries[:len(entries) - self.max_entries]:
+            path.unlink(missing_ok=True)
+
+
+def compile_cached(compiler: Compiler, src_text: str, cache: ProgramCache | None, config: str = "") -> CompiledProgram | None:
+    """Returns the compiled program of src_text, loaded from the cache when possible, otherwise
+    compiled and then cached. config must describe the configuration of the compiler.
+    Returns None if compilation fails."""
+    if cache is None:
+        return compiler.compile_program(src_text)
+
+    key = cache.key(src_text, config)
+    program = cache.load(key)
+    if program is not None:
+        logger.info("Loaded compiled program from cache, %s instructions.", len(program.instructions))
+        return program
+
+    program = compiler.compile_program(src_text)
+    if program is not None:
+        cache.store(key, program)
+    return program
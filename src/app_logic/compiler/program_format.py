@@ -0,0 +1,475 @@
+"""
+Compact binary form of a compiled program, to store compiled scripts and load them without parsing.
+
+A program is stored as columns instead of objects: one opcode per instruction and the operands of
+all the instructions in two flat arrays, one for integers and one for floats. Strings (variable
+names, messages, labels) are kept once in a string pool and referenced by index.
+
+Layout, little endian:
+    header      magic (4 bytes), format version (u16), section count (u16)
+    sections    each one is a u32 byte length followed by its data:
+        0 strings       utf-8 of all the pooled strings, concatenated
+        1 string ends   u32 end offset of every string in section 0
+        2 types         u32 string index per opcode, the string is "ClassName:field,field"
+        3 opcodes       u8 per instruction
+        4 ints          i32 operands
+        5 floats        f64 operands
+        6 lines         i32 source line per instruction (-1 for initial instructions)
+        7 labels        u32 pairs (name string index, instruction index)
+
+Operands are written in field order. The type table stores the field names of every opcode:
+a program written by a version whose instructions have different fields is refused on load,
+instead of being decoded wrongly. Fields whose name starts with an underscore are runtime
+state (e.g. loop counters) and are not stored.
+
+Huge programs (e.g. hours of recording) can also be loaded without building their instructions
+(see CompactProgram): the columns are kept as they are and instructions are built when executed.
+"""
+
+from __future__ import annotations
+from typing import List, Dict, Tuple, Callable, Any, NamedTuple, Iterator, Sequence, get_type_hints, get_origin, get_args
+from array import array
+from enum import Enum
+from pathlib import Path
+import dataclasses
+import struct
+import sys
+
+from app_logic.virtual_machine.executor import Instruction
+from app_logic.instruction_set import ValueRef
+
+
+MAGIC = b"CLKP"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHH")
+_SECTION_LEN = struct.Struct("<I")
+_SECTIONS = 8
+
+# field kinds: how a field is stored in the operand columns
+_VALUE_REF = "v"    # floats: the literal, or NaN and then ints: the name index and the register slot
+_INT = "i"
+_FLOAT = "f"
+_BOOL = "b"
+_STR = "s"          # ints: string index
+_ENUM = "e"         # ints: string index of the member name
+_STR_LIST = "S"     # ints: length, then a string index per item
+_REF_LIST = "R"     # ints: length, then a value ref per item (see _VALUE_REF)
+
+_VARIABLE = float("nan")    # marks variable references in the floats, source literals are never NaN
+
+
+class ProgramFormatError(Exception):
+    """Raised when a program can not be stored, or the data is not a valid program for this version"""
+
+
+class CompiledProgram(NamedTuple):
+    """A compiled, post-processed program, with what is needed to map it back to the source"""
+    instructions: Sequence[Instruction]     # a list, or a CompactProgram (see decode)
+    line_table: Sequence[int]   # source line index of every instruction
+    labels: Dict[str, int]      # label name -> instruction index
+
+
+class _FieldLayout(NamedTuple):
+    name: str
+    kind: str
+    enum_type: type | None
+
+
+_LAYOUTS: Dict[type, Tuple[_FieldLayout, ...]] = {}
+
+def _field_kind(hint: Any) -> str:
+    if hint is ValueRef:
+        return _VALUE_REF
+    if hint is bool:    # before int, bool is a subclass of it
+        return _BOOL
+    if hint is int:
+        return _INT
+    if hint is float:
+        return _FLOAT
+    if hint is str:
+        return _STR
+    if isinstance(hint, type) and issubclass(hint, Enum):
+        return _ENUM
+    if get_origin(hint) is list and get_args(hint) == (str,):
+        return _STR_LIST
+    if get_origin(hint) is list and get_args(hint) == (ValueRef,):
+        return _REF_LIST
+    raise ProgramFormatError(f"fields of type {hint} can not be stored")
+
+def _layout(cls: type) -> Tuple[_FieldLayout, ...]:
+    """Stored fields of an instruction class, resolved once per class"""
+    layout = _LAYOUTS.get(cls)
+    if layout is None:
+        if dataclasses.is_dataclass(cls):
+            hints = get_type_hints(cls)
+            fields = []
+            for f in dataclasses.fields(cls):
+                if f.name.startswith("_"):
+                    continue
+                kind = _field_kind(hints[f.name])
+                fields.append(_FieldLayout(f.name, kind, hints[f.name] if kind == _ENUM else None))
+            layout = tuple(fields)
+        else:
+            layout = ()
+        _LAYOUTS[cls] = layout
+    return layout
+
+def _type_signature(cls: type) -> str:
+    return cls.__name__ + ":" + ",".join(f.name for f in _layout(cls))
+
+def _instruction_types() -> Dict[str, type]:
+    """All the instruction classes defined so far, by name"""
+    found: Dict[str, type] = {}
+    pending = [Instruction]
+    while pending:
+        for sub in pending.pop().__subclasses__():
+            found[sub.__name__] = sub
+            pending.append(sub)
+    return found
+
+
+def _instruction_builder(cls: type, fields: List[Tuple[str, Callable[[], Any]]]) -> Callable[[], Instruction]:
+    """Returns a function building an instruction of type cls, reading its fields from the operand
+    columns. Unrolled for the usual number of fields, it runs once per instruction."""
+    new = object.__new__
+
+    def build_generic() -> Instruction:
+        inst = new(cls)
+        inst.__dict__.update({name: read() for name, read in fields})
+        return inst
+
+    match fields:
+        case []:
+            return lambda: new(cls)
+        case [(n0, r0)]:
+            def build_1() -> Instruction:
+                inst = new(cls)
+                inst.__dict__[n0] = r0()
+                return inst
+            return build_1
+        case [(n0, r0), (n1, r1)]:
+            def build_2() -> Instruction:
+                inst = new(cls)
+                inst.__dict__.update({n0: r0(), n1: r1()})
+                return inst
+            return build_2
+        case [(n0, r0), (n1, r1), (n2, r2)]:
+            def build_3() -> Instruction:
+                inst = new(cls)
+                inst.__dict__.update({n0: r0(), n1: r1(), n2: r2()})
+                return inst
+            return build_3
+        case _:
+            return build_generic
+
+
+def _little_endian(arr: array) -> bytes:
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def encode(program: CompiledProgram) -> bytes:
+    """Serializes a compiled program. Raises ProgramFormatError if an instruction holds
+    something that can not be stored (e.g. a callback, or a value not matching its field type)."""
+    pool: Dict[str, int] = {}
+
+    def intern(s: str) -> int:
+        idx = pool.get(s)
+        if idx is None:
+            idx = pool[s] = len(pool)
+        return idx
+
+    opcode_of: Dict[type, int] = {}
+    opcodes, ints, floats = array("B"), array("i"), array("d")
+    add_int, add_float = ints.append, floats.append
+
+    def add_ref(ref: ValueRef) -> None:
+        if ref.literal is not None:
+            if ref.literal != ref.literal:
+                raise ProgramFormatError("NaN literals can not be stored")
+            add_float(ref.literal)
+        else:
+            add_float(_VARIABLE)
+            add_int(intern(ref.var_name))
+            add_int(ref.slot)
+
+    for inst in program.instructions:
+        cls = type(inst)
+        op = opcode_of.get(cls)
+        if op is None:
+            if len(opcode_of) > 0xFF:
+                raise ProgramFormatError("too many instruction types")
+            op = opcode_of[cls] = len(opcode_of)
+        opcodes.append(op)
+
+        try:
+            for name, kind, _ in _layout(cls):
+                val = getattr(inst, name)
+                if kind == _VALUE_REF:     # add_ref() inlined, most operands are value refs
+                    if val.literal is not None:
+                        if val.literal != val.literal:
+                            raise ProgramFormatError("NaN literals can not be stored")
+                        add_float(val.literal)
+                    else:
+                        add_float(_VARIABLE)
+                        add_int(intern(val.var_name))
+                        add_int(val.slot)
+                elif kind == _FLOAT:
+                    add_float(val)
+                elif kind == _STR:
+                    add_int(intern(val))
+                elif kind == _ENUM:
+                    add_int(intern(val.name))
+                elif kind == _STR_LIST:
+                    add_int(len(val))
+                    ints.extend(intern(s) for s in val)
+                elif kind == _REF_LIST:
+                    add_int(len(val))
+                    for ref in val:
+                        add_ref(ref)
+                else:   # int, bool
+                    add_int(int(val))
+        except (AttributeError, TypeError, ValueError, OverflowError) as e:
+            # a field holding something else than its type hint says, or out of the column range
+            raise ProgramFormatError(f"{inst} can not be stored: {e}")
+
+    types = array("I", [intern(_type_signature(cls)) for cls in opcode_of])
+    labels = array("I")
+    for name, idx in program.labels.items():
+        labels.extend((intern(name), idx))
+
+    encoded = [s.encode("utf-8") for s in pool]
+    ends, end = array("I"), 0
+    for b in encoded:
+        end += len(b)
+        ends.append(end)
+
+    sections = [
+        b"".join(encoded), _little_endian(ends), _little_endian(types), opcodes.tobytes(),
+        _little_endian(ints), _little_endian(floats), _little_endian(array("i", program.line_table)),
+        _little_endian(labels),
+    ]
+    out = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(sections))]
+    for section in sections:
+        out.append(_SECTION_LEN.pack(len(section)))
+        out.append(section)
+    return b"".join(out)
+
+
+def _split_sections(data: bytes) -> List[bytes]:
+    try:
+        magic, version, count = _HEADER.unpack_from(data)
+    except struct.error:
+        raise ProgramFormatError("not a compiled program")
+    if magic != MAGIC:
+        raise ProgramFormatError("not a compiled program")
+    if version != FORMAT_VERSION or count != _SECTIONS:
+        raise ProgramFormatError(f"unsupported program format version {version}")
+
+    sections, pos = [], _HEADER.size
+    for _ in range(count):
+        if pos + _SECTION_LEN.size > len(data):
+            raise ProgramFormatError("truncated program")
+        (length,) = _SECTION_LEN.unpack_from(data, pos)
+        pos += _SECTION_LEN.size
+        if pos + length > len(data):
+            raise ProgramFormatError("truncated program")
+        sections.append(data[pos:pos + length])
+        pos += length
+    return sections
+
+
+def decode(data: bytes, compact: bool = False) -> CompiledProgram:
+    """Rebuilds a program stored by encode(). The instructions are ready to run, already linked
+    and bound to their registers. With compact, they are a CompactProgram and the line table an
+    array: nothing is built per instruction.
+    Raises ProgramFormatError on invalid or incompatible data."""
+    try:
+        return _decode(data, compact)
+    except (ValueError, IndexError, KeyError, StopIteration) as e:    # also UnicodeDecodeError
+        raise ProgramFormatError(f"corrupted program data ({type(e).__name__})")
+
+def _strings(blob: bytes, ends_b: bytes) -> List[str]:
+    start, strings = 0, []
+    for end in _from_little_endian("I", ends_b):
+        strings.append(blob[start:end].decode("utf-8"))
+        start = end
+    return strings
+
+def _types(strings: List[str], types_b: bytes) -> List[type]:
+    """Instruction class of every opcode, checked against the stored signatures"""
+    known_types = _instruction_types()
+    types = []
+    for idx in _from_little_endian("I", types_b):
+        signature = strings[idx]
+        cls = known_types.get(signature.partition(":")[0])
+        if cls is None or _type_signature(cls) != signature:
+            raise ProgramFormatError(f"instruction {signature} is not supported by this version")
+        types.append(cls)
+    return types
+
+def _builders(types: List[type], strings: List[str], next_int: Callable[[], int], next_float: Callable[[], float],
+              literals: Dict[float, ValueRef] | None) -> List[Callable[[], Instruction]]:
+    """Builder of every opcode, reading the operands with next_int and next_float. Equal literal
+    refs are shared through literals (they are never modified), unless it is None."""
+
+    def read_ref() -> ValueRef:
+        value = next_float()
+        if value == value:
+            if not value or literals is None:
+                return ValueRef(value)  # 0.0 and -0.0 are equal keys, but print differently
+            ref = literals.get(value)
+            if ref is None:
+                ref = literals[value] = ValueRef(value)
+            return ref
+        ref = ValueRef.variable(strings[next_int()])    # NaN
+        ref.bind_slot(next_int())
+        return ref
+
+    def field_reader(kind: str, enum_type: type | None) -> Callable[[], Any]:
+        if kind == _VALUE_REF:
+            return read_ref
+        if kind == _FLOAT:
+            return next_float
+        if kind == _BOOL:
+            return lambda: next_int() != 0
+        if kind == _STR:
+            return lambda: strings[next_int()]
+        if kind == _ENUM:
+            return lambda: enum_type[strings[next_int()]]
+        if kind == _STR_LIST:
+            return lambda: [strings[next_int()] for _ in range(next_int())]
+        if kind == _REF_LIST:
+            return lambda: [read_ref() for _ in range(next_int())]
+        return next_int
+
+    return [_instruction_builder(cls, [(f.name, field_reader(f.kind, f.enum_type)) for f in _layout(cls)]) for cls in types]
+
+def _decode(data: bytes, compact: bool) -> CompiledProgram:
+    blob, ends_b, types_b, opcodes_b, ints_b, floats_b, lines_b, labels_b = _split_sections(data)
+    strings = _strings(blob, ends_b)
+    types = _types(strings, types_b)
+
+    instructions: Sequence[Instruction]
+    line_table: Sequence[int]
+    if compact:
+        instructions = CompactProgram(types, strings, opcodes_b, _from_little_endian("i", ints_b), _from_little_endian("d", floats_b))
+        line_table = _from_little_endian("i", lines_b)
+    else:
+        next_int: Callable[[], int] = iter(_from_little_endian("i", ints_b)).__next__
+        next_float: Callable[[], float] = iter(_from_little_endian("d", floats_b)).__next__
+        builders = _builders(types, strings, next_int, next_float, {})
+        instructions = [builders[op]() for op in opcodes_b]
+        line_table = _from_little_endian("i", lines_b).tolist()
+    label_pairs: Iterator[int] = iter(_from_little_endian("I", labels_b))
+    labels = {strings[name]: idx for name, idx in zip(label_pairs, label_pairs)}
+    if len(line_table) != len(instructions):
+        raise ProgramFormatError("corrupted line table")
+
+    return CompiledProgram(instructions, line_table, labels)
+
+
+class CompactProgram(Sequence[Instruction]):
+    """
+    Instructions of a program kept in the columns of the binary format: a few bytes per
+    instruction, instead of an object per instruction and per operand. An instruction is built
+    every time it is accessed, and dropped by the executor once it has run. Instructions with
+    runtime state (e.g. loop counters) are built once and kept, so that the state survives.
+
+    Built by decode(data, compact=True). The executor runs it without building the whole program
+    (see Executor.load_instructions).
+    """
+
+    def __init__(self, types: List[type], strings: List[str], opcodes: bytes, ints: array, floats: array) -> None:
+        self._opcodes = opcodes
+        self._int_at, self._float_at = _operand_offsets(types, opcodes, ints, floats)
+        self._cursor = [0, 0]   # next int and float operand of the instruction being built
+        cursor = self._cursor
+
+        def next_int() -> int:
+            pos = cursor[0]
+            cursor[0] = pos + 1
+            return ints[pos]
+
+        def next_float() -> float:
+            pos = cursor[1]
+            cursor[1] = pos + 1
+            return floats[pos]
+
+        self._builders = _builders(types, strings, next_int, next_float, None)
+        self._stateful = [any(f.name.startswith("_") for f in dataclasses.fields(cls)) if dataclasses.is_dataclass(cls) else False
+                          for cls in types]
+        self._live: Dict[int, Instruction] = {}     # built instructions with runtime state, by index
+
+    def __len__(self) -> int:
+        return len(self._opcodes)
+
+    def __getitem__(self, index):   # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._opcodes)))]
+        if index < 0:
+            index += len(self._opcodes)
+        op = self._opcodes[index]
+        if self._stateful[op]:
+            inst = self._live.get(index)
+            if inst is None:
+                inst = self._live[index] = self._build(op, index)
+            return inst
+        return self._build(op, index)
+
+    def _build(self, op: int, index: int) -> Instruction:
+        self._cursor[0] = self._int_at[index]
+        self._cursor[1] = self._float_at[index]
+        return self._builders[op]()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({len(self)} instructions)"
+
+
+def _operand_offsets(types: List[type], opcodes: bytes, ints: array, floats: array) -> Tuple[array, array]:
+    """Index of the first int and float operand of every instruction"""
+    kinds = [[f.kind for f in _layout(cls)] for cls in types]
+    int_at, float_at = array("I"), array("I")
+    ip = fp = 0
+    for op in opcodes:
+        int_at.append(ip)
+        float_at.append(fp)
+        for kind in kinds[op]:
+            if kind == _VALUE_REF:
+                if floats[fp] != floats[fp]:    # variable: name index and slot
+                    ip += 2
+                fp += 1
+            elif kind == _FLOAT:
+                fp += 1
+            elif kind == _STR_LIST:
+                ip += 1 + ints[ip]
+            elif kind == _REF_LIST:
+                count = ints[ip]
+                ip += 1
+                for _ in range(count):
+                    if floats[fp] != floats[fp]:
+                        ip += 2
+                    fp += 1
+            else:
+                ip += 1
+    if ip != len(ints) or fp != len(floats):
+        raise ProgramFormatError("corrupted operands")
+    return int_at, float_at
+
+
+def write_program(path: str | Path, program: CompiledProgram) -> None:
+    """Stores a compiled program to a file (e.g. to ship precompiled scripts)"""
+    Path(path).write_bytes(encode(program))
+
+def read_program(path: str | Path) -> CompiledProgram:
+    """Loads a program stored with write_program()"""
+    return decode(Path(path).read_bytes())
@@ -0,0 +1,93 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict, Iterable, Iterator, TypeAlias
+from enum import Enum
+
+
+COMMENT = ";"
+SYMBOLS = frozenset(("=", "+", "-", "*", "/"))
+_NUMBER_START = frozenset("0123456789+-.")  # words starting with anything else are never numbers
+
+
+class TokenKind(Enum):
+    NUMBER = "number"           # numeric literal, already parsed
+    IDENTIFIER = "identifier"   # any other word: commands, labels, variables, keywords, messages
+    SYMBOL = "symbol"           # operators of the var command
+
+
+# (kind, text, value): value is the parsed float of NUMBER tokens, None otherwise.
+# Plain tuples are used instead of a NamedTuple because building them is several times cheaper,
+# and tokenizing is the hottest part of compiling long recordings.
+Token: TypeAlias = Tuple[TokenKind, str, float | None]
+
+KIND = 0
+TEXT = 1
+VALUE = 2
+
+NUMBER = TokenKind.NUMBER
+IDENTIFIER = TokenKind.IDENTIFIER
+SYMBOL = TokenKind.SYMBOL
+
+
+def classify(word: str) -> Token:
+    """Classifies a single word into a token"""
+    if word in SYMBOLS:
+        return (SYMBOL, word, None)
+    if word and word[0] in _NUMBER_START:
+        try:
+            return (NUMBER, word, float(word))
+        except ValueError:
+            pass
+    return (IDENTIFIER, word, None)
+
+
+def tokenize_line(line: str, known_words: Dict[str, Token] | None = None) -> List[Token]:
+    """Splits a source line into tokens, dropping comments and whitespace. Returns an empty list for blank lines.
+    If known_words is given, words found there reuse their token, and new words are added to it."""
+    cut = line.find(COMMENT)
+    words = (line[:cut] if cut >= 0 else line).split()
+    if known_words is None:
+        return [classify(word) for word in words]
+
+    get_word = known_words.get
+    tokens = [get_word(word) for word in words]
+    if None in tokens:
+        for i, word in enumerate(words):
+            if tokens[i] is None:
+                tokens[i] = known_words[word] = classify(word)
+    return tokens
+
+
+def tokenize(lines: Iterable[str]) -> Iterator[Tuple[int, List[Token]]]:
+    """Single pass over the source lines, yields (line index, tokens) for every non blank line.
+
+    Tokens are immutable, so every distinct word is classified only once and its token is
+    shared by all its occurrences: recordings repeat the same few commands, coordinates and
+    wait times over and over, so most words are a single dict lookup. For the same reason,
+    whole lines that were already seen (clicks, waits) reuse their token list: consumers must
+    not modify the lists they receive."""
+    known_words: Dict[str, Token] = {}
+    known_lines: Dict[str, List[Token]] = {}
+    get_word = known_words.get
+    get_line = known_lines.get
+
+    def classify_new(word: str) -> Token:
+        token = known_words[word] = classify(word)
+        return token
+
+    for line_i, line in enumerate(lines):
+        tokens = get_line(line)
+        if tokens is None:
+            cut = line.find(COMMENT)
+            tokens = known_lines[line] = [
+                get_word(word) or classify_new(word) for word in (line[:cut] if cut >= 0 else line).split()
+            ]
+        if tokens:
+            yield line_i, tokens
+
+
+def join_tokens(tokens: List[Token]) -> Token:
+    """Merges several tokens into a single one, as the words were separated by single spaces.
+    Used for the last argument of a command, which takes the rest of the line (e.g. print)."""
+    if len(tokens) == 1:
+        return tokens[0]
+    return (IDENTIFIER, " ".join(t[TEXT] for t in tokens), None)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from typing import Tuple, Dict, Callable
+from abc import ABC, abstractmethod
+from enum import Enum
+import logging
+
+logger = logging.getLogger("Runtime")
+
+
+class MouseButton(Enum):
+    LEFT = "left"
+    RIGHT = "right"
+    MIDDLE = "middle"
+
+
+class BackendUnavailableError(RuntimeError):
+    """Raised when an input backend cannot be created on this machine (missing package, no display...)"""
+
+
+class InputBackend(ABC):
+    """
+    Interface between the instruction set and the OS input system.
+    All the instructions that read or drive the mouse go through an InputBackend instead of
+    calling pyautogui directly, so that the implementation can be swapped.
+
+    Implementations must not add any artificial delay: every call should return as soon
+    as the OS has been told what to do. Timed movements are implemented by the instruction set
+    on top of move_to.
+    """
+
+    name: str = "?"
+
+    @abstractmethod
+    def position(self) -> Tuple[int, int]:
+        """Returns the current cursor position"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def screen_size(self) -> Tuple[int, int]:
+        """Returns the (width, height) of the main screen"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def move_to(self, x: int, y: int) -> None:
+        """Moves the cursor to an absolute position, instantly"""
+        raise NotImplementedError
+
+    def move_rel(self, dx: int, dy: int) -> None:
+        """Moves the cursor relative to its current position, instantly"""
+        x, y = self.position()
+        self.move_to(x + dx, y + dy)
+
+    @abstractmethod
+    def click(self, button: MouseButton, clicks: int = 1) -> None:
+        """Clicks the given button `clicks` times at the current position"""
+        raise NotImplementedError
+
+    def invalidate(self) -> None:
+        """Drops any cached state, so that the next query reaches the OS"""
+        pass
+
+
+class NullBackend(InputBackend):
+    """Backend that does not talk to the OS at all, it just remembers where the cursor should be.
+    Used as a baseline by benchmarks and for dry runs."""
+
+    name = "null"
+
+    def __init__(self, screen: Tuple[int, int] = (1920, 1080)) -> None:
+        self._screen = screen
+        self._pos = (screen[0] // 2, screen[1] // 2)
+
+    def position(self) -> Tuple[int, int]:
+        return self._pos
+
+    def screen_size(self) -> Tuple[int, int]:
+        return self._screen
+
+    def move_to(self, x: int, y: int) -> None:
+        self._pos = (x, y)
+
+    def move_rel(self, dx: int, dy: int) -> None:
+        self._pos = (self._pos[0] + dx, self._pos[1] + dy)
+
+    def click(self, button: MouseButton, clicks: int = 1) -> None:
+        pass
+
+
+# ----------------------
+# Registry
+# ----------------------
+
+def _make_pyautogui() -> InputBackend:
+    from .pyautogui_backend import PyAutoGuiBackend
+    return PyAutoGuiBackend()
+
+def _make_pynput() -> InputBackend:
+    from .pynput_backend import PynputBackend
+    return PynputBackend()
+
+def _make_xtest() -> InputBackend:
+    from .xtest_backend import XTestBackend
+    return XTestBackend()
+
+def _make_simulated() -> InputBackend:
+    from .simulated_backend import SimulatedBackend
+    return SimulatedBackend()
+
+# backends are imported lazily, so that optional dependencies are only needed when selected
+BACKEND_FACTORIES: Dict[str, Callable[[], InputBackend]] = {
+    "pyautogui": _make_pyautogui,
+    "pynput": _make_pynput,
+    "xtest": _make_xtest,
+    "null": NullBackend,
+    "simulated": _make_simulated,
+}
+
+DEFAULT_BACKEND = "pyautogui"
+
+
+def get_backend(name: str) -> InputBackend:
+    """Creates the input backend registered as `name`. Raises BackendUnavailableError if
+    the backend is unknown or cannot be used on this machine."""
+    factory = BACKEND_FACTORIES.get(name)
+    if factory is None:
+        raise BackendUnavailableError(f"Unknown input backend '{name}'")
+
+    try:
+        backend = factory()
+    except ImportError as e:
+        raise BackendUnavailableError(f"Input backend '{name}' is not available: {e}") from e
+
+    logger.debug(f"Using input backend '{name}'")
+    return backend
@@ -0,0 +1,77 @@
+from __future__ import annotations
+from typing import Tuple
+import logging
+import time
+
+from .backend import InputBackend, MouseButton
+
+logger = logging.getLogger("Runtime")
+
+DEFAULT_RESYNC_MS = 200
+
+
+class CursorState(InputBackend):
+    """
+    Cursor / display state model owned by the runtime, wrapping the real input backend.
+
+    Remembers where the runtime last put the cursor and caches the screen geometry, so that
+    reading the position (history, relative moves, $MOUSE_X...) does not cost an OS round trip.
+    The tracked position is reconciled with the real one only:
+    - when invalidate() has been called (e.g. by the pause instruction)
+    - when it is older than resync_interval_ms (0 means always ask the OS)
+    - when the runtime moved the cursor off the main screen
+
+    While reconciling, a difference between the tracked and the real position means the cursor
+    was moved by something else than the script (usually the user), and is logged.
+    """
+
+    def __init__(self, backend: InputBackend, resync_interval_ms: int = DEFAULT_RESYNC_MS) -> None:
+        self.backend = backend
+        self.name = backend.name
+        self._resync_ns = max(0, resync_interval_ms) * 1_000_000
+        self._pos: Tuple[int, int] | None = None
+        self._synced_at = 0
+        self._screen: Tuple[int, int] | None = None
+
+    def invalidate(self) -> None:
+        self._pos = None
+
+    def reconcile(self) -> bool:
+        """Reads the real cursor position from the OS. Returns True if the cursor
+        was moved externally since the last time the runtime moved it."""
+        real = self.backend.position()
+        interfered = self._pos is not None and real != self._pos
+        if interfered:
+            logger.debug(f"Cursor was moved externally, expected {self._pos}, found {real}")
+
+        self._pos = real
+        self._synced_at = time.perf_counter_ns()
+        return interfered
+
+    def position(self) -> Tuple[int, int]:
+        if self._pos is None or time.perf_counter_ns() - self._synced_at >= self._resync_ns:
+            self.reconcile()
+        assert self._pos is not None
+        return self._pos
+
+    def screen_size(self) -> Tuple[int, int]:
+        if self._screen is None:
+            self._screen = self.backend.screen_size()
+        return self._screen
+
+    def move_to(self, x: int, y: int) -> None:
+        self.backend.move_to(x, y)
+        w, h = self.screen_size()
+        if 0 <= x < w and 0 <= y < h:
+            self._pos = (x, y)
+        else:
+            # the OS stops the cursor at the edge of the screen (or moves it to another one),
+            # only it knows where it ended up
+            self._pos = None
+
+    def move_rel(self, dx: int, dy: int) -> None:
+        x, y = self.position()
+        self.move_to(x + dx, y + dy)
+
+    def click(self, button: MouseButton, clicks: int = 1) -> None:
+        self.backend.click(button, clicks)
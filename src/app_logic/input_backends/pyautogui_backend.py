@@ -0,0 +1,37 @@
+from typing import Tuple
+
+import pyautogui as gui
+
+from .backend import InputBackend, MouseButton
+
+
+class PyAutoGuiBackend(InputBackend):
+    """Input backend built on pyautogui, with its artificial delays disabled.
+
+    pyautogui sleeps PAUSE seconds (0.1 by default) after every call and checks the failsafe
+    corner before it, which costs an additional position query. Both are turned off
+    for the whole process; the runner provides its own ESC quitter instead.
+    """
+
+    name = "pyautogui"
+
+    def __init__(self) -> None:
+        gui.PAUSE = 0
+        gui.FAILSAFE = False
+
+    def position(self) -> Tuple[int, int]:
+        x, y = gui.position()
+        return int(x), int(y)
+
+    def screen_size(self) -> Tuple[int, int]:
+        w, h = gui.size()
+        return int(w), int(h)
+
+    def move_to(self, x: int, y: int) -> None:
+        gui.moveTo(x, y, _pause=False)
+
+    def move_rel(self, dx: int, dy: int) -> None:
+        gui.moveRel(dx, dy, _pause=False)
+
+    def click(self, button: MouseButton, clicks: int = 1) -> None:
+        gui.click(button=button.value, clicks=clicks, interval=0, _pause=False)
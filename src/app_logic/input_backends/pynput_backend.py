@@ -0,0 +1,43 @@
+from typing import Tuple
+
+from pynput.mouse import Controller, Button
+
+from .backend import InputBackend, MouseButton
+
+
+_BUTTONS = {
+    MouseButton.LEFT: Button.left,
+    MouseButton.RIGHT: Button.right,
+    MouseButton.MIDDLE: Button.middle,
+}
+
+
+class PynputBackend(InputBackend):
+    """Input backend built on the pynput mouse Controller, which has no artificial delays."""
+
+    name = "pynput"
+
+    def __init__(self) -> None:
+        self._mouse = Controller()
+        self._screen: Tuple[int, int] | None = None
+
+    def position(self) -> Tuple[int, int]:
+        x, y = self._mouse.position
+        return int(x), int(y)
+
+    def screen_size(self) -> Tuple[int, int]:
+        # pynput has no screen API, pyautogui is already a dependency of the app
+        if self._screen is None:
+            import pyautogui
+            w, h = pyautogui.size()
+            self._screen = (int(w), int(h))
+        return self._screen
+
+    def move_to(self, x: int, y: int) -> None:
+        self._mouse.position = (x, y)
+
+    def move_rel(self, dx: int, dy: int) -> None:
+        self._mouse.move(dx, dy)
+
+    def click(self, button: MouseButton, clicks: int = 1) -> None:
+        self._mouse.click(_BUTTONS[button], clicks)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+from typing import Tuple, List, NamedTuple
+import logging
+
+from .backend import InputBackend, MouseButton
+from app_logic.virtual_machine.scheduler import VirtualClock, VirtualScheduler, LatePolicy
+
+logger = logging.getLogger("Runtime")
+
+
+class SimulatedAction(NamedTuple):
+    """One entry of the action log of a SimulatedBackend"""
+    t_ns: int       # virtual time of the action
+    action: str     # "move" or "click"
+    x: int
+    y: int
+    detail: str = ""    # clicked button and count
+
+
+class SimulatedBackend(InputBackend):
+    """
+    Backend that drives a virtual screen instead of the OS: it keeps the cursor position,
+    the screen size and a log of every action, timestamped with a VirtualClock.
+
+    Paired with a VirtualScheduler on the same clock (see attach()), waits and timed moves
+    cost no real time, so hours long scripts run in milliseconds and produce the exact
+    action log they would produce on a real screen. Used for dry runs, runtime estimates and
+    regression testing of scripts without a display.
+    """
+
+    name = "simulated"
+
+    def __init__(self, screen: Tuple[int, int] = (1920, 1080), clock: VirtualClock | None = None,
+                 log_moves: bool = True) -> None:
+        self.clock = clock if clock is not None else VirtualClock()
+        self.log_moves = log_moves  # glides produce one move per frame, can be turned off for long scripts
+        self.actions: List[SimulatedAction] = []
+        self._screen = screen
+        self._pos = (screen[0] // 2, screen[1] // 2)
+
+    def attach(self, executor, policy: LatePolicy = LatePolicy.SKIP):
+        """Makes executor use this backend and a virtual timeline on its clock. Returns the executor."""
+        return executor.set_input_backend(self).set_scheduler(VirtualScheduler(self.clock, policy))
+
+    def position(self) -> Tuple[int, int]:
+        return self._pos
+
+    def screen_size(self) -> Tuple[int, int]:
+        return self._screen
+
+    def move_to(self, x: int, y: int) -> None:
+        # like the OS, the cursor cannot leave the screen
+        x = min(max(0, x), self._screen[0] - 1)
+        y = min(max(0, y), self._screen[1] - 1)
+        self._pos = (x, y)
+        if self.log_moves:
+            self.actions.append(SimulatedAction(self.clock.now_ns(), "move", x, y))
+
+    def click(self, button: MouseButton, clicks: int = 1) -> None:
+        self.actions.append(SimulatedAction(self.clock.now_ns(), "click", *self._pos, f"{button.value} x{clicks}"))
+
+    def clicks(self) -> List[SimulatedAction]:
+        return [a for a in self.actions if a.action == "click"]
+
+    def format_log(self) -> str:
+        """Action log, one line per action: virtual time, action, position"""
+        return "\n".join(
+            f"{a.t_ns / 1e9:>12.3f} s  {a.action:<5} {a.x:>5} {a.y:>5}  {a.detail}".rstrip() for a in self.actions
+        )
+
+    def write_log(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.format_log() + "\n")
@@ -0,0 +1,55 @@
+from typing import Tuple
+
+from Xlib import X, display as xdisplay, error as xerror
+from Xlib.ext import xtest
+
+from .backend import InputBackend, MouseButton, BackendUnavailableError
+
+
+_BUTTONS = {
+    MouseButton.LEFT: 1,
+    MouseButton.MIDDLE: 2,
+    MouseButton.RIGHT: 3,
+}
+
+
+class XTestBackend(InputBackend):
+    """Input backend that injects events through the X11 XTest extension (python-xlib,
+    installed together with pynput on Linux).
+
+    Motion and button events are only flushed, not synced, so driving the mouse costs
+    no round trip to the X server; only position() waits for a reply.
+    """
+
+    name = "xtest"
+
+    def __init__(self) -> None:
+        try:
+            self._display = xdisplay.Display()
+        except (xerror.DisplayError, xerror.XError) as e:
+            raise BackendUnavailableError(f"Cannot connect to the X server: {e}") from e
+
+        if not self._display.has_extension("XTEST"):
+            raise BackendUnavailableError("The X server does not support the XTEST extension")
+
+        screen = self._display.screen()
+        self._root = screen.root
+        self._screen = (int(screen.width_in_pixels), int(screen.height_in_pixels))
+
+    def position(self) -> Tuple[int, int]:
+        pointer = self._root.query_pointer()
+        return int(pointer.root_x), int(pointer.root_y)
+
+    def screen_size(self) -> Tuple[int, int]:
+        return self._screen
+
+    def move_to(self, x: int, y: int) -> None:
+        xtest.fake_input(self._display, X.MotionNotify, x=x, y=y)
+        self._display.flush()
+
+    def click(self, button: MouseButton, clicks: int = 1) -> None:
+        detail = _BUTTONS[button]
+        for _ in range(clicks):
+            xtest.fake_input(self._display, X.ButtonPress, detail)
+            xtest.fake_input(self._display, X.ButtonRelease, detail)
+        self._display.flush()
@@ -1,31 +1,68 @@
 from __future__ import annotations
 from typing import Dict, Tuple, List, Any, TypedDict, cast, overload, TypeVar, Type, Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from array import array
 import time
 from enum import Enum
 import logging
 import re
 import time
 
-import pyautogui as gui
 from pynput import keyboard
 
 from app_logic.virtual_machine.executor import Executor, Instruction, HaltExecution
+from app_logic.input_backends.backend import InputBackend, MouseButton, get_backend, DEFAULT_BACKEND
+from app_logic.input_backends.cursor_state import CursorState
 
 
 MAX_STACK_SIZE = 4096   # pc stack used for call / return
+GLIDE_STEP_S = 0.01     # time between two cursor updates of a timed movement
+DEFAULT_HISTORY_DEPTH = 1000    # positions remembered for goback
 
 ##### Utility classes
 
+class MovementHistory:
+    """
+    Fixed capacity stack of cursor positions, used by goback.  
+    Positions are stored in a preallocated ring buffer: once it is full, pushing a new
+    position overwrites the oldest one, so memory never grows during a run.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_HISTORY_DEPTH):
+        self.capacity = max(1, capacity)
+        self._buf = array('i', bytes(2 * self.capacity * array('i').itemsize))   # x, y pairs
+        self._top = 0   # entry where the next position is written
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, pos: Tuple[int, int]):
+        i = 2 * self._top
+        self._buf[i] = pos[0]
+        self._buf[i + 1] = pos[1]
+        self._top = (self._top + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def pop(self) -> Tuple[int, int] | None:
+        if self._size == 0:
+            return None
+        self._top = (self._top - 1) % self.capacity
+        self._size -= 1
+        i = 2 * self._top
+        return self._buf[i], self._buf[i + 1]
+
 class SharedRuntimeDict(TypedDict):
     """Defines the structure of the shared memory dictionary
     """
-    mov_history: List[tuple[int, int]]
+    mov_history: MovementHistory | None    # None when the program never uses goback
     pc_stack: List[int]
     safe_mode: bool
-    vars: Dict[str, float]
+    regs: List[float | None]    # register file, one slot per variable name (assigned at compile time)
     logger: logging.Logger
     offset: Tuple[int, int]
+    input: InputBackend
 
 class VarMathOperations(Enum):
     SUM = 'sum'
@@ -45,14 +82,20 @@ class ValueRef:
 
     Pass either a string or a float|int on initialization; if the string can be successfully
     parsed into a number or a number is give, stores a literal value, otherwise, assume
-    the string name is a reference to a runtime variable located in the shared dict.  
+    the string name is a reference to a runtime variable.  
+    Variables are resolved by the compiler to a fixed slot of the register file (see bind_slot),
+    special variables (like $MOUSE_X) to a dedicated reader function, that only runs when the
+    variable is actually read.
     
     Call the object to get the referenced value.
     """
 
     literal: float | None
-    var_name: str
+    var_name: str = ""
+    slot: int = -1      # register file slot, assigned by the compiler
+    special: Callable[[SharedRuntimeDict], float] | None = None
     SHARED_DICT: SharedRuntimeDict
+    REGISTERS: List[float | None]
 
     def __init__(self, input: str | float):
         if isinstance(input, (float, int)):
@@ -72,22 +115,51 @@ class ValueRef:
         else:
             raise RuntimeError("ValueRef was initialized with a neither string / float value")
     
+    @classmethod
+    def variable(cls, name: str) -> ValueRef:
+        """Reference to the variable `name`, skipping the number parsing attempt"""
+        ref = cls.__new__(cls)
+        ref.literal = None
+        ref.var_name = name
+        return ref
+
+    @classmethod
+    def from_token(cls, token: Tuple[Any, str, float | None]) -> ValueRef:
+        """Builds the reference from a compiler token (kind, text, value): numbers are already parsed"""
+        value = token[2]
+        if value is None:
+            return cls.variable(token[1])
+        ref = cls.__new__(cls)
+        ref.literal = value
+        return ref
+
     def __repr__(self) -> str:
         return self.__class__.__name__ + (f"(var={self.var_name})" if self.literal is None else f"(literal={self.literal})" )
     
     def __call__(self) -> float:
-        return self.value
+        if self.literal is not None:
+            return self.literal
+        if self.special is not None:
+            return self.special(self.SHARED_DICT)
+        return _get_register(self.REGISTERS, self.slot, self.var_name)
 
     @property
     def value(self) -> float:
         """Return the resolved value."""
-        if self.literal is not None:
-            return self.literal
-        return _get_variable(self.SHARED_DICT, self.var_name)
+        return self()
+
+    def is_variable(self) -> bool:
+        return self.literal is None
+
+    def bind_slot(self, slot: int):
+        """Binds the referenced variable to a register slot (or to its reader, for special variables)"""
+        self.special = SPECIAL_VARIABLES.get(self.var_name)
+        self.slot = -1 if self.special else slot
 
     @classmethod
     def bind_shared_runtime_dict(cls, shared_dict: SharedRuntimeDict):
         cls.SHARED_DICT = shared_dict
+        cls.REGISTERS = shared_dict["regs"]
 
 
 ## Utility memory functions
@@ -115,30 +187,35 @@ def _is_valid_var_name(name: str) -> bool:
 
 
 
-def _get_variable(shared: SharedRuntimeDict, name: str) -> float:
-    specials = {
-        '$MOUSE_X' : gui.position()[0],
-        '$MOUSE_Y' : gui.position()[1],
-        '$OFFSET_X': shared["offset"][0],
-        '$OFFSET_Y': shared["offset"][1]
-    }
-    if name in specials:
-        return specials[name]
+# special read-only variables, each one only queries what it needs when it is read
+SPECIAL_VARIABLES: Dict[str, Callable[[SharedRuntimeDict], float]] = {
+    '$MOUSE_X' : lambda shared: shared["input"].position()[0],
+    '$MOUSE_Y' : lambda shared: shared["input"].position()[1],
+    '$OFFSET_X': lambda shared: shared["offset"][0],
+    '$OFFSET_Y': lambda shared: shared["offset"][1]
+}
 
-    val = shared["vars"].get(name)
+def _get_register(regs: List[float | None], slot: int, name: str) -> float:
+    if slot < 0:
+        raise RuntimeError(f"Variable '{name}' was not assigned a register slot")
+
+    val = regs[slot]
     if val is None:
         raise RuntimeError(f"Undefined variable '{name}'")
     return val
 
-def _set_variable(shared: SharedRuntimeDict, name: str, val: float):
-    shared["vars"][name] = val
+def _set_register(shared: SharedRuntimeDict, slot: int, val: float):
+    shared["regs"][slot] = val
 
 def _add_to_history(shared: SharedRuntimeDict):
-    shared["mov_history"].append(gui.position())
+    history = shared["mov_history"]
+    if history is not None:
+        history.push(shared["input"].position())
 
 def _get_from_hystory(shared: SharedRuntimeDict) -> Tuple[int, int] | None:
-    if len(shared["mov_history"]) > 0:
-        return shared["mov_history"].pop(-1)
+    history = shared["mov_history"]
+    if history is not None:
+        return history.pop()
 
 def _set_new_offset(shared: SharedRuntimeDict, pos: Tuple[int, int]):
     shared["offset"] = pos
@@ -168,6 +245,21 @@ def _get_safemode(shared: SharedRuntimeDict) -> bool:
 def _getshrdict(executor: Executor) -> SharedRuntimeDict:
     return cast(SharedRuntimeDict, executor.shared)
 
+def _input(executor: Executor) -> InputBackend:
+    return _getshrdict(executor)["input"]
+
+def _glide_to(executor: Executor, target: Tuple[int, int], duration: float):
+    """Moves the cursor to target linearly over duration seconds (instantly if duration is 0).
+    Frames follow the executor deadline scheduler, so timed moves do not drift either."""
+    backend = _input(executor)
+    if duration <= 0:
+        backend.move_to(*target)
+        return
+
+    start_x, start_y = backend.position()
+    for t in executor.scheduler.frames(duration, GLIDE_STEP_S):
+        backend.move_to(int(start_x + (target[0] - start_x) * t), int(start_y + (target[1] - start_y) * t))
+
 def _point(x: int | float, y: int | float) -> Tuple[int, int]:
     """Convert two arguments to tuple of integer representing point on screen"""
     return int(x), int(y)
@@ -178,14 +270,19 @@ def _point(x: int | float, y: int | float) -> Tuple[int, int]:
 class SetupAndStart(Instruction):
     """ Sets up all the shared memory properties to work for all the commands """
 
+    register_names: List[str] = field(default_factory=list)  # variable name of each register slot, set by the compiler
+    history_depth: int = DEFAULT_HISTORY_DEPTH
+    track_history: bool = True  # turned off by the compiler when the program contains no goback
+
     def execute(self, executor: Executor):
         shared: SharedRuntimeDict = _getshrdict(executor)
-        shared["mov_history"] = []     # creates history list
+        shared["mov_history"] = MovementHistory(self.history_depth) if self.track_history else None
         shared["pc_stack"] = []    # used with call / return to remember pc
         _set_new_offset(shared, (0,0))
         shared["safe_mode"] = False
-        shared["vars"] = {}    # variables dict
+        shared["regs"] = [None] * len(self.register_names)   # register file
         shared["logger"] = executor.logger_internal
+        shared["input"] = executor.input_backend or CursorState(get_backend(DEFAULT_BACKEND))
         ValueRef.bind_shared_runtime_dict(shared)    # set the class variable to the shared dictionary, so all val_ref objects have access to it
 
 ### =================================== App Instructions ===================================
@@ -197,14 +294,14 @@ class MouseCenter(Instruction):
         _add_to_history(_getshrdict(executor))  # tracks history
 
         # Get screen width and height
-        screen_width, screen_height = gui.size()
+        screen_width, screen_height = _input(executor).screen_size()
 
         # Calculate center coordinates
         center_x = screen_width // 2
         center_y = screen_height // 2
 
         # Move mouse to center
-        gui.moveTo(center_x, center_y)
+        _input(executor).move_to(center_x, center_y)
 
 @dataclass
 class MouseMove(Instruction):
@@ -218,9 +315,7 @@ class MouseMove(Instruction):
         _add_to_history(_getshrdict(executor))  # tracks history
     
         new_pos = _offset_point(_getshrdict(executor), _point(self.x(), self.y()))
-        gui.moveTo(new_pos, duration=self.time)
-
-        pos = gui.position()
+        _glide_to(executor, new_pos, self.time)
 
 
 @dataclass
@@ -234,7 +329,14 @@ class MouseMoveRel(Instruction):
     def execute(self, executor: Executor):
         _add_to_history(_getshrdict(executor))  # tracks history
 
-        gui.moveRel(self.x(), self.y(), self.time)
+        backend = _input(executor)
+        dx, dy = _point(self.x(), self.y())
+        if self.time <= 0:
+            backend.move_rel(dx, dy)
+            return
+
+        x, y = backend.position()
+        _glide_to(executor, (x + dx, y + dy), self.time)
 
 
 class MouseGoBack(Instruction):
@@ -248,13 +350,13 @@ class MouseGoBack(Instruction):
             executor.logger_internal.debug("Movement history is empty, cannot go back.")
             return
     
-        gui.moveTo(pos)
+        _input(executor).move_to(*pos)
 
 class SetMouseOffset(Instruction):
     """Sets mouse coordinate origin to current mouse position"""
 
     def execute(self, executor: Executor):
-        _set_new_offset(_getshrdict(executor), gui.position())
+        _set_new_offset(_getshrdict(executor), _input(executor).position())
 
 class ClearMouseOffset(Instruction):
     """Clears mouse position offset"""
@@ -270,20 +372,39 @@ class MouseLeftClick(Instruction):
 
     def execute(self, executor: Executor):
         if _get_safemode(_getshrdict(executor)): return  
-        gui.leftClick()
+        _input(executor).click(MouseButton.LEFT)
 
 class MouseRightClick(Instruction):
     """Right click the mouse in the current location"""
 
     def execute(self, executor: Executor):
         if _get_safemode(_getshrdict(executor)): return 
-        gui.rightClick()
+        _input(executor).click(MouseButton.RIGHT)
 
 class MouseDoubleClick(Instruction):
     """Double click the mouse in the current location"""
     def execute(self, executor: Executor):
         if _get_safemode(_getshrdict(executor)): return
-        gui.doubleClick()
+        _input(executor).click(MouseButton.LEFT, 2)
+
+@dataclass
+class MouseMoveClick(Instruction):
+    """Moves the mouse to a coordinate, then clicks there. Superinstruction built by the
+    optimizer from a move followed by a click (see compiler/optimizer.py), never written by hand"""
+
+    x: ValueRef
+    y: ValueRef
+    time: float = 0.0
+    button: MouseButton = MouseButton.LEFT
+    count: int = 1
+
+    def execute(self, executor: Executor):
+        shared = _getshrdict(executor)
+        _add_to_history(shared)  # tracks history
+
+        _glide_to(executor, _offset_point(shared, _point(self.x(), self.y())), self.time)
+        if _get_safemode(shared): return
+        shared["input"].click(self.button, self.count)
 
 
 ### --------------- WAITING ---------------
@@ -295,7 +416,7 @@ class Wait(Instruction):
     time_s: ValueRef
 
     def execute(self, executor: Executor):
-        time.sleep(self.time_s())
+        executor.scheduler.wait(self.time_s())
 
 class Pause(Instruction):
     """Pauses """
@@ -306,6 +427,7 @@ class Pause(Instruction):
 
     def execute(self, executor: Executor):
        """Pauses executor"""
+       _input(executor).invalidate()    # the user will likely move the mouse while paused
        executor.pause()
 
 
@@ -393,19 +515,46 @@ class EndProgram(HaltExecution):
 @dataclass
 class PrintVar(Instruction):
     var_name: str
+    val: ValueRef
 
     def execute(self, executor: Executor):
-        val = _get_variable(_getshrdict(executor), self.var_name)
-        executor.logger_internal.info(f"{self.var_name} = {val}")
+        executor.logger_internal.info(f"{self.var_name} = {self.val()}")
 
 
 @dataclass
 class SetVar(Instruction):
     var_name: str
     val: ValueRef
+    slot: int = -1  # register slot of var_name, assigned at post-processing
+
+    def execute(self, executor: Executor):
+        _set_register(_getshrdict(executor), self.slot, self.val())
+
+@dataclass
+class SetVarExpr(Instruction):
+    """Assigns the value of an arithmetic expression (see compiler/expressions.py). The whole
+    expression runs as one compiled closure, bound to the register slots on first execution"""
+
+    var_name: str
+    expression: str
+    operands: List[ValueRef]    # variables read by the expression, in order of appearance
+    slot: int = -1  # register slot of var_name, assigned at post-processing
+    _evaluate: Callable[[List[float | None], SharedRuntimeDict], float] | None = field(default=None, repr=False, compare=False)
 
     def execute(self, executor: Executor):
-        _set_variable(_getshrdict(executor), self.var_name, self.val())
+        shared = _getshrdict(executor)
+        evaluate = self._evaluate
+        if evaluate is None:
+            from app_logic.compiler.expressions import link     # the compiler imports this module
+            evaluate = self._evaluate = link(self.expression, self.operands)
+
+        try:
+            value = evaluate(shared["regs"], shared)
+        except TypeError:
+            for ref in self.operands:   # an undefined variable was read, raises its error
+                ref()
+            raise
+        _set_register(shared, self.slot, value)
 
 @dataclass
 class VarMath(Instruction):
@@ -413,6 +562,7 @@ class VarMath(Instruction):
     l_val: ValueRef
     r_val: ValueRef
     opcode: VarMathOperations
+    out_slot: int = -1  # register slot of out_var_name, assigned at post-processing
 
     def execute(self, executor: Executor):
         match self.opcode:
@@ -427,6 +577,6 @@ class VarMath(Instruction):
             case _:
                 raise RuntimeError(f"Unknown var math opcode {self.opcode}")
 
-        _set_variable(_getshrdict(executor), self.out_var_name, out)
+        _set_register(_getshrdict(executor), self.out_slot, out)
 
 
@@ -1,9 +1,14 @@
 from __future__ import annotations
-from typing import Tuple, Iterable, Dict, Callable
+from typing import Tuple, Iterable, Sequence, Dict, Callable, List, Any
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from enum import Enum
 import logging
 import threading
+import time
+
+from app_logic.input_backends.backend import InputBackend
+from .scheduler import DeadlineScheduler, LatePolicy
 
 logger = logging.getLogger("Runtime")
 
@@ -27,21 +32,79 @@ class HaltExecution(Instruction):
         return None
 
 
+class ExecutionStopped(Exception):
+    """Raised inside blocking instructions when execution is stopped while they wait"""
+
+
+class RunOutcome(Enum):
+    """How the last execution ended"""
+    FINISHED = "finished"   # reached the end of the program or a halting instruction
+    STOPPED = "stopped"     # stopped from outside with Executor.stop()
+    FAILED = "failed"       # an instruction raised an exception
+
+
+class DispatchMode(Enum):
+    """Selects the main loop used by Executor.execute"""
+    INTERPRETED = "interpreted"     # checks pause / halt and logs on every instruction
+    THREADED = "threaded"           # program is linked once into a flat list of bound callables
+    COMPILED = "compiled"           # program is translated to one generated Python function (see transpiler.py)
+
+
+class ExecutionInstrument(ABC):
+    """Observes a run from inside the threaded dispatch loop (e.g. a profiler). Instruments
+    wrap the linked op of every instruction, so they cost nothing when none is attached."""
+
+    def begin(self, executor: Executor):
+        """Called before the first instruction is dispatched"""
+
+    @abstractmethod
+    def wrap(self, pc: int, inst: Instruction, op: Callable[[Executor], Any]) -> Callable[[Executor], Any]:
+        """Returns the op to dispatch in place of `op` for the instruction at `pc`"""
+        raise NotImplementedError
+
+    def end(self, executor: Executor):
+        """Called once the run is over, however it ended"""
+
+
 class Executor:
     """Helper class to execute a list of instruction"""
 
-    program: Tuple[Instruction, ...] = tuple()
+    program: Sequence[Instruction] = tuple()
     pc: int = 0
     running: bool = False
+    dispatch_mode: DispatchMode = DispatchMode.INTERPRETED
+    executed_count: int = 0     # instructions executed by the last run
+    input_backend: InputBackend | None = None   # used by the instruction set to drive the mouse
     logger_internal = logger
     shared: Dict
     play_event: None | threading.Event = None
     pause_callback: None | Callable[[], None] = None
     resume_callback: None | Callable[[], None] = None
+    scheduler: DeadlineScheduler    # timeline used by waits and timed moves
+    outcome: RunOutcome | None = None
+    instruments: List[ExecutionInstrument]
+    paused_ns: int = 0      # total time spent paused during the last run
+    _paused_at: int = 0
+    _stopped: bool = False
+
+    def __init__(self) -> None:
+        self._interrupt = threading.Event()     # wakes up blocking instructions on pause / stop
+        self.instruments = []
+        self.scheduler = DeadlineScheduler()
+        self.scheduler.bind_control(self._interrupt, self.checkpoint)
 
     def load_instructions(self, instructions: Iterable[Instruction]) -> Executor:
-        self.program = tuple(instructions)
+        """Loads a program. Instructions are copied into a tuple, except for containers building
+        them on access (see CompactProgram in program_format.py), which are kept as they are."""
+        self.program = instructions if _builds_on_access(instructions) else tuple(instructions)
         return self
+
+    def load_binary(self, data: bytes, compact: bool = False) -> Executor:
+        """Loads a program stored in the binary program format (see program_format.py),
+        no compilation needed. With compact, instructions are only built when executed.
+        Raises ProgramFormatError if the data is not a valid program."""
+        from app_logic.compiler.program_format import decode
+        return self.load_instructions(decode(data, compact).instructions)
     
     def set_pause_callback(self, cb: Callable[[], None]):
         """Sets a callback to be called when execution is paused.
@@ -55,6 +118,32 @@ class Executor:
         """
         self.resume_callback = cb
 
+    def set_input_backend(self, backend: InputBackend) -> Executor:
+        """Sets the backend instructions use to read and drive the mouse"""
+        self.input_backend = backend
+        return self
+
+    def set_scheduler(self, scheduler: DeadlineScheduler) -> Executor:
+        """Replaces the timeline used by waits and timed moves (e.g. with a VirtualScheduler)"""
+        scheduler.bind_control(self._interrupt, self.checkpoint)
+        self.scheduler = scheduler
+        return self
+
+    def set_late_policy(self, policy: LatePolicy) -> Executor:
+        """Sets what waits do when the script falls behind its timeline (see LatePolicy)"""
+        self.scheduler.policy = policy
+        return self
+
+    def set_dispatch_mode(self, mode: DispatchMode) -> Executor:
+        """Selects the loop used to run the program (see DispatchMode)"""
+        self.dispatch_mode = mode
+        return self
+
+    def add_instrument(self, instrument: ExecutionInstrument) -> Executor:
+        """Attaches an instrument to the next runs. Instrumented runs always use the threaded loop."""
+        self.instruments.append(instrument)
+        return self
+
     def is_paused(self) -> bool:
         """Returns whether execution is currently paused."""
         if self.play_event is None:
@@ -67,6 +156,9 @@ class Executor:
             if not self.play_event.is_set():
                 return  # already paused
             self.play_event.clear()
+            self._dispatching = False   # makes the threaded loop leave its inner loop
+            self._paused_at = time.perf_counter_ns()
+            self._interrupt.set()
             if self.pause_callback:
                 self.pause_callback()
             logger.info("Execution paused.")
@@ -76,15 +168,38 @@ class Executor:
         if self.play_event is not None:
             if self.play_event.is_set():
                 return  # already playing
+            paused = time.perf_counter_ns() - self._paused_at
+            self.paused_ns += paused
+            self.scheduler.shift(paused)   # time spent paused is not late
             self.play_event.set()
             if self.resume_callback:
                 self.resume_callback()
             logger.info("Execution resumed.")
 
-    def execute(self, play_event: None | threading.Event = None):
+    def stop(self):
+        """Stops execution. Can be called from any thread: running waits and timed moves
+        are interrupted, a paused program is woken up to terminate."""
+        self._stopped = True
+        self.running = False
+        self._dispatching = False
+        self._interrupt.set()
+        if self.play_event is not None:
+            self.play_event.set()
+
+    def checkpoint(self) -> None:
+        """Called by blocking instructions when they are interrupted (see DeadlineScheduler).
+        Blocks for as long as execution is paused, and raises ExecutionStopped if it was stopped."""
+        self._interrupt.clear()
+        if self.play_event is not None and not self.play_event.is_set():
+            logger.debug("Execution is now waiting to be resumed.")
+            self.play_event.wait()
+        if self._stopped:
+            raise ExecutionStopped()
+
+    def execute(self, play_event: None | threading.Event = None) -> RunOutcome | None:
         """Executes loaded program. A threading event can be provided to allow finer control over pausing in a different thread.
-        If none is provided, an event will be created. You can use is_paused(), pause() and resume() methods to control execution from 
-        another thread."""
+        If none is provided, an event will be created. You can use is_paused(), pause(), resume() and stop() methods to control execution from 
+        another thread. Returns how the execution ended (None if there was nothing to execute)."""
 
         if len(self.program) == 0:
             logger.warning("Program does not contain any instruction.")
@@ -94,10 +209,53 @@ class Executor:
 
         self.pc = 0
         self.running = True
+        self._stopped = False
+        self.outcome = RunOutcome.FINISHED
+        self.paused_ns = 0
+        self._interrupt.clear()
         self.play_event = play_event if play_event is not None else threading.Event()
         self.play_event.set()  # start in playing state
 
         logger.info("Beginning execution")
+        start = time.perf_counter()
+        self.scheduler.start()
+
+        if self.instruments:
+            for instrument in self.instruments:
+                instrument.begin(self)
+            try:
+                self.executed_count = self._run_threaded()
+            finally:
+                for instrument in self.instruments:
+                    instrument.end(self)
+        elif self.dispatch_mode == DispatchMode.THREADED:
+            self.executed_count = self._run_threaded()
+        elif self.dispatch_mode == DispatchMode.COMPILED:
+            self.executed_count = self._run_compiled()
+        else:
+            self.executed_count = self._run_interpreted()
+
+        self.running = False
+        elapsed = time.perf_counter() - start
+        if self._stopped:
+            self.outcome = RunOutcome.STOPPED
+            logger.info("Execution stopped.")
+        logger.info("Program terminated.")
+        logger.info(
+            "Executed %s instructions in %.3f s (%.0f instructions/s, %s loop)",
+            self.executed_count, elapsed, self.executed_count / elapsed if elapsed > 0 else 0,
+            "instrumented" if self.instruments else self.dispatch_mode.value
+        )
+        if self.scheduler.waits:
+            logger.info(self.scheduler.report())
+        return self.outcome
+
+    def _run_interpreted(self) -> int:
+        """Original dispatch loop: checks the play event, the program bounds and halting
+        instructions before every instruction. Returns the number of executed instructions."""
+
+        executed = 0
+        log_steps = logger.isEnabledFor(logging.DEBUG)   # the message formats the instruction, skipped if not shown
         while self.running:
 
             if self.play_event is not None:
@@ -105,6 +263,9 @@ class Executor:
                     logger.debug("Execution is now waiting to be resumed.")
                 self.play_event.wait()  # will block here if paused
 
+            if not self.running:
+                break   # stopped while paused
+
             if self.pc >= len(self.program):
                 break
             
@@ -115,17 +276,165 @@ class Executor:
 
             try:
                 inst.execute(self)
+            except ExecutionStopped:
+                return executed
             except Exception as e:
                 logger.critical(f"Execution of {inst} raised an exception: {e}")
-                return 
+                self.outcome = RunOutcome.FAILED
+                return executed
 
-            logger.debug(f"Executed instruction {inst}")
+            if log_steps:
+                logger.debug("Executed instruction %s", inst)
 
             self.pc += 1
-        
-        logger.info("Program terminated.")
-            
+            executed += 1
+
+        return executed
+
+    # ------------------------------------------------------------------
+    # Threaded-code dispatch
+    # ------------------------------------------------------------------
+
+    _dispatching: bool = False
+    _halted: bool = False
+
+    def _halt_op(self, executor: Executor):
+        """Bound in place of halting instructions and past the end of the program"""
+        self._halted = True
+        self._dispatching = False
+
+    def link(self) -> Sequence[Callable[[Executor], Any]]:
+        """Resolves the program once into a flat list of callables, one per pc, plus a trailing
+        halt op, so the dispatch loop does no type checks, bound checks or logging per instruction.
+        Attached instruments wrap the op of every instruction.
+        Programs building their instructions on access are resolved one op at a time instead
+        (see _LazyOps), unless instruments are attached.
+        """
+        if _builds_on_access(self.program) and not self.instruments:
+            return _LazyOps(self.program, self._halt_op)
+
+        ops: List[Callable[[Executor], Any]] = []
+        for pc, inst in enumerate(self.program):
+            op = self._halt_op if isinstance(inst, HaltExecution) else inst.execute
+            for instrument in self.instruments:
+                op = instrument.wrap(pc, inst, op)
+            ops.append(op)
+
+        ops.append(self._halt_op)   # falling off the end of the program halts
+        return ops
+
+    def _run_threaded(self) -> int:
+        """Threaded-code dispatch loop. Halting and pausing are handled out of band: both clear
+        the _dispatching flag, which is the only thing the inner loop checks between instructions.
+        Returns the number of executed instructions."""
+
+        ops = self.link()
+        play_event = self.play_event
+        assert play_event is not None
+        self._halted = False
+        executed = 0
+
+        while not self._halted:
+            if not play_event.is_set():
+                logger.debug("Execution is now waiting to be resumed.")
+            play_event.wait()
+
+            self._dispatching = True
+            if self._stopped:
+                return executed
+            if not play_event.is_set():
+                continue    # paused again before the flag was raised
+
+            try:
+                while self._dispatching:
+                    ops[self.pc](self)
+                    self.pc += 1
+                    executed += 1
+            except ExecutionStopped:
+                return executed
+            except Exception as e:
+                logger.critical(f"Execution of {self.program[self.pc]} raised an exception: {e}")
+                self.outcome = RunOutcome.FAILED
+                return executed
+
+        # the halt op stopped the loop without being an instruction of the program: pc stays on it,
+        # at the halting instruction or past the end, like in the other loops
+        self.pc -= 1
+        return executed - 1
+
+    # ------------------------------------------------------------------
+    # Compiled dispatch
+    # ------------------------------------------------------------------
+
+    _compiled: Tuple[Sequence[Instruction], Callable[[Executor, Dict], None] | None] | None = None
+
+    def _resync(self) -> bool:
+        """Called by compiled programs when the _dispatching flag is down: blocks for as long as
+        execution is paused. Returns True if execution was stopped."""
+        play_event = self.play_event
+        assert play_event is not None
+        while True:
+            if not play_event.is_set():
+                logger.debug("Execution is now waiting to be resumed.")
+            play_event.wait()
+
+            self._dispatching = True
+            if self._stopped:
+                return True
+            if play_event.is_set():
+                return False
+            # paused again before the flag was raised
+
+    def _run_compiled(self) -> int:
+        """Runs the program translated into a single Python function (see transpiler.py), falls
+        back to the threaded loop for programs that can not be translated. The translation is
+        kept for as long as the same program is loaded. Returns the number of executed instructions."""
+        from .transpiler import transpile, TranspileError  # imports the instruction set, which imports this module
+
+        if _builds_on_access(self.program):
+            logger.info("Compact programs are not compiled, running on the threaded loop.")
+            return self._run_threaded()
+        if self._compiled is None or self._compiled[0] is not self.program:
+            try:
+                self._compiled = (self.program, transpile(self.program))
+            except TranspileError as e:
+                logger.info(f"Program can not be compiled ({e}), running it on the threaded loop.")
+                self._compiled = (self.program, None)
+        run = self._compiled[1]
+        if run is None:
+            return self._run_threaded()
+
+        self.executed_count = 0
+        self._dispatching = False   # the first block waits for the play event, like the threaded loop
+        try:
+            run(self, self.shared)
+        except ExecutionStopped:
+            pass
+        except Exception as e:
+            logger.critical(f"Execution of {self.program[self.pc]} raised an exception: {e}")
+            self.outcome = RunOutcome.FAILED
+        return self.executed_count
+
+
+def _builds_on_access(instructions: Iterable[Instruction]) -> bool:
+    """Whether instructions is a program container building its instructions when they are
+    accessed (see CompactProgram), instead of a collection holding them"""
+    return isinstance(instructions, Sequence) and not isinstance(instructions, (tuple, list))
+
+
+class _LazyOps:
+    """Ops of a program building its instructions on access, resolved when they are dispatched:
+    the instructions are dropped after they run, instead of being kept by the linked ops"""
 
+    __slots__ = ("program", "size", "halt_op")
 
+    def __init__(self, program: Sequence[Instruction], halt_op: Callable[[Executor], Any]) -> None:
+        self.program = program
+        self.size = len(program)
+        self.halt_op = halt_op
 
-        
\ No newline at end of file
+    def __getitem__(self, pc: int) -> Callable[[Executor], Any]:
+        if pc >= self.size:
+            return self.halt_op     # falling off the end of the program halts
+        inst = self.program[pc]
+        return self.halt_op if isinstance(inst, HaltExecution) else inst.execute
@@ -1,25 +1,40 @@
 from __future__ import annotations 
-from typing import Optional
+from typing import Optional, Dict, Tuple, List, Any, Callable
 import sys
 import os
 import logging
+import socket
 from PyQt6.QtCore import Qt
 from PyQt6 import QtCore, QtWidgets
 import multiprocessing
+from multiprocessing import shared_memory
 from PyQt6.QtGui import QKeySequence, QColor
 from pynput import keyboard
-import time
-from dataclasses import dataclass
-
-from .executor import Executor
-from app_logic.compiler.compiler import Compiler
-from app_logic.compiler.compiler_config import get_compiler_cfg
+import threading
+from dataclasses import dataclass, replace
+from multiprocessing.connection import Connection
+
+from .executor import Executor, DispatchMode, RunOutcome
+from .scheduler import LatePolicy
+from .profiler import ExecutionProfiler
+from .tracer import ExecutionTracer
+from .headless import attach_backend, report_dry_run
+from app_logic.compiler.compiler import Compiler, IncrementalCompiler
+from app_logic.compiler.compiler_config import get_compiler_cfg, config_key
+from app_logic.compiler.program_cache import ProgramCache, compile_cached
+from app_logic.compiler.program_format import CompiledProgram, ProgramFormatError, encode, decode
+from app_logic.instruction_set import DEFAULT_HISTORY_DEPTH
+from app_logic.input_backends.backend import DEFAULT_BACKEND
+from app_logic.input_backends.cursor_state import DEFAULT_RESYNC_MS
 import utils.logger_config as logger_config
 from utils.key_translator import qt_to_pynput
-from utils.processes_utils import setup_subprocess_logging, ProcessDialog, EndNotifyDialog, start_key_quitter
+from utils.processes_utils import setup_subprocess_logging, set_subprocess_log_level, mark_logs_flushed, ProcessDialog, EndNotifyDialog, start_key_quitter
 from view.gui_utils import make_icon
 
 
+STOP_GRACE_S = 1.0  # time given to the executor to stop by itself before the process is killed
+COMPACT_PROGRAM_BYTES = 2**20   # shipped programs from this size (~50k instructions) are kept compact (see CompactProgram)
+
 # text shown in the process dialog
 DIALOG_TEXT = lambda keyname: f"""
 Runnig script, press ESC to terminate.
@@ -29,35 +44,191 @@ Press {keyname} to pause/resume execution.
 @dataclass
 class RunParams:
     """Stores all the runtime parameters to pass to the "run" process"""
-    text: str
+    text: str   # source, compiled in the process only if no program is shipped
     safemode: bool
     pause_key: Qt.Key
     notify_end: bool
     log_queue: Optional[multiprocessing.Queue] = None
+    log_level: int = logging.DEBUG  # records below it are not even created, should match what the editor shows
+    threaded_dispatch: bool = True
+    transpile: bool = False     # runs the program as a generated Python function (see transpiler.py)
+    input_backend: str = DEFAULT_BACKEND
+    cursor_resync_ms: int = DEFAULT_RESYNC_MS
+    history_depth: int = DEFAULT_HISTORY_DEPTH
+    late_policy: str = LatePolicy.SKIP.value
+    profile: bool = False
+    trace: bool = False
+    cache_compiled: bool = True
+    optimize: bool = True   # peephole optimizer of the compiler (see compiler/optimizer.py)
+    program_shm: str | None = None  # name of the shared memory holding the compiled program (see ship_program)
+    program_size: int = 0
+
+
+class RunCompiler:
+    """
+    Compiles scripts for the runner in the editor process, before anything is spawned.
+    Keeps an IncrementalCompiler per compiler configuration, so that after small edits only the
+    changed lines are built again, and goes through the compiled program cache.
+    Programs are returned in the binary program format, ready to be shipped with ship_program().
+    Not thread safe: compile one script at a time.
+    """
+
+    def __init__(self) -> None:
+        self._compilers: Dict[Tuple[bool, int, bool], IncrementalCompiler] = {}
+
+    def compile(self, text: str, safemode: bool, history_depth: int = DEFAULT_HISTORY_DEPTH, use_cache: bool = True,
+                optimize: bool = True) -> bytes | None:
+        """Returns the encoded program, None if compilation fails (errors go to the Compiler logger).
+        Returns empty bytes if the program compiled but can not be encoded: nothing is shipped then,
+        the runner compiles the source itself."""
+        cache = ProgramCache() if use_cache else None
+        key = cache.key(text, config_key(safemode, history_depth, optimize)) if cache else ""
+        if cache:
+            data = cache.load_data(key)
+            if data is not None:
+                logger_config.logger_comp.info("Compiled program loaded from cache.")
+                return data
+
+        compiler = self._compilers.get((safemode, history_depth, optimize))
+        if compiler is None:
+            compiler = self._compilers[(safemode, history_depth, optimize)] = IncrementalCompiler(
+                get_compiler_cfg(safemode=safemode, history_depth=history_depth, optimize=optimize)
+            )
+        program = compiler.compile_program(text)
+        if program is None:
+            return None
+
+        try:
+            data = encode(program)
+        except ProgramFormatError as e:
+            logger_config.logger_comp.warning(f"Compiled program can not be shipped ({e}), the runner compiles it again.")
+            return b""
+        if cache:
+            cache.store_data(key, data)
+        return data
+
+
+class CompileThread(QtCore.QThread):
+    """Runs RunCompiler.compile off the UI thread"""
+    compiled = QtCore.pyqtSignal(bytes)
+    compilation_failed = QtCore.pyqtSignal()
+
+    def __init__(self, run_compiler: RunCompiler, text: str, safemode: bool, history_depth: int, use_cache: bool,
+                 optimize: bool = True) -> None:
+        super().__init__()
+        self.run_compiler = run_compiler
+        self.args = (text, safemode, history_depth, use_cache, optimize)
+
+    def run(self):
+        try:
+            data = self.run_compiler.compile(*self.args)
+        except Exception:
+            logger_config.logger_comp.exception("Unexpected error while compiling")
+            data = None
+
+        if data is None:
+            self.compilation_failed.emit()
+        else:
+            self.compiled.emit(data)
+
+
+def ship_program(data: bytes) -> shared_memory.SharedMemory:
+    """Copies an encoded program to a new shared memory block, to pass to the runner with
+    RunParams.program_shm / program_size. The caller owns the block: close() and unlink() it
+    once the runner has exited."""
+    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    shm.buf[:len(data)] = data
+    return shm
+
+
+def _receive_program(name: str, size: int) -> CompiledProgram:
+    """Decodes the program shipped by the editor, huge ones into a CompactProgram.
+    Raises ProgramFormatError or OSError"""
+    shm = shared_memory.SharedMemory(name=name, track=False)     # the editor unlinks it
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    return decode(data, compact=size >= COMPACT_PROGRAM_BYTES)
+
+
+# ---------------------------
+# Run lifecycle protocol
+# ---------------------------
+# Events sent by a runner process to the editor, as (event, value) tuples:
+MSG_READY = "ready"         # a warm runner is set up and waits for scripts
+MSG_STARTED = "started"     # the program is loaded and starts executing
+MSG_FINISHED = "finished"   # the run is over and its dialogs are closed, value: outcome of the run (see below)
+MSG_EXITED = "exited"       # the process exits, also reported by RunnerWorker when it dies without saying it
+# "log-flushed" is sent on the log queue right before MSG_FINISHED, after the records of the run
+# (see mark_logs_flushed), so that the editor knows when it has all of them.
+
+# outcome of MSG_FINISHED: a RunOutcome value, or
+OUTCOME_COMPILATION_FAILED = "compilation_failed"
+OUTCOME_DIED = None     # the process died during the run (e.g. killed after a stop), no log-flushed is sent
 
 
-def _run_program_from_text(params: RunParams):
+def _event_channel() -> Tuple[Connection, socket.socket]:
+    """Returns the editor end and the runner end of a new event channel. A socket pair, unlike
+    multiprocessing.Pipe on Windows, so that the editor can wait on it with a QSocketNotifier.
+    The runner end is passed to the process, which wraps it with _runner_connection()."""
+    editor_sock, runner_sock = socket.socketpair()
+    return Connection(editor_sock.detach()), runner_sock
+
+
+def _runner_connection(sock: socket.socket | None) -> Connection | None:
+    return Connection(sock.detach()) if sock is not None else None
+
+
+def _send_event(conn: Connection | None, event: str, value: Any = None) -> None:
+    if conn is None:
+        return
+    try:
+        conn.send((event, value))
+    except OSError:
+        pass    # the editor went away, nobody to tell
+
+
+def _run_program_from_text(params: RunParams, sock: socket.socket | None = None):
     """
-    Runs in a subprocess. Shows a small PyQt5 dialog and executes program logic
-    in a background thread so the GUI remains responsive.
+    Runs in a subprocess started for a single script, see _run_program.
+    Lifecycle events are sent on sock if given.
     """
 
-    setup_subprocess_logging(params.log_queue)
+    events = _runner_connection(sock)
+    setup_subprocess_logging(params.log_queue, params.log_level)
+    app = QtWidgets.QApplication(sys.argv)
+    app.setWindowIcon(make_icon(QColor("#00cc00"), "triangle"))
+    _run_program(params, events)
+    _send_event(events, MSG_EXITED)
+    sys.exit(0)
+
+
+def _run_program(params: RunParams, events: Connection | None = None) -> int:
+    """
+    Shows a small PyQt dialog and executes program logic in a background thread so the GUI
+    remains responsive. Needs a QApplication and the subprocess logging already set up.
+    Sends MSG_STARTED and MSG_FINISHED on events, and log-flushed on the log queue.
+    Returns the dialog result, and leaves nothing running: the process can run other scripts.
+    """
 
     key_name = QKeySequence(params.pause_key).toString().upper()
     key_pause_pynput = qt_to_pynput(params.pause_key)   # we need conversion to be made because we store the key in qt format
 
     class ScriptRunnerDialog(ProcessDialog):
         worker: ExecutionThread
+        escape_pressed = QtCore.pyqtSignal()
 
         def __init__(self):
             super().__init__("Script runner", DIALOG_TEXT(key_name), logger_config.logger_editor, ExecutionThread(params.text))
             self.worker.compilation_failed.connect(self._change_text_to_compilation_failed)
-            self.stop_button.clicked.connect(self.terminate_process)
+            self.stop_button.clicked.connect(self.request_stop)
+            self.escape_pressed.connect(self.request_stop, Qt.ConnectionType.QueuedConnection)
             self.pause_button.clicked.connect(self.worker.executor.pause)
             self.play_button.clicked.connect(self.worker.executor.resume)
             self.worker.executor.set_pause_callback(self._on_pause_instruction)
             self.listener = self._start_pause_listener()
+            self.killer: threading.Timer | None = None
         
         def _on_pause_instruction(self):
             # if pause is requested from instruction, click pause button to update UI (does not affect execution state)
@@ -78,6 +249,44 @@ def _run_program_from_text(params: RunParams):
             listener.start()
             return listener
 
+        def request_stop(self):
+            """Stops the executor, which interrupts running waits and moves. The process is killed
+            if execution is still going after STOP_GRACE_S (e.g. stuck in a backend call).
+            Runs in the GUI thread, the ESC listener goes through on_escape."""
+            if not self.worker.isRunning():
+                self.reject()
+                return
+
+            self.logger.warning("Stopping execution.")
+            self.worker.executor.stop()
+            if self.killer is None:     # stopping again does not delay the kill
+                self.killer = threading.Timer(STOP_GRACE_S, self.terminate_process)
+                self.killer.daemon = True
+                self.killer.start()
+
+        def on_escape(self):
+            """Called by the ESC listener, in its own thread: stops the executor right away
+            (thread safe), the dialog is handled in the GUI thread"""
+            self.worker.executor.stop()
+            self.escape_pressed.emit()
+
+        def _cancel_kill(self):
+            if self.killer is not None:
+                self.killer.cancel()
+                self.killer = None
+
+        def release(self):
+            """Stops the listeners and the pending kill of this run, once the dialog is closed"""
+            self._cancel_kill()
+            self.listener.stop()
+            self.worker.wait()
+
+        def on_finished(self):
+            self._cancel_kill()     # execution ended by itself, within the grace time
+            # a script stopped by the user did not end by itself, so no end notification
+            self.label.setText("Finished.")
+            self.done(0 if self.worker.executor.outcome == RunOutcome.STOPPED else 1)
+
         def _change_text_to_compilation_failed(self):
             self.label.setText("Script compilation failed. Check terminal for error messages.")
             self.stop_button.setText("Close")
@@ -118,27 +327,66 @@ def _run_program_from_text(params: RunParams):
         def __init__(self, text):
             super().__init__()
             self.text = text
-            self.executor = Executor()
+            self.executor = Executor().set_dispatch_mode(
+                DispatchMode.COMPILED if params.transpile else
+                DispatchMode.THREADED if params.threaded_dispatch else DispatchMode.INTERPRETED
+            ).set_late_policy(LatePolicy(params.late_policy))
+
+        def _load_program(self) -> CompiledProgram | None:
+            """Takes the program compiled by the editor, or compiles the source if none was shipped"""
+            if params.program_shm:
+                try:
+                    return _receive_program(params.program_shm, params.program_size)
+                except (OSError, ProgramFormatError) as e:
+                    logger_config.logger_editor.warning(f"Could not load the compiled program ({e}), compiling again.")
+
+            cfg_fn = get_compiler_cfg(safemode = params.safemode, history_depth = params.history_depth, optimize = params.optimize)
+            cache = ProgramCache() if params.cache_compiled else None
+            return compile_cached(
+                Compiler(cfg_fn), self.text, cache, config=config_key(params.safemode, params.history_depth, params.optimize)
+            )
 
         def run(self):
-            cfg_fn = get_compiler_cfg(safemode = params.safemode)
-            program = Compiler(cfg_fn).compile_from_src(self.text)
-            if not program:
+            program = self._load_program()
+            if program is None:
                 self.compilation_failed.emit()
                 logger_config.logger_editor.error("Compilation failed.")
                 return
+
+            backend = attach_backend(self.executor, params.input_backend, LatePolicy(params.late_policy), params.cursor_resync_ms)
+
+            profiler = None
+            if params.profile:
+                profiler = ExecutionProfiler(program.line_table, program.labels, self.text.splitlines())
+                self.executor.add_instrument(profiler)
+            if params.trace:
+                self.executor.add_instrument(ExecutionTracer.to_dir(
+                    line_table=program.line_table, source_lines=self.text.splitlines()
+                ))
             
-            self.executor.load_instructions(program).execute()
-            time.sleep(.5)   # waits for all logs to arrive
+            self.executor.load_instructions(program.instructions)
+            _send_event(events, MSG_STARTED)
+            self.executor.execute()
+
+            report_dry_run(backend)
+
+            if profiler is not None:
+                logger_config.logger_exec.info(profiler.report())
+                try:
+                    path = profiler.write_json_to_dir()
+                    logger_config.logger_exec.info(f"Profile saved to {path.resolve()}")
+                except OSError as e:
+                    logger_config.logger_exec.error(f"Could not save profile: {e}")
             self.finished.emit()
 
-    start_key_quitter() # we need this because ESC only closes window if the window is focused
-
     # --- Run Qt event loop in main thread ---
-    app = QtWidgets.QApplication(sys.argv)
-    app.setWindowIcon(make_icon(QColor("#00cc00"), "triangle"))
     dlg = ScriptRunnerDialog()
-    result = dlg.exec()
+    quitter = start_key_quitter(dlg.on_escape) # we need this because ESC only closes window if the window is focused
+    try:
+        result = dlg.exec()
+    finally:
+        quitter.stop()
+        dlg.release()
 
     # result > 0 makes sure script ended nominally, script ended by itself (either finished or crashed)
     if params.notify_end and result > 0:
@@ -146,28 +394,184 @@ def _run_program_from_text(params: RunParams):
         enddlg = EndNotifyDialog()
         enddlg.exec()
 
-    sys.exit(0)
+    outcome = dlg.worker.executor.outcome
+    mark_logs_flushed()
+    _send_event(events, MSG_FINISHED, outcome.value if outcome is not None else OUTCOME_COMPILATION_FAILED)
+    return result
 
 # ---------------------------
 # Helper to start program in a process
 # ---------------------------
-def begin_compile_and_execute_process(params: RunParams) -> multiprocessing.Process:
+def begin_compile_and_execute_process(params: RunParams, sock: socket.socket | None = None) -> multiprocessing.Process:
     """
-    Start execution in a separate process from source text.
+    Start execution in a separate process, of the program shipped with params (see RunCompiler
+    and ship_program), or of the source text if there is none.
     Returns the Process object so caller can terminate it if needed.
-    Logs are redirected to log_queue if provided.
+    Logs are redirected to log_queue if provided, lifecycle events are sent on sock if provided
+    (see _event_channel).
     """
 
-    proc = multiprocessing.Process(target=_run_program_from_text, args=(params,))
+    proc = multiprocessing.Process(target=_run_program_from_text, args=(params, sock))
     proc.start()
     return proc
 
 
+# ---------------------------
+# Runner processes
+# ---------------------------
+WORKER_STOP_TIMEOUT_S = 2.0
+
+
+def _runner_worker_main(log_queue: Optional[multiprocessing.Queue], sock: socket.socket):
+    """Entry point of the warm RunnerWorker process: sets up Qt and logging once, then runs every
+    script received on the event channel, until None is received or the editor goes away"""
+    conn = Connection(sock.detach())
+    setup_subprocess_logging(log_queue)
+    app = QtWidgets.QApplication(sys.argv)
+    app.setWindowIcon(make_icon(QColor("#00cc00"), "triangle"))
+    app.setQuitOnLastWindowClosed(False)
+    _send_event(conn, MSG_READY)
+
+    while True:
+        try:
+            params = conn.recv()
+        except EOFError:
+            break
+        if params is None:
+            break
+        set_subprocess_log_level(params.log_level)
+        _run_program(params, conn)
+    _send_event(conn, MSG_EXITED)
+
+
+class RunnerWorker:
+    """
+    Starts the runner processes and collects their lifecycle events (see MSG_READY and the others).
+
+    When warm, a long-lived process is started alongside the editor. Modules are imported and the
+    Qt application is created once, so a run starts as soon as its parameters arrive; after the run
+    the process goes back to waiting for the next one. Otherwise a process is started per run.
+
+    Nothing is polled: the editor waits for conn to be readable (e.g. with a QSocketNotifier on
+    conn.fileno()) and then calls read_events(). conn is replaced when a process is started.
+    Stopping a script that does not stop in time kills the process (see STOP_GRACE_S), like a crash
+    would: read_events() then reports the end of the run and of the process, and a dead warm
+    worker is started again.
+    Not thread safe, use it from the editor thread.
+    """
+
+    def __init__(self, log_queue: Optional[multiprocessing.Queue] = None, warm: bool = True) -> None:
+        self.log_queue = log_queue
+        self.warm = warm
+        self.proc: multiprocessing.Process | None = None
+        self.conn: Connection | None = None
+        self.busy = False
+        self.ready = False
+        self.exited = False
+
+    def start(self) -> RunnerWorker:
+        """Starts the warm worker, if it is not running yet"""
+        if self.warm and not self.is_alive():
+            self._spawn_worker()
+        return self
+
+    def _spawn(self, target: Callable[..., None], args: Tuple[Any, ...]) -> None:
+        self._close()
+        conn, runner_sock = _event_channel()
+        # a warm worker never outlives the editor, a single run may
+        self.proc = multiprocessing.Process(target=target, args=args + (runner_sock,), daemon=self.warm)
+        self.proc.start()
+        runner_sock.close()
+        self.conn = conn
+        self.busy = False
+        self.ready = False
+        self.exited = False
+
+    def _spawn_worker(self) -> None:
+        self._spawn(_runner_worker_main, (self.log_queue,))
+
+    def _close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.is_alive()
+
+    def run(self, params: RunParams) -> None:
+        """Starts a script: sends it to the worker, starting it again first if it died, or starts
+        a process for it if not warm"""
+        if not self.warm:
+            self._spawn(_run_program_from_text, (params,))
+            self.busy = True
+            return
+
+        if not self.is_alive() or self.conn is None:
+            logger_config.logger_editor.info("Starting a new runner process.")
+            self._spawn_worker()
+        assert self.conn is not None
+        params = replace(params, log_queue=None)   # the worker logs to the queue it was started with
+        try:
+            self.conn.send(params)
+        except OSError:     # died in the meantime
+            self._spawn_worker()
+            self.conn.send(params)
+        self.busy = True
+
+    def read_events(self) -> List[Tuple[str, Any]]:
+        """Returns the events received since the last call, without blocking"""
+        events: List[Tuple[str, Any]] = []
+        try:
+            while self.conn is not None and self.conn.poll():
+                event, value = self.conn.recv()
+                if event == MSG_READY:
+                    self.ready = True
+                elif event == MSG_FINISHED:
+                    self.busy = False
+                elif event == MSG_EXITED:
+                    self.exited = True
+                events.append((event, value))
+        except (EOFError, OSError):
+            events.extend(self._on_process_gone())
+        return events
+
+    def _on_process_gone(self) -> List[Tuple[str, Any]]:
+        """The process closed its end of the channel: it exited or died"""
+        events: List[Tuple[str, Any]] = []
+        if self.busy:
+            logger_config.logger_editor.debug("Runner process exited during the run.")
+            events.append((MSG_FINISHED, OUTCOME_DIED))
+            self.busy = False
+        if not self.exited:
+            events.append((MSG_EXITED, None))
+        self._close()
+        if self.warm:
+            self._spawn_worker()    # crash recovery, also after a forced stop
+        return events
+
+    def stop(self) -> None:
+        """Asks the warm worker to exit, kills it if it does not. A process running a single
+        script is left to finish it."""
+        if self.proc is None:
+            return
+        if self.warm:
+            try:
+                if self.conn is not None:
+                    self.conn.send(None)
+            except OSError:
+                pass
+            self.proc.join(WORKER_STOP_TIMEOUT_S)
+            if self.proc.is_alive():
+                self.proc.terminate()
+        self._close()
+        self.proc, self.busy = None, False
+
+
 # ---------------------------
 # Example usage (main process)
 # ---------------------------
 if __name__ == "__main__":
-    from logging.handlers import QueueListener
+    from utils.processes_utils import LogBatchListener
     log_queue = multiprocessing.Queue()
 
     class ProcessLogHandler(logging.Handler):
@@ -179,7 +583,7 @@ if __name__ == "__main__":
     formatter = logging.Formatter("%(message)s")
     console_handler.setFormatter(formatter)
 
-    listener = QueueListener(log_queue, console_handler)
+    listener = LogBatchListener(log_queue, console_handler)
     listener.start()
 
     # Load and run program from file
@@ -0,0 +1,199 @@
+"""
+Runs scripts without the editor: compiles with the Compiler and executes with the Executor in
+the calling thread, with pause / stop hotkeys read through pynput. Used by the command line
+runner (see cli.py) on machines without a desktop session, and by the runner process of the
+editor for what both share.
+
+Nothing here may import PyQt6, directly or not: the command line starts in milliseconds
+because it never loads Qt.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Any
+import logging
+import signal
+import threading
+
+from .executor import Executor, DispatchMode, RunOutcome
+from .scheduler import LatePolicy
+from app_logic.compiler.compiler import Compiler
+from app_logic.compiler.compiler_config import get_compiler_cfg, config_key
+from app_logic.compiler.program_cache import ProgramCache, compile_cached
+from app_logic.instruction_set import DEFAULT_HISTORY_DEPTH
+from app_logic.input_backends.backend import InputBackend, get_backend, BackendUnavailableError, DEFAULT_BACKEND
+from app_logic.input_backends.cursor_state import CursorState, DEFAULT_RESYNC_MS
+from app_logic.input_backends.simulated_backend import SimulatedBackend
+
+logger = logging.getLogger("Runtime")
+
+# exit status of a headless run
+EXIT_FINISHED = 0
+EXIT_FAILED = 1                 # an instruction raised an exception
+EXIT_USAGE = 2                  # bad arguments or unreadable script
+EXIT_COMPILATION_FAILED = 3
+EXIT_STOPPED = 130              # stopped by the user, like a command interrupted with Ctrl+C
+
+_OUTCOME_STATUS = {
+    RunOutcome.FINISHED: EXIT_FINISHED,
+    RunOutcome.FAILED: EXIT_FAILED,
+    RunOutcome.STOPPED: EXIT_STOPPED,
+}
+
+DEFAULT_PAUSE_KEY = "space"
+DEFAULT_STOP_KEY = "esc"
+
+
+def attach_backend(executor: Executor, name: str, late_policy: LatePolicy = LatePolicy.SKIP,
+                   cursor_resync_ms: int = DEFAULT_RESYNC_MS) -> InputBackend:
+    """Makes executor use the input backend registered as name, or DEFAULT_BACKEND if it is not
+    available. Returns the backend."""
+    try:
+        backend = get_backend(name)
+    except BackendUnavailableError as e:
+        logger.warning(f"{e}, falling back to '{DEFAULT_BACKEND}'.")
+        backend = get_backend(DEFAULT_BACKEND)
+    if isinstance(backend, SimulatedBackend):
+        # dry run: no OS cursor to keep in sync, waits and moves run on the virtual clock
+        backend.attach(executor, late_policy)
+    else:
+        executor.set_input_backend(CursorState(backend, cursor_resync_ms))
+    return backend
+
+
+def report_dry_run(backend: InputBackend) -> None:
+    """Logs what a simulated run did, nothing for real backends"""
+    if isinstance(backend, SimulatedBackend):
+        logger.info(
+            f"Dry run: {len(backend.clicks())} clicks, {len(backend.actions)} actions "
+            f"in {backend.clock.seconds():.3f} s of script time."
+        )
+
+
+class HotkeyListener:
+    """
+    Global pause / resume and stop keys of a headless run, read with pynput: no window is needed,
+    only access to the keyboard events of the session. Keys are pynput names ("space", "esc",
+    "f8"...) or single characters.
+    """
+
+    def __init__(self, executor: Executor, pause_key: str = DEFAULT_PAUSE_KEY, stop_key: str = DEFAULT_STOP_KEY) -> None:
+        self.executor = executor
+        self.pause_key = pause_key
+        self.stop_key = stop_key
+        self.listener: Any = None
+
+    @staticmethod
+    def parse_key(name: str) -> Any:
+        """Returns the pynput key named name. Raises ValueError if there is none."""
+        from pynput import keyboard
+        key = getattr(keyboard.Key, name.lower(), None)
+        if key is not None:
+            return key
+        if len(name) == 1:
+            return keyboard.KeyCode.from_char(name.lower())
+        raise ValueError(f"unknown key '{name}'")
+
+    def start(self) -> bool:
+        """Starts listening. Returns False if the keyboard can not be listened to (e.g. no
+        display), the run then goes on without hotkeys."""
+        try:
+            from pynput import keyboard
+            pause, stop = self.parse_key(self.pause_key), self.parse_key(self.stop_key)
+        except Exception as e:  # pynput raises various errors when no backend works
+            logger.warning(f"Hotkeys not available: {e}")
+            return False
+
+        def on_press(key):
+            if key == stop:
+                logger.warning(f"{self.stop_key.upper()} pressed — stopping.")
+                self.executor.stop()
+            elif key == pause:
+                if self.executor.is_paused():
+                    self.executor.resume()
+                else:
+                    self.executor.pause()
+
+        try:
+            self.listener = keyboard.Listener(on_press=on_press)
+            self.listener.start()
+        except Exception as e:
+            logger.warning(f"Hotkeys not available: {e}")
+            self.listener = None
+            return False
+        logger.info(f"Press {self.pause_key.upper()} to pause/resume, {self.stop_key.upper()} to stop.")
+        return True
+
+    def stop(self) -> None:
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+def run_headless(
+    text: str,
+    safemode: bool = False,
+    input_backend: str = DEFAULT_BACKEND,
+    repeat: int = 1,
+    pause_key: str = DEFAULT_PAUSE_KEY,
+    stop_key: str = DEFAULT_STOP_KEY,
+    hotkeys: bool = True,
+    threaded_dispatch: bool = True,
+    late_policy: LatePolicy = LatePolicy.SKIP,
+    cursor_resync_ms: int = DEFAULT_RESYNC_MS,
+    history_depth: int = DEFAULT_HISTORY_DEPTH,
+    cache_dir: str | Path | None = None,
+    optimize: bool = True,
+    transpile: bool = False,
+) -> int:
+    """
+    Compiles and runs a script repeat times in the calling thread, stopping at the first run that
+    does not finish. Ctrl+C stops the run like the stop key. Returns the exit status of the
+    outcome (EXIT_FINISHED and the others). cache_dir enables the compiled program cache,
+    optimize the peephole optimizer of the compiler, transpile runs the program as a generated
+    Python function (see transpiler.py).
+    """
+    cache = ProgramCache(cache_dir) if cache_dir is not None else None
+    program = compile_cached(
+        Compiler(get_compiler_cfg(safemode=safemode, history_depth=history_depth, optimize=optimize)), text, cache,
+        config=config_key(safemode, history_depth, optimize)
+    )
+    if program is None:
+        logger.error("Compilation failed.")
+        return EXIT_COMPILATION_FAILED
+
+    executor = Executor().set_dispatch_mode(
+        DispatchMode.COMPILED if transpile else
+        DispatchMode.THREADED if threaded_dispatch else DispatchMode.INTERPRETED
+    ).set_late_policy(late_policy)
+    backend = attach_backend(executor, input_backend, late_policy, cursor_resync_ms)
+    executor.load_instructions(program.instructions)
+
+    listener = HotkeyListener(executor, pause_key, stop_key)
+    if hotkeys:
+        listener.start()
+
+    previous_handler = _stop_on_interrupt(executor.stop)
+    outcome: RunOutcome | None = RunOutcome.FINISHED
+    try:
+        for i in range(repeat):
+            if repeat > 1:
+                logger.info(f"Run {i + 1}/{repeat}")
+            outcome = executor.execute()
+            if outcome not in (RunOutcome.FINISHED, None):  # None: empty program
+                break
+    finally:
+        listener.stop()
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+
+    report_dry_run(backend)
+    return _OUTCOME_STATUS[outcome] if outcome is not None else EXIT_FINISHED
+
+
+def _stop_on_interrupt(stop: Callable[[], None]) -> Any:
+    """Makes Ctrl+C call stop instead of raising KeyboardInterrupt in the middle of an instruction.
+    Returns the previous handler, None if it could not be replaced (not in the main thread)."""
+    if threading.current_thread() is not threading.main_thread():
+        return None
+    return signal.signal(signal.SIGINT, lambda signum, frame: stop())
@@ -0,0 +1,237 @@
+from __future__ import annotations
+from typing import Tuple, Dict, Callable, List, Any, Sequence
+from array import array
+from pathlib import Path
+import datetime
+import json
+import logging
+import time
+
+from app_logic.input_backends.backend import InputBackend, MouseButton
+from utils.resource_resolver import user_cache_dir
+from .executor import Executor, ExecutionInstrument, Instruction
+
+logger = logging.getLogger("Runtime")
+
+DEFAULT_PROFILE_DIR = user_cache_dir() / "profiles"
+HOTSPOT_ROWS = 15       # rows of the hot-spot tables printed at the end of a run
+MAIN_REGION = "<main>"  # name of the code before the first label
+
+
+class _TimedBackend(InputBackend):
+    """Forwards every call to another backend, accumulating the time spent inside it"""
+
+    def __init__(self, backend: InputBackend) -> None:
+        self.backend = backend
+        self.name = backend.name
+        self.busy_ns = 0
+
+    def _timed(self, fn: Callable, *args) -> Any:
+        t0 = time.perf_counter_ns()
+        try:
+            return fn(*args)
+        finally:
+            self.busy_ns += time.perf_counter_ns() - t0
+
+    def position(self) -> Tuple[int, int]:
+        return self._timed(self.backend.position)
+
+    def screen_size(self) -> Tuple[int, int]:
+        return self._timed(self.backend.screen_size)
+
+    def move_to(self, x: int, y: int) -> None:
+        self._timed(self.backend.move_to, x, y)
+
+    def move_rel(self, dx: int, dy: int) -> None:
+        self._timed(self.backend.move_rel, dx, dy)
+
+    def click(self, button: MouseButton, clicks: int = 1) -> None:
+        self._timed(self.backend.click, button, clicks)
+
+    def invalidate(self) -> None:
+        self.backend.invalidate()
+
+
+class ExecutionProfiler(ExecutionInstrument):
+    """
+    Per-instruction profiler, attached with Executor.add_instrument().
+
+    For every pc it records how many times the instruction ran and its cumulative wall time,
+    split into time blocked in the input backend, time blocked in waits (scheduler sleeps) and
+    the remainder, spent interpreting. Time spent paused is left out.
+    Instructions are mapped back to source lines through the compiler line table, and lines are
+    aggregated into the label region (label / function body) they belong to.
+
+    The op of every instruction is wrapped when the program is linked, so a run without
+    a profiler attached executes exactly the same code as before.
+    """
+
+    def __init__(self, line_table: Sequence[int] | None = None, labels: Dict[str, int] | None = None,
+                 source_lines: Sequence[str] | None = None) -> None:
+        self.line_table = list(line_table) if line_table is not None else []
+        self.labels = dict(labels) if labels else {}
+        self.source_lines = list(source_lines) if source_lines is not None else []
+        self.program: Tuple[Instruction, ...] = tuple()
+        self._reset(0)
+
+    def _reset(self, size: int):
+        self.counts = array('q', bytes(8 * size))
+        self.total_ns = array('q', bytes(8 * size))
+        self.backend_ns = array('q', bytes(8 * size))
+        self.wait_ns = array('q', bytes(8 * size))
+        self.elapsed_ns = 0
+        self._started = 0
+        self._backend: _TimedBackend | None = None
+        self._restore_backend: InputBackend | None = None
+
+    # ------------------------------------------------------------------
+    # instrument hooks
+
+    def begin(self, executor: Executor):
+        self.program = executor.program
+        self._reset(len(self.program))
+        if executor.input_backend is not None:
+            self._restore_backend = executor.input_backend
+            self._backend = _TimedBackend(executor.input_backend)
+            executor.input_backend = self._backend
+        else:
+            logger.debug("No input backend set on the executor, backend time will not be profiled.")
+        self._started = time.perf_counter_ns()
+
+    def end(self, executor: Executor):
+        self.elapsed_ns = time.perf_counter_ns() - self._started - executor.paused_ns
+        if self._restore_backend is not None:
+            executor.input_backend = self._restore_backend
+            self._restore_backend = None
+
+    def wrap(self, pc: int, inst: Instruction, op: Callable[[Executor], Any]) -> Callable[[Executor], Any]:
+        counts, total_ns, backend_ns, wait_ns = self.counts, self.total_ns, self.backend_ns, self.wait_ns
+        perf_counter_ns = time.perf_counter_ns
+        profiler = self
+
+        def profiled(executor: Executor):
+            backend = profiler._backend
+            scheduler = executor.scheduler
+            b0 = backend.busy_ns if backend else 0
+            w0 = scheduler.blocked_ns
+            p0 = executor.paused_ns
+            t0 = perf_counter_ns()
+            try:
+                op(executor)
+            finally:
+                paused = executor.paused_ns - p0
+                total_ns[pc] += perf_counter_ns() - t0 - paused
+                wait_ns[pc] += scheduler.blocked_ns - w0 - paused
+                if backend:
+                    backend_ns[pc] += backend.busy_ns - b0
+                counts[pc] += 1
+
+        return profiled
+
+    # ------------------------------------------------------------------
+    # results
+
+    def line_of(self, pc: int) -> int:
+        """Source line index of the instruction at pc (-1 if it has none)"""
+        return self.line_table[pc] if pc < len(self.line_table) else -1
+
+    def region_of(self, pc: int) -> str:
+        """Name of the label region containing pc: the closest label at or before it"""
+        best_idx, names = -1, [MAIN_REGION]
+        for name, idx in self.labels.items():
+            if idx > pc or idx < best_idx:
+                continue
+            if idx > best_idx:
+                best_idx, names = idx, [name]
+            else:
+                names.append(name)
+        return "/".join(names)
+
+    def instructions(self) -> List[Dict[str, Any]]:
+        """Profile entry of every executed instruction"""
+        entries = []
+        for pc, count in enumerate(self.counts):
+            if not count:
+                continue
+            total, backend, wait = self.total_ns[pc], self.backend_ns[pc], self.wait_ns[pc]
+            line = self.line_of(pc)
+            entries.append({
+                "pc": pc,
+                "line": line + 1 if line >= 0 else None,
+                "instruction": type(self.program[pc]).__name__,
+                "region": self.region_of(pc),
+                "count": count,
+                "total_ms": total / 1e6,
+                "backend_ms": backend / 1e6,
+                "wait_ms": wait / 1e6,
+                "interpreting_ms": max(0, total - backend - wait) / 1e6,
+            })
+        return entries
+
+    @staticmethod
+    def _aggregate(entries: List[Dict[str, Any]], key: str) -> Dict[Any, Dict[str, Any]]:
+        groups: Dict[Any, Dict[str, Any]] = {}
+        for entry in entries:
+            group = groups.setdefault(entry[key], {
+                key: entry[key], "count": 0, "total_ms": 0.0, "backend_ms": 0.0, "wait_ms": 0.0, "interpreting_ms": 0.0
+            })
+            for field in ("count", "total_ms", "backend_ms", "wait_ms", "interpreting_ms"):
+                group[field] += entry[field]
+        return groups
+
+    def lines(self) -> List[Dict[str, Any]]:
+        """Profile aggregated per source line (initial instructions are under line None)"""
+        entries = self.instructions()
+        groups = self._aggregate(entries, "line")
+        for entry in entries:
+            group = groups[entry["line"]]
+            group.setdefault("region", entry["region"])
+            line = entry["line"]
+            if line is not None and line - 1 < len(self.source_lines):
+                group.setdefault("source", self.source_lines[line - 1].strip())
+        return list(groups.values())
+
+    def regions(self) -> List[Dict[str, Any]]:
+        """Profile aggregated per label region"""
+        return list(self._aggregate(self.instructions(), "region").values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "elapsed_ms": self.elapsed_ns / 1e6,
+            "executed": sum(self.counts),
+            "instructions": self.instructions(),
+            "lines": self.lines(),
+            "regions": self.regions(),
+        }
+
+    def write_json(self, path: str | Path) -> Path:
+        """Writes the full profile to path as JSON. Returns the path."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    def write_json_to_dir(self, directory: str | Path = DEFAULT_PROFILE_DIR) -> Path:
+        """Writes the profile to a new timestamped file in directory. Returns its path."""
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        return self.write_json(Path(directory) / f"profile_{stamp}.json")
+
+    def report(self, rows: int = HOTSPOT_ROWS) -> str:
+        """Hot-spot tables (per line and per label region), sorted by total time"""
+        elapsed_ms = max(self.elapsed_ns / 1e6, 1e-9)
+        header = f"{'count':>8} {'total ms':>10} {'%':>6} {'backend':>9} {'wait':>9} {'interp':>9}"
+
+        def row(entry: Dict[str, Any]) -> str:
+            return (f"{entry['count']:>8} {entry['total_ms']:>10.2f} {100 * entry['total_ms'] / elapsed_ms:>5.1f}% "
+                    f"{entry['backend_ms']:>9.2f} {entry['wait_ms']:>9.2f} {entry['interpreting_ms']:>9.2f}")
+
+        out = [f"Profile: {sum(self.counts)} instructions in {elapsed_ms:.1f} ms", "Hot lines:", f"{'line':>6} " + header]
+        for entry in sorted(self.lines(), key=lambda e: e["total_ms"], reverse=True)[:rows]:
+            line = entry["line"] if entry["line"] is not None else "-"
+            out.append(f"{line:>6} " + row(entry) + f"  {entry.get('source', '<setup>')}")
+
+        out += ["Hot regions:", f"{'region':<16} " + header]
+        for entry in sorted(self.regions(), key=lambda e: e["total_ms"], reverse=True)[:rows]:
+            out.append(f"{entry['region'][:16]:<16} " + row(entry))
+        return "\n".join(out)
@@ -0,0 +1,214 @@
+from __future__ import annotations
+from typing import Iterator, Dict, Callable
+from enum import Enum
+import math
+import threading
+import time
+
+DEFAULT_SPIN_NS = 2_000_000     # the last 2 ms of every wait are spun instead of slept
+
+
+class LatePolicy(Enum):
+    """
+    What the scheduler does when the script is already behind a deadline. With both, the late
+    wait itself returns at once: its deadline has passed.
+        - SKIP drops the lost time, the timeline restarts from the current time: the following
+          waits last their full time. The default, waits keep a minimum delay between actions
+        - CATCH_UP keeps the original timeline: after a stall (e.g. a slow backend call) the
+          following waits are shortened, down to zero, until all the lost time is made up.
+          A `click` / `wait` loop then clicks in a burst
+    """
+    CATCH_UP = "catch_up"   # keep the original timeline: following waits are shortened until it is caught up
+    SKIP = "skip"           # drop the lost time: the timeline restarts from the current time
+
+
+class DeadlineScheduler:
+    """
+    Absolute-deadline timeline used by waits and timed moves.
+
+    Every wait is computed against the deadline of the previous one on a monotonic
+    perf_counter_ns timeline, instead of from the moment it starts, so that the time spent
+    interpreting the instructions in between (and the oversleep of previous waits) does not
+    accumulate: a loop of `wait 0.05` runs at 20 Hz no matter how long the loop body takes,
+    as long as it takes less than 50 ms.
+
+    Waits use a hybrid strategy: the OS sleep is used until spin_ns before the deadline,
+    the rest is spun for sub-millisecond accuracy.
+    The sleeping part waits on the interrupt event bound with bind_control(): when it is set
+    (pause / stop), the checkpoint function is called, which blocks while paused or raises to
+    abort the wait. Time spent paused is shifted out of the timeline by the executor, so an
+    interrupted wait resumes with its remaining time.
+
+    The lateness of every wait (wake up time - deadline) is recorded to build the jitter report.
+
+    Time is read through now_ns(), so that subclasses can run on a different clock (see VirtualScheduler).
+    """
+
+    def __init__(self, policy: LatePolicy = LatePolicy.SKIP, spin_ns: int = DEFAULT_SPIN_NS) -> None:
+        self.policy = policy
+        self.spin_ns = spin_ns
+        self._interrupt = threading.Event()     # never set unless bound to the executor control state
+        self._checkpoint: Callable[[], None] = lambda: None
+        self._shifted = 0   # total shift of the timeline, lets running waits follow it
+        self.start()
+
+    def now_ns(self) -> int:
+        """Current time on the scheduler timeline"""
+        return time.perf_counter_ns()
+
+    def bind_control(self, interrupt: threading.Event, checkpoint: Callable[[], None]):
+        """Binds the event that interrupts waits, and the function called when it happens"""
+        self._interrupt = interrupt
+        self._checkpoint = checkpoint
+
+    def start(self):
+        """Starts a new timeline from the current time, clearing statistics"""
+        self._deadline = self.now_ns()
+        self.waits = 0
+        self.missed = 0         # deadlines that were already past when the wait started
+        self.blocked_ns = 0     # total time spent inside sleep_until (including pauses)
+        self._late_sum = 0
+        self._late_sq_sum = 0
+        self._late_max = 0
+        self._late_last = 0
+
+    def shift(self, ns: int):
+        """Moves the timeline forward, e.g. by the time spent paused"""
+        self._deadline += ns
+        self._shifted += ns
+
+    def _next_deadline(self, duration_ns: int) -> int:
+        """Returns the deadline duration_ns after the current one, applying the late policy"""
+        start = self._deadline
+        now = self.now_ns()
+        if start + duration_ns < now:
+            self.missed += 1
+            if self.policy == LatePolicy.SKIP:
+                start = now - duration_ns   # deadline is now: this wait returns at once, the next ones are full
+        return start + duration_ns
+
+    def sleep_until(self, deadline_ns: int) -> int:
+        """Sleeps until deadline_ns, spinning for the last spin_ns. If the wait is interrupted,
+        the deadline follows the timeline shifts made in the meantime. Returns the actual deadline."""
+        entered = self.now_ns()
+        remaining = deadline_ns - entered
+        while remaining > self.spin_ns:
+            if self._interrupt.wait((remaining - self.spin_ns) / 1e9):
+                shifted = self._shifted
+                self._checkpoint()
+                deadline_ns += self._shifted - shifted
+            remaining = deadline_ns - self.now_ns()
+
+        while (now := self.now_ns()) < deadline_ns:
+            pass
+        self.blocked_ns += now - entered
+        return deadline_ns
+
+    def _record(self, deadline_ns: int):
+        late = self.now_ns() - deadline_ns
+        self.waits += 1
+        self._late_sum += late
+        self._late_sq_sum += late * late
+        self._late_last = late
+        if late > self._late_max:
+            self._late_max = late
+
+    def wait(self, seconds: float):
+        """Waits until `seconds` after the previous deadline"""
+        deadline = self._next_deadline(int(seconds * 1e9))
+        self._deadline = deadline
+        self._record(self.sleep_until(deadline))
+
+    def frames(self, seconds: float, step_s: float) -> Iterator[float]:
+        """Splits a timed action of `seconds` into frames of about step_s. Sleeps until the deadline
+        of every frame, then yields the progress of the action (in (0, 1]).
+        Frames whose deadline has already passed are yielded immediately."""
+        duration = int(seconds * 1e9)
+        end = self._next_deadline(duration)
+        start = end - duration
+        steps = max(1, int(seconds / step_s))
+
+        for i in range(1, steps + 1):
+            shifted = self._shifted
+            frame_deadline = self.sleep_until(start + duration * i // steps)
+            start += self._shifted - shifted    # the remaining frames follow a pause
+            yield i / steps
+
+        self._deadline = frame_deadline
+        self._record(frame_deadline)
+
+    def stats(self) -> Dict[str, float]:
+        """Timing statistics of the waits performed since start(), in microseconds"""
+        n = max(1, self.waits)
+        mean = self._late_sum / n
+        var = max(0.0, self._late_sq_sum / n - mean * mean)
+        return {
+            "waits": self.waits,
+            "missed_deadlines": self.missed,
+            "jitter_mean_us": mean / 1e3,
+            "jitter_stdev_us": math.sqrt(var) / 1e3,
+            "jitter_max_us": self._late_max / 1e3,
+            "drift_us": self._late_last / 1e3,     # lateness of the last wait, i.e. how far behind the timeline ended
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        return (
+            f"Timing: {s['waits']:.0f} waits, jitter mean {s['jitter_mean_us']:.0f} us "
+            f"(stdev {s['jitter_stdev_us']:.0f} us, max {s['jitter_max_us']:.0f} us), "
+            f"final drift {s['drift_us']:.0f} us, {s['missed_deadlines']:.0f} missed deadlines ({self.policy.value})"
+        )
+
+
+class VirtualClock:
+    """Simulated monotonic clock, only moves when advanced. Shared by the VirtualScheduler
+    and the simulated input backend, to timestamp actions."""
+
+    def __init__(self, start_ns: int = 0) -> None:
+        self.ns = start_ns
+
+    def now_ns(self) -> int:
+        return self.ns
+
+    def advance_to(self, ns: int):
+        if ns > self.ns:
+            self.ns = ns
+
+    def seconds(self) -> float:
+        return self.ns / 1e9
+
+
+class VirtualScheduler(DeadlineScheduler):
+    """
+    DeadlineScheduler running on a VirtualClock: waits and timed moves advance the clock
+    to their deadline instantly instead of sleeping, so a run takes only the time needed to
+    interpret it, while keeping the exact timeline it would have on the real clock.
+    Time spent paused does not exist on the virtual clock, so pauses do not shift it.
+    """
+
+    def __init__(self, clock: VirtualClock | None = None, policy: LatePolicy = LatePolicy.SKIP) -> None:
+        self.clock = clock if clock is not None else VirtualClock()
+        super().__init__(policy, spin_ns=0)
+
+    def now_ns(self) -> int:
+        return self.clock.now_ns()
+
+    def start(self):
+        super().start()
+        self.started_ns = self.clock.now_ns()
+
+    def elapsed_s(self) -> float:
+        """Virtual time elapsed since start()"""
+        return (self.clock.now_ns() - self.started_ns) / 1e9
+
+    def shift(self, ns: int):
+        pass
+
+    def sleep_until(self, deadline_ns: int) -> int:
+        if self._interrupt.is_set():
+            self._checkpoint()  # blocks while paused, raises if stopped
+        self.clock.advance_to(deadline_ns)
+        return deadline_ns
+
+    def report(self) -> str:
+        return f"Virtual time: {self.elapsed_s():.3f} s, {self.waits} waits"
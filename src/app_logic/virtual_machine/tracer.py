@@ -0,0 +1,190 @@
+from __future__ import annotations
+from typing import Tuple, Dict, Callable, List, Any, Sequence, TextIO
+from pathlib import Path
+import datetime
+import json
+import logging
+import os
+import time
+
+from .executor import Executor, ExecutionInstrument, Instruction
+from app_logic.instruction_set import JumpNTimes, Call, Return, SetVar, SetVarExpr, VarMath
+from utils.resource_resolver import user_cache_dir
+
+logger = logging.getLogger("Runtime")
+
+DEFAULT_TRACE_DIR = user_cache_dir() / "traces"
+DEFAULT_FLUSH_EVENTS = 100_000  # events kept in memory before being written out in one go
+
+# trace-event thread ids, one track each in the viewer
+TID_INSTRUCTIONS = 1
+TID_CALLS = 2
+
+# buffered event: (phase, name, tid, timestamp ns, duration ns, args)
+_Event = Tuple[str, str, int, int, int, Dict[str, Any] | None]
+
+
+class ExecutionTracer(ExecutionInstrument):
+    """
+    Records a timeline of a run in the Chrome trace-event format, which can be opened
+    offline in Perfetto (ui.perfetto.dev) or chrome://tracing.
+
+    - every instruction is a span on the "Instructions" track, named after its opcode,
+        with its pc, source line and source text as arguments
+    - call / return frames are nested spans on the "Call stack" track
+    - loop counters (JumpNTimes) and variables written by var are counter tracks
+
+    Events are appended to an in-memory list of tuples while running, and only converted to
+    JSON and written to the output file when flush_every of them have accumulated, and at the end.
+    Like the profiler, the tracer wraps the linked ops, so it costs nothing when not attached.
+    """
+
+    def __init__(self, path: str | Path, line_table: Sequence[int] | None = None,
+                 source_lines: Sequence[str] | None = None, flush_every: int = DEFAULT_FLUSH_EVENTS) -> None:
+        self.path = Path(path)
+        self.line_table = list(line_table) if line_table is not None else []
+        self.source_lines = list(source_lines) if source_lines is not None else []
+        self.flush_every = flush_every
+        self.events: List[_Event] = []
+        self.written = 0    # events already flushed to the file
+        self._file: TextIO | None = None
+        self._origin = 0
+        self._depth = 0     # open call frames
+        self._wrote_any = False
+
+    @classmethod
+    def to_dir(cls, directory: str | Path = DEFAULT_TRACE_DIR, **kwargs) -> ExecutionTracer:
+        """Creates a tracer writing to a new timestamped file in directory"""
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        return cls(Path(directory) / f"trace_{stamp}.json", **kwargs)
+
+    # ------------------------------------------------------------------
+    # instrument hooks
+
+    def begin(self, executor: Executor):
+        self.events = []
+        self.written = 0
+        self._depth = 0
+        self._wrote_any = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "w", encoding="utf-8")
+        except OSError as e:
+            logger.error(f"Could not create trace file, tracing disabled: {e}")
+            self._file = None
+            return
+
+        # the JSON array format can be written incrementally, one chunk of events at a time
+        self._file.write("[\n")
+        self._write_raw([
+            {"ph": "M", "name": "process_name", "pid": os.getpid(), "args": {"name": "Clicker script"}},
+            {"ph": "M", "name": "thread_name", "pid": os.getpid(), "tid": TID_INSTRUCTIONS, "args": {"name": "Instructions"}},
+            {"ph": "M", "name": "thread_name", "pid": os.getpid(), "tid": TID_CALLS, "args": {"name": "Call stack"}},
+        ])
+        self._origin = time.perf_counter_ns()
+
+    def end(self, executor: Executor):
+        if self._file is None:
+            return
+        # close frames left open (stopped, or ended inside a function)
+        now = time.perf_counter_ns()
+        while self._depth > 0:
+            self._depth -= 1
+            self.events.append(("E", "", TID_CALLS, now, 0, None))
+        self._flush()
+        self._file.write("\n]\n")
+        self._file.close()
+        self._file = None
+        logger.info(f"Trace with {self.written} events saved to {self.path.resolve()}")
+
+    def wrap(self, pc: int, inst: Instruction, op: Callable[[Executor], Any]) -> Callable[[Executor], Any]:
+        events = self.events
+        perf_counter_ns = time.perf_counter_ns
+        name = type(inst).__name__
+        args = self._span_args(pc)
+        after = self._after_hook(inst)
+        tracer = self
+
+        def traced(executor: Executor):
+            t0 = perf_counter_ns()
+            try:
+                op(executor)
+            finally:
+                events.append(("X", name, TID_INSTRUCTIONS, t0, perf_counter_ns() - t0, args))
+            if after is not None:
+                after(executor, perf_counter_ns())
+            if len(events) >= tracer.flush_every:
+                tracer._flush()
+
+        return traced
+
+    def _span_args(self, pc: int) -> Dict[str, Any]:
+        args: Dict[str, Any] = {"pc": pc}
+        line = self.line_table[pc] if pc < len(self.line_table) else -1
+        if line >= 0:
+            args["line"] = line + 1
+            if line < len(self.source_lines):
+                args["source"] = self.source_lines[line].strip()
+        return args
+
+    def _after_hook(self, inst: Instruction) -> Callable[[Executor, int], None] | None:
+        """Returns the function emitting the extra events of inst after it executed, if any"""
+        events = self.events
+
+        if isinstance(inst, Call):
+            frame_name = f"call {inst.jmp_name}"
+            def open_frame(executor: Executor, ts: int):
+                self._depth += 1
+                events.append(("B", frame_name, TID_CALLS, ts, 0, None))
+            return open_frame
+
+        if isinstance(inst, Return):
+            def close_frame(executor: Executor, ts: int):
+                if self._depth > 0:     # a return with an empty stack does nothing
+                    self._depth -= 1
+                    events.append(("E", "", TID_CALLS, ts, 0, None))
+            return close_frame
+
+        if isinstance(inst, JumpNTimes):
+            counter_name = f"loop {inst.jmp_name}"
+            def loop_counter(executor: Executor, ts: int):
+                events.append(("C", counter_name, TID_INSTRUCTIONS, ts, 0, {"count": inst._cnt}))
+            return loop_counter
+
+        if isinstance(inst, (SetVar, SetVarExpr, VarMath)):
+            var_name, slot = (inst.out_var_name, inst.out_slot) if isinstance(inst, VarMath) else (inst.var_name, inst.slot)
+            counter_name = f"var {var_name}"
+            def var_counter(executor: Executor, ts: int):
+                events.append(("C", counter_name, TID_INSTRUCTIONS, ts, 0, {"value": executor.shared["regs"][slot]}))
+            return var_counter
+
+        return None
+
+    # ------------------------------------------------------------------
+    # output
+
+    def _flush(self):
+        """Converts the buffered events to trace-event dicts and writes them in one go"""
+        if self._file is None or not self.events:
+            self.events.clear()
+            return
+        pid, origin = os.getpid(), self._origin
+        out = []
+        for ph, name, tid, ts, dur, args in self.events:
+            event: Dict[str, Any] = {"ph": ph, "name": name, "pid": pid, "tid": tid, "ts": (ts - origin) / 1000}
+            if ph == "X":
+                event["dur"] = dur / 1000
+            if args is not None:
+                event["args"] = args
+            out.append(event)
+        self.written += len(out)
+        self.events.clear()     # cleared in place, wrapped ops hold a reference to this list
+        self._write_raw(out)
+
+    def _write_raw(self, events: List[Dict[str, Any]]):
+        assert self._file is not None
+        chunk = ",\n".join(json.dumps(e, separators=(",", ":")) for e in events)
+        if self._wrote_any:
+            self._file.write(",\n")
+        self._file.write(chunk)
+        self._wrote_any = True
@@ -0,0 +1,367 @@
+"""
+Ahead-of-time translation of a linked program into a single generated Python function, run by
+the executor in the COMPILED dispatch mode (see DispatchMode).
+
+The program is split into basic blocks (see compiler/dataflow.py). Every block becomes
+straight-line code, and the blocks are the states of an explicit pc state machine: a block
+ends by setting pc to the next one, found by a binary search over the block starts.
+    - variables and loop counters are locals of the function. Variables are written back to
+      the register file before any instruction reading them through its ValueRefs, and when
+      the function returns. Loop counters are stored back in their jump, like JumpNTimes does
+    - SetVar, VarMath and SetVarExpr become Python expressions on those locals
+    - JumpNTimes, Call and Return set pc, calls use the same pc stack as the instruction set
+    - `end` and the other halting instructions return
+    - any other instruction is called like the threaded loop does, through its bound
+      execute(): moves, clicks and waits go through the same input backend and scheduler.
+      Runs of them become a loop over their bound ops, which keeps long recordings cheap to compile
+
+Pause and stop are checked after every instruction called that way, and between blocks: the
+executor clears its _dispatching flag for both, like for the threaded loop. The executed count
+and the pc of a failing instruction are kept as in the other loops.
+
+Programs using instructions that are not known to leave the pc alone, or subclasses of the
+translated ones, are refused with TranspileError: the executor then falls back to the
+threaded loop.
+"""
+
+from __future__ import annotations
+from typing import List, Dict, Callable, Any, Sequence
+import math
+
+from .executor import Executor, Instruction, HaltExecution
+from app_logic.compiler.dataflow import ControlFlowGraph, _REF_FIELDS
+from app_logic.compiler import expressions
+from app_logic.instruction_set import (
+    ValueRef,
+    VarMathOperations,
+    SPECIAL_VARIABLES,
+    MAX_STACK_SIZE,
+    _pop_pc,
+    SetupAndStart,
+    MouseCenter,
+    MouseMove,
+    MouseMoveRel,
+    MouseGoBack,
+    SetMouseOffset,
+    ClearMouseOffset,
+    MouseLeftClick,
+    MouseRightClick,
+    MouseDoubleClick,
+    MouseMoveClick,
+    Wait,
+    Pause,
+    ConsolePrint,
+    SetSafeMode,
+    PrintPopup,
+    PrintVar,
+    SetVar,
+    SetVarExpr,
+    VarMath,
+    JumpNTimes,
+    Call,
+    Return,
+)
+
+# instructions that never change the pc, called through their execute(). Matched on their exact
+# type: a subclass may do anything
+_CALLED = frozenset((
+    SetupAndStart, MouseCenter, MouseMove, MouseMoveRel, MouseGoBack, SetMouseOffset, ClearMouseOffset,
+    MouseLeftClick, MouseRightClick, MouseDoubleClick, MouseMoveClick, Wait, Pause, ConsolePrint,
+    SetSafeMode, PrintPopup, PrintVar,
+))
+
+_OPERATORS: Dict[VarMathOperations, str] = {
+    VarMathOperations.SUM: "+",
+    VarMathOperations.DIFFERENCE: "-",
+    VarMathOperations.MULTIPLICATION: "*",
+    VarMathOperations.DIVISION: "/",
+}
+
+_LEAF_BLOCKS = 4    # blocks compared one by one at the bottom of the dispatch search
+_MIN_LOOPED_RUN = 4 # consecutive called instructions run by a loop over their ops, instead of one line each
+
+
+class TranspileError(Exception):
+    """Raised when a program can not be translated"""
+
+
+def _undefined(name: str) -> float:
+    raise RuntimeError(f"Undefined variable '{name}'")
+
+def _stack_overflow() -> None:
+    raise RuntimeError("Maximum recursion depth reached.")
+
+
+def _register_refs(inst: Instruction) -> List[ValueRef]:
+    """Variable operands of an instruction read from the register file (special ones excluded)"""
+    refs = (getattr(inst, name) for name in _REF_FIELDS[type(inst)])
+    return [ref for ref in refs if ref.literal is None and ref.var_name not in SPECIAL_VARIABLES]
+
+
+class _Writer:
+    """Source of the generated function, one line at a time"""
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.depth = 1
+
+    def line(self, text: str) -> None:
+        self.lines.append("    " * self.depth + text)
+
+    def source(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+class _Translator:
+    """Translates one program, see transpile()"""
+
+    def __init__(self, program: Sequence[Instruction]) -> None:
+        self.program = program
+        self.n = len(program)
+        self.namespace: Dict[str, Any] = {
+            "__builtins__": {}, "inf": math.inf, "nan": math.nan, "len": len,
+            "undefined": _undefined, "stack_overflow": _stack_overflow,
+            "pop_pc": _pop_pc, "MAX_STACK_SIZE": MAX_STACK_SIZE,
+        }
+        self.namespace.update((name, function.impl) for name, function in expressions.FUNCTIONS.items())
+        self.slots: Dict[int, str] = {}     # register slot -> variable name
+        self.counters: List[int] = []       # pcs of the jumps with a counter
+        self.specials: Dict[str, str] = {}  # special variable -> name of its reader in the namespace
+        self.resets: List[int] = []         # lines of the body making all the variables undefined
+
+    # ------------------------------------------------------------------
+    # operands
+
+    def read_variable(self, name: str, slot: int) -> str:
+        if slot < 0:
+            raise TranspileError(f"variable '{name}' has no register slot")
+        self.slots[slot] = name
+        return f"(v{slot} if v{slot} is not None else undefined({name!r}))"
+
+    def read_special(self, name: str) -> str:
+        reader = self.specials.get(name)
+        if reader is None:
+            reader = self.specials[name] = f"special_{len(self.specials)}"
+            self.namespace[reader] = SPECIAL_VARIABLES[name]
+        return f"{reader}(shared)"
+
+    def read(self, ref: ValueRef) -> str:
+        if ref.literal is not None:
+            return f"({ref.literal!r})"     # repr() of infinities and NaN are names of the namespace
+        if ref.var_name in SPECIAL_VARIABLES:
+            return self.read_special(ref.var_name)
+        return self.read_variable(ref.var_name, ref.slot)
+
+    def store(self, name: str, slot: int) -> str:
+        if slot < 0:
+            raise TranspileError(f"variable '{name}' has no register slot")
+        self.slots[slot] = name
+        return f"v{slot}"
+
+    # ------------------------------------------------------------------
+    # instructions
+
+    def transfer(self, out: _Writer, end: int, target: int | str) -> None:
+        """Leaves the block ending at end for target, a pc or the name of a local holding it"""
+        if isinstance(target, int):
+            if end != target:
+                out.line(f"base += {end - target}")
+        else:
+            out.line(f"base += {end} - {target}")
+        out.line(f"pc = {target}")
+        out.line("continue")
+
+    def jump(self, out: _Writer, pc: int, inst: JumpNTimes) -> None:
+        """JumpNTimes.execute(), with the counter in a local"""
+        target, end = inst.jump_idx, pc + 1
+        literal = inst.num.literal
+        if literal is not None and literal <= 0:
+            self.transfer(out, end, target)
+            return
+
+        self.counters.append(pc)
+        self.namespace[f"jump_{pc}"] = inst
+        if literal is None:
+            out.line(f"num = {self.read(inst.num)}")
+            out.line("if num <= 0:")
+            out.depth += 1
+            self.transfer(out, end, target)
+            out.depth -= 1
+            num = "num"
+        else:
+            num = f"({literal!r})"
+        out.line(f"c{pc} += 1")
+        out.line(f"if c{pc} < {num}:")
+        out.depth += 1
+        self.transfer(out, end, target)
+        out.depth -= 1
+        out.line(f"c{pc} = 0")
+        self.transfer(out, end, end)
+
+    def instruction(self, out: _Writer, pc: int, inst: Instruction) -> bool:
+        """Writes the code of the instruction at pc. Returns False if it ends the block
+        with its own transfer, True if the block falls through to the next one"""
+        cls = type(inst)
+        out.line(f"at = {pc}")
+
+        if isinstance(inst, HaltExecution):     # like the other loops, whatever its execute() does
+            out.line("return")
+            return False
+
+        if cls is SetVar:
+            out.line(f"{self.store(inst.var_name, inst.slot)} = {self.read(inst.val)}")  # type: ignore
+        elif cls is VarMath:
+            op = _OPERATORS.get(inst.opcode)     # type: ignore
+            if op is None:
+                raise TranspileError(f"unknown var math opcode {inst.opcode}")    # type: ignore
+            value = f"{self.read(inst.l_val)} {op} {self.read(inst.r_val)}"  # type: ignore
+            out.line(f"{self.store(inst.out_var_name, inst.out_slot)} = {value}")     # type: ignore
+        elif cls is SetVarExpr:
+            node = expressions.parse(inst.expression)   # type: ignore
+            read = {ref.var_name: self.read(ref) for ref in inst.operands}    # type: ignore
+            out.line(f"{self.store(inst.var_name, inst.slot)} = {expressions.python_source(node, read)}")  # type: ignore
+
+        elif cls is JumpNTimes:
+            self.jump(out, pc, inst)    # type: ignore
+            return False
+        elif cls is Call:
+            out.line(f"stack.append({pc})")
+            out.line("if len(stack) >= MAX_STACK_SIZE: stack_overflow()")
+            self.jump(out, pc, inst)    # type: ignore
+            return False
+        elif cls is Return:
+            out.line("ret = pop_pc(shared)")
+            out.line("if ret:")
+            out.depth += 1
+            out.line("ret += 1")
+            self.transfer(out, pc + 1, "ret")
+            out.depth -= 1
+            return True
+
+        elif cls in _CALLED:
+            self.spill(out, [inst])
+            self.namespace[f"op_{pc}"] = inst.execute
+            out.line(f"op_{pc}(ex)")
+            if cls is SetupAndStart:    # new register file and pc stack, all variables undefined
+                out.line('regs = shared["regs"]')
+                out.line('stack = shared["pc_stack"]')
+                self.resets.append(len(out.lines))
+                out.line("pass")   # filled in by translate(), once all the variables are known
+            out.line(f"if not ex._dispatching and ex._resync(): at = {pc + 1}; return")
+        else:
+            raise TranspileError(f"{cls.__name__} can not be translated")
+        return True
+
+    # ------------------------------------------------------------------
+    # program
+
+    def spill(self, out: _Writer, called: List[Instruction]) -> None:
+        """Writes the variables read by called instructions back to the register file"""
+        slots = {ref.slot: ref.var_name for inst in called for ref in _register_refs(inst)}
+        for slot, name in slots.items():
+            out.line(f"regs[{slot}] = {self.store(name, slot)}")
+
+    def called_run(self, out: _Writer, start: int, end: int) -> None:
+        """Consecutive called instructions: a line each would only make the source longer to compile.
+        None of them writes a variable, the ones they read are written back once before the loop"""
+        ops = self.program[start:end]
+        self.spill(out, list(ops))
+        self.namespace[f"ops_{start}"] = tuple(inst.execute for inst in ops)
+        out.line(f"at = {start}")
+        out.line(f"for op in ops_{start}:")
+        out.depth += 1
+        out.line("op(ex)")
+        out.line("at += 1")
+        out.line("if not ex._dispatching and ex._resync(): return")
+        out.depth -= 1
+
+    def block(self, out: _Writer, start: int, end: int) -> None:
+        falls_through = True
+        pc = start
+        while pc < end:
+            run = pc
+            while run < end and type(self.program[run]) in _CALLED and type(self.program[run]) is not SetupAndStart:
+                run += 1
+            if run - pc >= _MIN_LOOPED_RUN:
+                self.called_run(out, pc, run)
+                pc, falls_through = run, True
+                continue
+            falls_through = self.instruction(out, pc, self.program[pc])
+            pc += 1
+        if falls_through:
+            self.transfer(out, end, end)
+
+    def dispatch(self, out: _Writer, blocks: List[Any]) -> None:
+        """Binary search of the block starting at pc"""
+        if len(blocks) <= _LEAF_BLOCKS:
+            for k, block in enumerate(blocks):
+                out.line(f"{'if' if k == 0 else 'elif'} pc == {block.start}:")
+                out.depth += 1
+                self.block(out, block.start, block.end)
+                out.depth -= 1
+            return
+        mid = len(blocks) // 2
+        out.line(f"if pc < {blocks[mid].start}:")
+        out.depth += 1
+        self.dispatch(out, blocks[:mid])
+        out.depth -= 1
+        out.line("else:")
+        out.depth += 1
+        self.dispatch(out, blocks[mid:])
+        out.depth -= 1
+
+    def translate(self) -> Callable[[Executor, Dict], None]:
+        cfg = ControlFlowGraph(list(self.program))
+        body = _Writer()
+        body.depth = 3
+        self.dispatch(body, cfg.blocks)
+
+        variables = sorted(self.slots)
+        if variables:
+            reset = " = ".join(f"v{slot}" for slot in variables) + " = None"
+            for k in self.resets:
+                body.lines[k] = body.lines[k].replace("pass", reset)
+
+        out = _Writer()
+        lines = out.lines
+        lines.append("def run(ex, shared):")
+        out.line("pc = at = base = 0")
+        out.line('regs = shared.get("regs")')
+        out.line('stack = shared.get("pc_stack")')
+        for slot in variables:
+            out.line(f"v{slot} = None")
+        for pc in self.counters:
+            out.line(f"c{pc} = jump_{pc}._cnt")
+        out.line("try:")
+        out.depth += 1
+        out.line("while True:")
+        out.depth += 1
+        out.line("at = pc")
+        out.line("if not ex._dispatching and ex._resync(): return")
+        out.line(f"if pc >= {self.n}: return")
+        lines.extend(body.lines)
+        out.line("raise RuntimeError(f'No instruction starts a block at {pc}')")
+        out.depth -= 2
+        out.line("finally:")
+        out.depth += 1
+        out.line("ex.pc = at")
+        out.line("ex.executed_count = base + at")
+        for pc in self.counters:
+            out.line(f"jump_{pc}._cnt = c{pc}")
+        if variables:
+            out.line("if regs is not None:")
+            out.depth += 1
+            for slot in variables:
+                out.line(f"regs[{slot}] = v{slot}")
+
+        source = out.source()
+        exec(compile(source, "<transpiled program>", "exec"), self.namespace)
+        self.namespace["run"].source = source     # type: ignore  # to debug the translation
+        return self.namespace["run"]
+
+
+def transpile(program: Sequence[Instruction]) -> Callable[[Executor, Dict], None]:
+    """Translates a linked program into a function run(executor, shared) executing it. The
+    function sets executor.pc and executor.executed_count when it returns or raises.
+    Raises TranspileError if the program can not be translated."""
+    return _Translator(program).translate()
@@ -0,0 +1,99 @@
+"""
+Command line of the app, to run scripts without the editor (e.g. on automation machines):
+
+    clickerapp run script.txt [--safe] [--backend NAME] [--repeat N]
+
+Scripts run in the terminal, with the same compiler and executor as the editor, and the
+exit status tells how the run ended (see app_logic/virtual_machine/headless.py).
+Does not import PyQt6.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import List
+import argparse
+import logging
+import sys
+
+CLI_COMMANDS = ("run",)
+
+_LOGGERS = ("Compiler", "Runtime", "Decompiler", "Editor", "Recorder")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    # only what is needed for the arguments, the rest is imported once they are valid
+    from app_logic.input_backends.backend import BACKEND_FACTORIES, DEFAULT_BACKEND
+    from app_logic.virtual_machine.scheduler import LatePolicy
+    from app_logic.virtual_machine.headless import DEFAULT_PAUSE_KEY, DEFAULT_STOP_KEY
+
+    parser = argparse.ArgumentParser(prog="clickerapp", description="Runs scripts without the editor.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="compile and run a script")
+    run.add_argument("script", type=Path, help="script file")
+    run.add_argument("--safe", action="store_true", help="safe mode: clicks are disabled, only moves run")
+    run.add_argument("--backend", choices=sorted(BACKEND_FACTORIES), default=DEFAULT_BACKEND,
+                     help=f"input backend (default: {DEFAULT_BACKEND}), 'simulated' for a dry run")
+    run.add_argument("--repeat", type=int, default=1, metavar="N",
+                     help="runs the script N times, stops at the first run that does not finish")
+    run.add_argument("--pause-key", default=DEFAULT_PAUSE_KEY, help=f"pause / resume hotkey (default: {DEFAULT_PAUSE_KEY})")
+    run.add_argument("--stop-key", default=DEFAULT_STOP_KEY, help=f"stop hotkey (default: {DEFAULT_STOP_KEY})")
+    run.add_argument("--no-hotkeys", action="store_true", help="does not listen to the keyboard")
+    run.add_argument("--late-policy", choices=[p.value for p in LatePolicy], default=LatePolicy.SKIP.value,
+                     help="what waits do when the script falls behind")
+    dispatch = run.add_mutually_exclusive_group()
+    dispatch.add_argument("--interpreted", action="store_true", help="uses the checked dispatch loop, with debug logs")
+    dispatch.add_argument("--transpile", action="store_true",
+                          help="runs the script as a generated Python function (experimental)")
+    run.add_argument("--no-cache", action="store_true", help="does not use the compiled program cache")
+    run.add_argument("--no-optimize", action="store_true", help="one instruction per source line, to debug a script")
+    verbosity = run.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_true", help="prints debug messages")
+    verbosity.add_argument("-q", "--quiet", action="store_true", help="prints warnings and errors only")
+    return parser
+
+
+def run_command(args: argparse.Namespace) -> int:
+    from app_logic.compiler.program_cache import DEFAULT_CACHE_DIR
+    from app_logic.virtual_machine.scheduler import LatePolicy
+    from app_logic.virtual_machine.headless import run_headless, EXIT_USAGE
+
+    level = logging.DEBUG if args.verbose else logging.WARNING if args.quiet else logging.INFO
+    logging.basicConfig(format="%(name)s [%(levelname)s] %(message)s")
+    for name in _LOGGERS:
+        logging.getLogger(name).setLevel(level)
+
+    if args.repeat < 1:
+        print("clickerapp: --repeat must be at least 1", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        text = args.script.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"clickerapp: can not read {args.script}: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    return run_headless(
+        text,
+        safemode=args.safe,
+        input_backend=args.backend,
+        repeat=args.repeat,
+        pause_key=args.pause_key,
+        stop_key=args.stop_key,
+        hotkeys=not args.no_hotkeys,
+        threaded_dispatch=not args.interpreted,
+        late_policy=LatePolicy(args.late_policy),
+        cache_dir=None if args.no_cache else DEFAULT_CACHE_DIR,
+        optimize=not args.no_optimize,
+        transpile=args.transpile,
+    )
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "run":
+        return run_command(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 """
-Main entrypoint of the application. Launches the editor when ran.
+Main entrypoint of the application. Launches the editor when ran,
+or the command line runner with `clickerapp run ...` (see cli.py).
 
 executable version
 
@@ -8,13 +9,10 @@ executable version
 import sys
 import multiprocessing
 
-from view.gui_3 import QApplication, ScriptEditorApp
-from PyQt6.QtWidgets import QApplication, QMainWindow
-from PyQt6.QtGui import QIcon
-import view.settings    # just to preload settings
-from utils.resource_resolver import resource_path
+from cli import CLI_COMMANDS
 
-def set_global_font_size(app: QApplication, size: int):
+
+def set_global_font_size(app, size: int):
     font = app.font()          # get the current default font
     font.setPointSize(size)    # change the size
     app.setFont(font)          # apply globally
@@ -23,6 +21,16 @@ def set_global_font_size(app: QApplication, size: int):
 def main():
     multiprocessing.freeze_support()
 
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        # no Qt for the command line, it is only imported below
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
+    from view.gui_3 import QApplication, ScriptEditorApp
+    from PyQt6.QtGui import QIcon
+    import view.settings    # just to preload settings
+    from utils.resource_resolver import resource_path
+
     app = QApplication(sys.argv)
     icon = QIcon(str(resource_path("assets/app_icon.ico")))
     app.setWindowIcon(icon)
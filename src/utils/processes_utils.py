@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Callable, List
 import multiprocessing
 from PyQt6 import QtWidgets, QtCore
 from PyQt6.QtGui import QKeyEvent
@@ -7,19 +7,33 @@ import logging
 from logging.handlers import QueueHandler, QueueListener
 from pynput import keyboard
 import os
+import threading
 import time
 
 import utils.logger_config as logger_config
 
+# attribute set on the record sent by mark_logs_flushed()
+LOGS_FLUSHED_ATTR = "logs_flushed"
 
-def start_key_quitter():
+LOG_BATCH_INTERVAL_S = 0.05     # records of a subprocess are sent at most this late
+LOG_BATCH_MAX_RECORDS = 1000    # a batch is sent as soon as it holds this many records
+
+_log_queue: Optional[multiprocessing.Queue] = None     # queue of this subprocess, see setup_subprocess_logging
+_log_handler: Optional["BatchingQueueHandler"] = None
+
+
+def start_key_quitter(on_quit: Callable[[], None] | None = None):
     """
     Start a keyboard listener that quits the program when ESC is pressed.
+    If on_quit is provided, it is called instead of killing the process (it must be thread safe).
     """
     def on_press(key):
         if key == keyboard.Key.esc:
             logger_config.logger_editor.warning("ESC pressed — terminating.")
-            time.sleep(.2)  # Give time for log to flush
+            if on_quit:
+                on_quit()
+                return
+            flush_subprocess_logging()
             os._exit(0)
 
     listener = keyboard.Listener(on_press=on_press)
@@ -27,22 +41,133 @@ def start_key_quitter():
     return listener
 
 
-def setup_subprocess_logging(log_queue: Optional[multiprocessing.Queue] = None):
+class BatchingQueueHandler(QueueHandler):
     """
-    Setup logging via queue if provided.
+    QueueHandler sending lists of records instead of single records: pending records are sent
+    together every LOG_BATCH_INTERVAL_S, so a script printing in a tight loop does not send
+    thousands of queue messages per second. Consecutive identical messages are coalesced into
+    a single record, shown as "message ×count".
+    Records of level ERROR and above are sent right away. Receive with LogBatchListener.
     """
+
+    def __init__(self, queue: multiprocessing.Queue, interval_s: float = LOG_BATCH_INTERVAL_S) -> None:
+        super().__init__(queue)
+        self.interval_s = interval_s
+        self.pending: List[logging.LogRecord] = []
+        self.repeats: List[int] = []    # count of every pending record
+        self._has_pending = threading.Event()
+        threading.Thread(target=self._send_periodically, name="log batcher", daemon=True).start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # called with self.lock held, see logging.Handler.handle
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        if self.pending:
+            last = self.pending[-1]
+            if last.msg == record.msg and last.levelno == record.levelno and last.name == record.name:
+                self.repeats[-1] += 1
+                return
+        self.pending.append(record)
+        self.repeats.append(1)
+
+        if record.levelno >= logging.ERROR or len(self.pending) >= LOG_BATCH_MAX_RECORDS:
+            self.flush()
+        else:
+            self._has_pending.set()
+
+    def flush(self) -> None:
+        """Sends the pending records now"""
+        with self.lock:     # type: ignore
+            if not self.pending:
+                return
+            batch, repeats = self.pending, self.repeats
+            self.pending, self.repeats = [], []
+            for record, count in zip(batch, repeats):
+                if count > 1:
+                    record.msg = f"{record.msg} ×{count}"
+            self.enqueue(batch)     # type: ignore
+
+    def _send_periodically(self) -> None:
+        while True:
+            self._has_pending.wait()
+            time.sleep(self.interval_s)     # gathers what is logged meanwhile
+            self._has_pending.clear()
+            self.flush()
+
+    def close(self) -> None:
+        self.flush()
+        super().close()
+
+
+class LogBatchListener(QueueListener):
+    """QueueListener for subprocesses logging with BatchingQueueHandler, also accepts single records"""
+
+    def handle(self, record) -> None:
+        if isinstance(record, list):
+            for r in record:
+                super().handle(r)
+        else:
+            super().handle(record)
+
+
+_SUBPROCESS_LOGGERS = [
+    logger_config.logger_comp,
+    logger_config.logger_exec,
+    logger_config.logger_decompiler,
+    logger_config.logger_editor,
+    logger_config.logger_recorder
+]
+
+
+def setup_subprocess_logging(log_queue: Optional[multiprocessing.Queue] = None, level: int = logging.DEBUG):
+    """
+    Setup logging via queue if provided. Records below level are not even created, it should
+    follow what the parent shows (see set_subprocess_log_level).
+    """
+    global _log_queue, _log_handler
+    _log_queue = log_queue
     if log_queue:
-        queue_handler = QueueHandler(log_queue)
-        for logger in [
-            logger_config.logger_comp,
-            logger_config.logger_exec,
-            logger_config.logger_decompiler,
-            logger_config.logger_editor,
-            logger_config.logger_recorder
-        ]:
+        _log_handler = BatchingQueueHandler(log_queue)
+        for logger in _SUBPROCESS_LOGGERS:
             logger.handlers.clear()
-            logger.addHandler(queue_handler)
-            logger.setLevel(logging.DEBUG)
+            logger.addHandler(_log_handler)
+    set_subprocess_log_level(level)
+
+
+def set_subprocess_log_level(level: int):
+    for logger in _SUBPROCESS_LOGGERS:
+        logger.setLevel(level)
+
+
+def mark_logs_flushed():
+    """
+    Sends a marker record after all the records logged so far. Records of a process arrive in
+    order, so when the parent receives the marker (see is_logs_flushed_marker) it has all of them.
+    """
+    if _log_queue:
+        if _log_handler:
+            _log_handler.flush()
+        _log_queue.put(logging.makeLogRecord({"name": "process", "msg": "", LOGS_FLUSHED_ATTR: True}))
+
+
+def is_logs_flushed_marker(record: logging.LogRecord) -> bool:
+    return getattr(record, LOGS_FLUSHED_ATTR, False)
+
+
+def flush_subprocess_logging():
+    """
+    Waits for the pending records to be written to the log queue, before the process is killed
+    with os._exit(). The queue can not be used afterwards.
+    """
+    if _log_queue:
+        if _log_handler:
+            _log_handler.flush()
+        _log_queue.close()
+        _log_queue.join_thread()
 
 
 
@@ -116,10 +241,16 @@ class ProcessDialog(QtWidgets.QDialog):
         # Move focus away from buttons initially
         self.setFocus(QtCore.Qt.FocusReason.OtherFocusReason) 
 
-        # Start execution in background thread
+        # Execution starts in background thread once the dialog is shown
         self.worker = execution_thread
         self.worker.finished.connect(self.on_finished)
-        self.worker.start()
+        self.worker_started = False
+
+    def showEvent(self, a0):
+        super().showEvent(a0)
+        if not self.worker_started:
+            self.worker_started = True
+            self.worker.start()
 
     def toggle_pause(self):
         """Toggle between pause and play states."""
@@ -142,7 +273,7 @@ class ProcessDialog(QtWidgets.QDialog):
 
     def terminate_process(self):
         self.logger.warning("Stop button pressed — terminating.")
-        time.sleep(.2)
+        flush_subprocess_logging()
         os._exit(0)
 
     def on_finished(self):
@@ -9,4 +9,18 @@ def resource_path(relative_path: str) -> Path:
     else:
         base_path = Path(__file__).resolve().parent.parent.parent   # points to the root project directory
     
-    return base_path / relative_path
\ No newline at end of file
+    return base_path / relative_path
+
+
+APP_DIR_NAME = "clicker_program"
+
+def user_cache_dir() -> Path:
+    """Return the per-user cache directory of the app (the compiled program cache, profiles and
+    traces live in it), so that runs do not write into the current directory.
+    """
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local")
+        return base / APP_DIR_NAME / "cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / APP_DIR_NAME
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / APP_DIR_NAME
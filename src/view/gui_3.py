@@ -3,7 +3,7 @@ import logging
 import multiprocessing
 from plyer import notification
 
-from PyQt6.QtCore import Qt, QTimer, QObject, pyqtSignal
+from PyQt6.QtCore import Qt, QTimer, QObject, QSocketNotifier, pyqtSignal
 from PyQt6.QtGui import QCursor, QColor, QTextCharFormat, QIcon, QAction, QTextCursor
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
@@ -12,13 +12,13 @@ from PyQt6.QtWidgets import (
     QSplitter, QMenu, QMenuBar, QCheckBox
 )
 
-from logging.handlers import QueueListener
 
-from .gui_utils import make_icon, make_eye_icon, ScriptHighlighter, CodeEditor, show_offset_dialog
+from .gui_utils import make_icon, make_eye_icon, ScriptHighlighter, CodeEditor, LogTerminal, show_offset_dialog
 from .settings_dialog import SettingsDialog
 from .settings import Settings
 from utils.resource_resolver import resource_path
 from utils.version import get_pyproject_version_str
+from utils.processes_utils import is_logs_flushed_marker, LogBatchListener
 
 # ----------------------
 # Logging setup
@@ -40,11 +40,12 @@ class TerminalLogHandler(QObject, logging.Handler):
     """Logging handler that safely forwards log strings to the GUI thread."""
 
     new_log = pyqtSignal(str, int)  # emit both message and level number
+    logs_flushed = pyqtSignal()     # a subprocess sent all its records so far, see mark_logs_flushed
 
-    def __init__(self, terminal_widget: QPlainTextEdit) -> None:
+    def __init__(self, terminal_widget: LogTerminal) -> None:
         QObject.__init__(self)
         logging.Handler.__init__(self)
-        self.terminal: QPlainTextEdit = terminal_widget
+        self.terminal: LogTerminal = terminal_widget
         self.new_log.connect(self._append_to_terminal)
 
     def _append_to_terminal(self, msg: str, level: int) -> None:
@@ -53,28 +54,13 @@ class TerminalLogHandler(QObject, logging.Handler):
         if level == logging.DEBUG and not Settings.print_debug_msg:
             return
 
-        # Choose color based on log level
-        color_map = {
-            logging.DEBUG: "#7E7E7E",
-            logging.INFO: "#FFFFFF",
-            logging.WARNING: "#ffe30b",
-            logging.ERROR: "#cc0000",
-            logging.CRITICAL: "#ff0000",
-        }
-        color = color_map.get(level, "#000000")
-
-        # Set text color
-        cursor = self.terminal.textCursor()
-        cursor.movePosition(QTextCursor.MoveOperation.End)
-
-        fmt = QTextCharFormat()
-        fmt.setForeground(QColor(color))
-        cursor.insertText(msg + "\n", fmt)
-
-        self.terminal.setTextCursor(cursor)
-        self.terminal.ensureCursorVisible()
+        # buffered, the terminal writes lines on its frame timer
+        self.terminal.append_log(msg, level)
 
     def emit(self, record: logging.LogRecord) -> None:
+        if is_logs_flushed_marker(record):
+            self.logs_flushed.emit()
+            return
         try:
             msg = self.format(record)
             self.new_log.emit(msg, record.levelno)
@@ -95,6 +81,15 @@ class ScriptEditorApp(QWidget):
         self.current_file = None
         self.preview_path_on = False
         self.proc: Optional[multiprocessing.Process] = None
+        self.process_type: Optional[Literal["run", "record"]] = None
+        self.run_compiler = None        # created on first run, keeps compiled lines across runs
+        self.compile_thread = None
+        self.program_shm = None         # shared memory of the program shipped to the running process
+        self.runner = None              # starts the runner processes, see RunnerWorker
+        self.runner_notifier = None     # wakes the editor up when the runner sends events
+        self.watched_conn = None        # runner connection watched by runner_notifier
+        self.run_finished = False       # the runner reported the end of the current run
+        self.run_logs_flushed = False   # all the logs of the current run arrived
 
         main_layout = QVBoxLayout()
         main_layout.setContentsMargins(0, 0, 0, 0)
@@ -213,9 +208,7 @@ class ScriptEditorApp(QWidget):
         # ---------------- Terminal ----------------
 
         # Terminal text area
-        self.terminal = QPlainTextEdit()
-        self.terminal.setReadOnly(True)
-        self.terminal.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.terminal = LogTerminal(Settings.terminal_max_lines)
         self.terminal.setStyleSheet("""
             QPlainTextEdit {
                 background-color: black;
@@ -238,12 +231,22 @@ class ScriptEditorApp(QWidget):
         clear_button.setStyleSheet(self.button_style())
         clear_button.clicked.connect(self.terminal.clear)
 
+        # Export button
+        export_button = QPushButton("Export")
+        export_button.setIcon(QIcon.fromTheme("document-save"))
+        export_button.setToolTip("Save the full log to a file, including lines no longer shown")
+        export_button.setFixedHeight(24)
+        export_button.setCursor(Qt.CursorShape.PointingHandCursor)
+        export_button.setStyleSheet(self.button_style())
+        export_button.clicked.connect(self.export_terminal_log)
+
         # Horizontal header layout
         header_layout = QHBoxLayout()
         header_layout.setContentsMargins(4, 0, 4, 0)
         header_layout.setSpacing(4)
         header_layout.addWidget(terminal_label)
-        header_layout.addStretch()  # pushes the button to the right
+        header_layout.addStretch()  # pushes the buttons to the right
+        header_layout.addWidget(export_button)
         header_layout.addWidget(clear_button)
 
         # Combine header and terminal in a vertical layout
@@ -297,14 +300,16 @@ class ScriptEditorApp(QWidget):
         queue_handler.setFormatter(formatter)
 
         self.log_queue = multiprocessing.Queue()
-        self.queue_listener = QueueListener(self.log_queue, queue_handler)
+        self.queue_listener = LogBatchListener(self.log_queue, queue_handler)
+        self.queue_listener.start()
+        queue_handler.logs_flushed.connect(self._on_run_logs_flushed)
 
         # Mouse coordinates
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_mouse_position)
         self.timer.start(50)
 
-        # Timer to monitor child process and re-enable UI when it exits
+        # Timer to monitor the recording process and re-enable UI when it exits
         self.proc_monitor_timer = QTimer(self)
         self.proc_monitor_timer.timeout.connect(self._check_process)
 
@@ -315,6 +320,33 @@ class ScriptEditorApp(QWidget):
     
     def update_settings(self):
         self.update_all_widget_fonts(self, Settings.text_size)
+        self.terminal.setMaximumBlockCount(Settings.terminal_max_lines)
+        QTimer.singleShot(0, self._update_runner)   # not during startup, the editor shows up first
+
+    def _update_runner(self):
+        """Creates the runner, warm or not following the settings. Not during a run."""
+        if self.runner is not None and (self.runner.busy or self.runner.warm == Settings.warm_runner):
+            return
+
+        from app_logic.virtual_machine.executor_process import RunnerWorker
+        if self.runner is not None:
+            self.runner.stop()
+        self.runner = RunnerWorker(self.log_queue, warm=Settings.warm_runner).start()
+        self._watch_runner()
+
+    def _watch_runner(self):
+        """Listens to the connection of the current runner process, it changes every time a process is started"""
+        conn = self.runner.conn if self.runner is not None else None
+        if conn is self.watched_conn:
+            return
+        if self.runner_notifier is not None:
+            self.runner_notifier.setEnabled(False)
+            self.runner_notifier.deleteLater()
+            self.runner_notifier = None
+        self.watched_conn = conn
+        if conn is not None:
+            self.runner_notifier = QSocketNotifier(conn.fileno(), QSocketNotifier.Type.Read, self)
+            self.runner_notifier.activated.connect(self._on_runner_events)
     
     def open_settings_dialog(self):
         """Show the settings dialog"""
@@ -444,6 +476,17 @@ class ScriptEditorApp(QWidget):
         self.current_file=fname
         self.save_file()
 
+    def export_terminal_log(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Log", "log.txt", "Text Files (*.txt);;All Files (*)")
+        if not path:
+            return
+        try:
+            self.terminal.export(path)
+        except OSError as e:
+            logger_editor.error(f"Could not export log: {e}")
+            return
+        logger_editor.info(f"Log exported to {path}")
+
     def save_file(self):
         if not self.current_file:
             fname,_=QFileDialog.getSaveFileName(self,"Save File","","Text Files (*.txt *.py *.md);;All Files (*)")
@@ -465,32 +508,72 @@ class ScriptEditorApp(QWidget):
         return self.safe_mode_checkbox.isChecked()
 
     def run_script(self):
+        """Compiles the script in a background thread, then starts the runner process with the
+        compiled program. Compilation errors are reported without spawning anything."""
         code_src = self.editor.toPlainText()
         if Settings.clear_terminal_on_run:
             self.terminal.clear()
 
-        logger_exec.info("Running script...")
+        logger_exec.info("Compiling script...")
 
-        from app_logic.virtual_machine.executor_process import begin_compile_and_execute_process, RunParams
+        from app_logic.virtual_machine.executor_process import RunCompiler, CompileThread
+
+        if self.run_compiler is None:
+            self.run_compiler = RunCompiler()
+        self.run_btn.setEnabled(False)
+        self.record_btn.setEnabled(False)
+
+        self.compile_thread = CompileThread(
+            self.run_compiler, code_src, self._get_safe_mode_flag(), Settings.movement_history_depth, Settings.cache_compiled,
+            Settings.optimize_scripts
+        )
+        self.compile_thread.compiled.connect(lambda data: self._start_run_process(code_src, data))
+        self.compile_thread.compilation_failed.connect(self._on_compilation_failed)
+        self.compile_thread.start()
+
+    def _on_compilation_failed(self):
+        logger_exec.error("Compilation failed.")
+        self.run_btn.setEnabled(True)
+        self.record_btn.setEnabled(True)
+
+    def _start_run_process(self, code_src: str, program_data: bytes):
+        from app_logic.virtual_machine.executor_process import RunParams, ship_program
+
+        logger_exec.info("Running script...")
+        # empty when the program could not be encoded, the runner then compiles code_src
+        self.program_shm = ship_program(program_data) if program_data else None
 
-        self.queue_listener.start()
         params = RunParams(
             code_src,
             self._get_safe_mode_flag(),
             Qt.Key(Settings.pause_resume_key),
             Settings.notify_when_program_ends,
-            self.log_queue
+            self.log_queue,
+            log_level=logging.DEBUG if Settings.print_debug_msg else logging.INFO,
+            threaded_dispatch=Settings.threaded_dispatch,
+            transpile=Settings.transpile_scripts,
+            input_backend=Settings.input_backend,
+            cursor_resync_ms=Settings.cursor_resync_ms,
+            history_depth=Settings.movement_history_depth,
+            late_policy=Settings.late_policy,
+            profile=Settings.profile_runs,
+            trace=Settings.trace_runs,
+            cache_compiled=Settings.cache_compiled,
+            optimize=Settings.optimize_scripts,
+            program_shm=self.program_shm.name if self.program_shm else None,
+            program_size=len(program_data)
         )
-        # Start the subprocess and disable the Run button until it finishes
-        self.proc = begin_compile_and_execute_process(params)
+        # Start the run and disable the Run button until the runner reports its end
+        self._update_runner()
+        self.run_finished = self.run_logs_flushed = False
+        self.runner.run(params)     # type: ignore
+        self._watch_runner()
         self.subprocess_mark_as_started("run")
     
     def record_script(self):
         logger_editor.info("Starting recording session")
         
         from app_logic.recorder.recorder_process import begin_recording_process
-        # ensure queue listener is running so process logs appear
-        self.queue_listener.start()
 
         # create a small message queue for IPC (child -> parent)
         self.msg_queue = multiprocessing.Queue()
@@ -500,13 +583,61 @@ class ScriptEditorApp(QWidget):
         self.subprocess_mark_as_started("record")
     
     def subprocess_mark_as_started(self, process: Literal["run", "record"]):
-        """Disables the Run and Record buttons and starts the process monitor timer.
+        """Disables the Run and Record buttons, and starts the process monitor timer for a recording
+        (runs report their end, see _on_runner_events).
         """
         self.run_btn.setEnabled(False)
         self.record_btn.setEnabled(False)
-        self.proc_monitor_timer.start(500)
+        if process == "record":
+            self.proc_monitor_timer.start(500)
         self.process_type = process
 
+    def _on_runner_events(self):
+        from app_logic.virtual_machine.executor_process import MSG_STARTED, MSG_FINISHED, OUTCOME_DIED
+
+        if self.runner is None:
+            return
+        events = self.runner.read_events()
+        self._watch_runner()    # a dead worker was started again
+        for event, value in events:
+            if event == MSG_STARTED:
+                logger_editor.debug("Script started.")
+            elif event == MSG_FINISHED and self.process_type == "run":
+                self.run_finished = True
+                if value == OUTCOME_DIED:
+                    self.run_logs_flushed = True    # nothing more to wait for
+        self._end_run_if_complete()
+
+    def _on_run_logs_flushed(self):
+        self.run_logs_flushed = True
+        self._end_run_if_complete()
+
+    def _end_run_if_complete(self):
+        """Ends the run once the runner reported it finished and all of its logs are shown"""
+        if self.process_type == "run" and self.run_finished and self.run_logs_flushed:
+            self.run_finished = self.run_logs_flushed = False
+            logger_editor.debug("Script run has ended; cleaning up.")
+
+            if Settings.notify_when_program_ends:
+                # DONT USE IT FOR NOW, AS WE ALREADY HAVE DIALOG IN THE PROCESS
+                #self.send_system_end_notification()
+                pass
+
+            self._release_program_shm()
+            self._update_runner()   # in case it was changed during the run
+            self.run_btn.setEnabled(True)
+            self.record_btn.setEnabled(True)
+
+    def _release_program_shm(self):
+        if self.program_shm is None:
+            return
+        try:
+            self.program_shm.close()
+            self.program_shm.unlink()
+        except OSError:
+            logger_editor.exception("Failed to release the shared program memory")
+        self.program_shm = None
+
     def update_mouse_position(self):
         pos = QCursor.pos()
         self.coord_label.setText(f"X:{pos.x()}  Y:{pos.y()}")
@@ -523,7 +654,7 @@ class ScriptEditorApp(QWidget):
         ) # type: ignore
 
     def _check_process(self):
-        """Poll the subprocess; when it exits, stop the listener and re-enable UI."""
+        """Poll the recording subprocess; when it exits, re-enable UI."""
         # First, check for any IPC messages from the child (e.g., recorded src)
         try:
             if getattr(self, 'msg_queue', None):
@@ -559,18 +690,7 @@ class ScriptEditorApp(QWidget):
 
         if not alive:
             logger_editor.debug("Child process has exited; cleaning up.")
-            # stop queue listener
-            try:
-                self.queue_listener.stop()
-            except Exception:
-                logger_editor.exception("Failed to stop queue listener")
 
-            if Settings.notify_when_program_ends:
-                if self.process_type == "run":
-                    # DONT USE IT FOR NOW, AS WE ALREADY HAVE DIALOG IN THE PROCESS
-                    #self.send_system_end_notification()
-                    pass
-                
             # reset state
             self.proc = None
 
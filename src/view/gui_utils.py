@@ -1,8 +1,16 @@
 import re
-from PyQt6.QtCore import Qt, QPoint, QRect, QSize
+import logging
+import shutil
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, List, Tuple
+from PyQt6.QtCore import Qt, QPoint, QRect, QSize, QTimer
 from PyQt6.QtGui import (
     QIcon,
     QColor,
+    QTextCursor,
     QPixmap,
     QPainter,
     QFont,
@@ -241,6 +249,101 @@ class CodeEditor(QPlainTextEdit):
         self.setExtraSelections(extraSelections)
 
 
+# ----------------------
+# Log terminal
+# ----------------------
+TERMINAL_FLUSH_MS = 33          # buffered lines are written about 30 times per second
+DEFAULT_TERMINAL_LINES = 10_000
+
+LOG_COLORS = {
+    logging.DEBUG: "#7E7E7E",
+    logging.INFO: "#FFFFFF",
+    logging.WARNING: "#ffe30b",
+    logging.ERROR: "#cc0000",
+    logging.CRITICAL: "#ff0000",
+}
+
+
+class LogTerminal(QPlainTextEdit):
+    """
+    Read only view of log lines, colored by level.
+
+    Lines are buffered and written on a frame timer (TERMINAL_FLUSH_MS) in a single edit block,
+    instead of one insertion and relayout per line, so a script printing in a tight loop does not
+    freeze the editor. The view keeps the last max_lines lines (maximumBlockCount), the full log
+    since the last clear() is kept in a temporary file, see export().
+    """
+
+    def __init__(self, max_lines: int = DEFAULT_TERMINAL_LINES, parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.setMaximumBlockCount(max_lines)
+
+        self.pending: List[Tuple[str, int]] = []    # (line, level) not written yet
+        self.formats: Dict[int, QTextCharFormat] = {}
+        self.full_log = tempfile.TemporaryFile("w+", encoding="utf-8")
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(TERMINAL_FLUSH_MS)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def append_log(self, msg: str, level: int) -> None:
+        self.pending.append((msg, level))
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def _format(self, level: int) -> QTextCharFormat:
+        fmt = self.formats.get(level)
+        if fmt is None:
+            fmt = self.formats[level] = QTextCharFormat()
+            fmt.setForeground(QColor(LOG_COLORS.get(level, "#000000")))
+        return fmt
+
+    def flush(self) -> None:
+        """Writes the buffered lines now"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        self.full_log.write("".join(msg + "\n" for msg, _ in pending))
+
+        max_lines = self.maximumBlockCount()
+        if 0 < max_lines < len(pending):
+            pending = pending[-max_lines:]  # the others would be dropped right away
+
+        scrollbar = self.verticalScrollBar()
+        follow = scrollbar is None or scrollbar.value() == scrollbar.maximum()
+
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        for level, lines in groupby(pending, key=itemgetter(1)):
+            cursor.insertText("".join(msg + "\n" for msg, _ in lines), self._format(level))
+        cursor.endEditBlock()
+
+        if follow and scrollbar is not None:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def clear(self) -> None:
+        self.pending.clear()
+        self.full_log.seek(0)
+        self.full_log.truncate()
+        super().clear()
+
+    def export(self, path: str | Path) -> None:
+        """Writes the full log since the last clear() to a file, lines dropped from the view
+        included. Raises OSError."""
+        self.flush()
+        self.full_log.flush()
+        self.full_log.seek(0)
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                shutil.copyfileobj(self.full_log, f)
+        finally:
+            self.full_log.seek(0, 2)    # back to the end, for the next lines
+
+
 def show_offset_dialog(parent: QWidget):
 
     dialog = QDialog(parent)
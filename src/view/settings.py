@@ -19,10 +19,22 @@ class Settings:
     # --- Default values ---
     clear_terminal_on_run: bool = True
     print_debug_msg: bool = False
+    terminal_max_lines: int = 10_000    # scrollback of the terminal, the full log can still be exported
     text_size: int = 10
     dark_mode: bool = False     # STILL DOES NOT DO ANYHTING
     notify_when_program_ends: bool = False
     pause_resume_key: int | str = DEFAULT_KEY
+    threaded_dispatch: bool = True
+    transpile_scripts: bool = False     # runs scripts as generated Python functions, experimental (see transpiler.py)
+    input_backend: str = "pyautogui"
+    cursor_resync_ms: int = 200     # 0 = always ask the OS for the cursor position
+    movement_history_depth: int = 1000  # positions remembered for goback
+    late_policy: str = "skip"       # what waits do when the script falls behind: "skip" or "catch_up"
+    profile_runs: bool = False      # prints a hot-spot table and writes a JSON profile after every run
+    trace_runs: bool = False        # writes a Chrome trace-event timeline of every run
+    cache_compiled: bool = True     # reuses compiled programs of unchanged scripts (program_cache folder)
+    optimize_scripts: bool = True   # constant folding and merged waits, moves and clicks at compile time, off to debug line by line
+    warm_runner: bool = True        # keeps a runner process ready, instead of starting one per run
 
     # --- File I/O ---
 
@@ -3,7 +3,7 @@ from typing import Callable
 from PyQt6.QtWidgets import (
     QDialog, QListWidget, QListWidgetItem, QStackedWidget,
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QCheckBox,
-    QSlider, QDialogButtonBox, QApplication, QLineEdit, QPushButton
+    QSlider, QDialogButtonBox, QApplication, QLineEdit, QPushButton, QComboBox, QSpinBox
 )
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QKeyEvent, QKeySequence
@@ -13,6 +13,20 @@ from .settings import Settings
 from utils.allowed_keys import ALLOWED_KEYS_QT
 
 
+# input backends selectable from the settings (see app_logic/input_backends)
+INPUT_BACKENDS = {
+    "pyautogui": "PyAutoGUI",
+    "pynput": "pynput",
+    "xtest": "X11 XTest (Linux only)",
+    "simulated": "Simulated (dry run, no real input)",
+}
+
+LATE_POLICIES = {
+    "skip": "Skip (drop lost time)",
+    "catch_up": "Catch up (shorten next waits, may burst)",
+}
+
+
 logger_editor = logging.getLogger("Editor")
 
 
@@ -76,6 +90,94 @@ class SettingsDialog(QDialog):
         self.notify_on_end.setChecked(Settings.notify_when_program_ends)
         layout.addWidget(self.notify_on_end)
 
+        # Dispatch loop checkbox
+        self.threaded_dispatch_checkbox = QCheckBox(" Use fast dispatch loop")
+        self.threaded_dispatch_checkbox.setToolTip("Links the program once before running it, skipping per-instruction checks and debug logs")
+        self.threaded_dispatch_checkbox.setChecked(Settings.threaded_dispatch)
+        layout.addWidget(self.threaded_dispatch_checkbox)
+
+        # Transpiler checkbox
+        self.transpile_checkbox = QCheckBox(" Compile scripts to Python (experimental)")
+        self.transpile_checkbox.setToolTip("Translates the whole script into one Python function before running it, scripts it can not translate use the fast dispatch loop")
+        self.transpile_checkbox.setChecked(Settings.transpile_scripts)
+        layout.addWidget(self.transpile_checkbox)
+
+        # Profiler checkbox
+        self.profile_checkbox = QCheckBox(" Profile script runs")
+        self.profile_checkbox.setToolTip("Prints the slowest lines and labels after every run, and saves the full profile to the profiles folder of the user cache directory")
+        self.profile_checkbox.setChecked(Settings.profile_runs)
+        layout.addWidget(self.profile_checkbox)
+
+        # Tracer checkbox
+        self.trace_checkbox = QCheckBox(" Record run timeline (trace)")
+        self.trace_checkbox.setToolTip("Saves a timeline of every run to the traces folder of the user cache directory, can be opened in Perfetto (ui.perfetto.dev)")
+        self.trace_checkbox.setChecked(Settings.trace_runs)
+        layout.addWidget(self.trace_checkbox)
+
+        # Compiled program cache checkbox
+        self.cache_checkbox = QCheckBox(" Cache compiled scripts")
+        self.cache_checkbox.setToolTip("Stores compiled scripts in the program_cache folder of the user cache directory, running an unchanged script again skips compilation")
+        self.cache_checkbox.setChecked(Settings.cache_compiled)
+        layout.addWidget(self.cache_checkbox)
+
+        # Optimizer checkbox
+        self.optimize_checkbox = QCheckBox(" Optimize compiled scripts")
+        self.optimize_checkbox.setToolTip("Replaces constant variables with their value, removes unused ones, merges consecutive waits and moves and fuses moves with clicks. Turn off to follow a run line by line")
+        self.optimize_checkbox.setChecked(Settings.optimize_scripts)
+        layout.addWidget(self.optimize_checkbox)
+
+        # Warm runner checkbox
+        self.warm_runner_checkbox = QCheckBox(" Keep script runner ready")
+        self.warm_runner_checkbox.setToolTip("Keeps a runner process in the background, so scripts start without waiting for a new process")
+        self.warm_runner_checkbox.setChecked(Settings.warm_runner)
+        layout.addWidget(self.warm_runner_checkbox)
+
+        # Input backend selector
+        backend_layout = QHBoxLayout()
+        backend_label = QLabel("Input backend:")
+        self.backend_combo = QComboBox()
+        for name, label in INPUT_BACKENDS.items():
+            self.backend_combo.addItem(label, name)
+        self.backend_combo.setCurrentIndex(max(0, self.backend_combo.findData(Settings.input_backend)))
+        backend_layout.addWidget(backend_label)
+        backend_layout.addWidget(self.backend_combo, 1)
+        layout.addLayout(backend_layout)
+
+        # Cursor resync interval
+        resync_layout = QHBoxLayout()
+        resync_label = QLabel("Cursor resync interval:")
+        self.resync_spinbox = QSpinBox()
+        self.resync_spinbox.setRange(0, 10000)
+        self.resync_spinbox.setSuffix(" ms")
+        self.resync_spinbox.setSpecialValueText("Always")
+        self.resync_spinbox.setToolTip("How often the tracked cursor position is checked against the real one")
+        self.resync_spinbox.setValue(Settings.cursor_resync_ms)
+        resync_layout.addWidget(resync_label)
+        resync_layout.addWidget(self.resync_spinbox, 1)
+        layout.addLayout(resync_layout)
+
+        # Movement history depth
+        history_layout = QHBoxLayout()
+        history_label = QLabel("Movement history depth:")
+        self.history_spinbox = QSpinBox()
+        self.history_spinbox.setRange(1, 1_000_000)
+        self.history_spinbox.setToolTip("Number of positions remembered by the goback command")
+        self.history_spinbox.setValue(Settings.movement_history_depth)
+        history_layout.addWidget(history_label)
+        history_layout.addWidget(self.history_spinbox, 1)
+        layout.addLayout(history_layout)
+
+        # Late policy selector
+        policy_layout = QHBoxLayout()
+        policy_label = QLabel("When behind schedule:")
+        self.late_policy_combo = QComboBox()
+        for name, label in LATE_POLICIES.items():
+            self.late_policy_combo.addItem(label, name)
+        self.late_policy_combo.setCurrentIndex(max(0, self.late_policy_combo.findData(Settings.late_policy)))
+        policy_layout.addWidget(policy_label)
+        policy_layout.addWidget(self.late_policy_combo, 1)
+        layout.addLayout(policy_layout)
+
         # Pause/Play key selector
         key_layout = QHBoxLayout()
         key_label = QLabel("Pause/Resume key:")
@@ -151,6 +253,18 @@ class SettingsDialog(QDialog):
 
         layout.addWidget(self.print_debug_checkbox)
         layout.addWidget(self.clear_on_run_checkbox)
+
+        # Scrollback size
+        scrollback_layout = QHBoxLayout()
+        scrollback_label = QLabel("Scrollback lines:")
+        self.scrollback_spinbox = QSpinBox()
+        self.scrollback_spinbox.setRange(100, 1_000_000)
+        self.scrollback_spinbox.setSingleStep(1000)
+        self.scrollback_spinbox.setToolTip("Lines kept in the terminal, older ones are dropped (Export still saves the full log)")
+        self.scrollback_spinbox.setValue(Settings.terminal_max_lines)
+        scrollback_layout.addWidget(scrollback_label)
+        scrollback_layout.addWidget(self.scrollback_spinbox, 1)
+        layout.addLayout(scrollback_layout)
         layout.addStretch()
 
         self.category_list.addItem(QListWidgetItem("Terminal"))
@@ -183,10 +297,22 @@ class SettingsDialog(QDialog):
     def apply_settings(self):
         Settings.print_debug_msg = self.print_debug_checkbox.isChecked()
         Settings.clear_terminal_on_run = self.clear_on_run_checkbox.isChecked()
+        Settings.terminal_max_lines = self.scrollback_spinbox.value()
         Settings.dark_mode = self.dark_mode_checkbox.isChecked()
         Settings.text_size = self.text_size_slider.value()
         Settings.notify_when_program_ends = self.notify_on_end.isChecked()
         Settings.pause_resume_key = self.key_id
+        Settings.threaded_dispatch = self.threaded_dispatch_checkbox.isChecked()
+        Settings.transpile_scripts = self.transpile_checkbox.isChecked()
+        Settings.profile_runs = self.profile_checkbox.isChecked()
+        Settings.trace_runs = self.trace_checkbox.isChecked()
+        Settings.cache_compiled = self.cache_checkbox.isChecked()
+        Settings.optimize_scripts = self.optimize_checkbox.isChecked()
+        Settings.warm_runner = self.warm_runner_checkbox.isChecked()
+        Settings.input_backend = self.backend_combo.currentData()
+        Settings.cursor_resync_ms = self.resync_spinbox.value()
+        Settings.movement_history_depth = self.history_spinbox.value()
+        Settings.late_policy = self.late_policy_combo.currentData()
 
         if self.update_fnc:
             self.update_fnc()